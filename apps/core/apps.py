@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+class CoreConfig(AppConfig):
+    name = 'core'
+    verbose_name = 'Core'
+
+    def ready(self):
+        from core import slowqueries
+        for connection in connections.all():
+            slowqueries.install(connection)
+        # Connections of other threads are created later
+        connection_created.connect(slowqueries.connection_created)
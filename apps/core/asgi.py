@@ -0,0 +1,215 @@
+import asyncio
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.exceptions import DisallowedHost
+from django.core.handlers.wsgi import WSGIHandler, WSGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.http import Http404
+from django.utils.translation import ugettext as _
+
+from core import slowqueries
+from core.throttling import throttle
+from django.urls import Resolver404, resolve
+
+
+class AsyncRequest(WSGIRequest):
+
+    """
+    Request of async view built from ASGI scope without body: method, path, headers, GET parameters,
+    session and user. Host is validated by ALLOWED_HOSTS like by Django's request handling.
+    """
+
+    def __init__(self, scope, resolver_match):
+        super().__init__(get_wsgi_environ(scope, b''))
+        self.resolver_match = resolver_match
+        self.session = import_module(settings.SESSION_ENGINE).SessionStore(
+            self.COOKIES.get(settings.SESSION_COOKIE_NAME))
+        self.user = None
+
+
+def get_wsgi_environ(scope, body):
+    """WSGI environ of ASGI HTTP request"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/{0}'.format(scope.get('http_version', '1.1')),
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            environ[name] = value
+            continue
+        key = 'HTTP_' + name
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+class AsgiHandler(object):
+
+    """
+    ASGI application. GET requests of views with get_payload method (see questions.views.ApiView) are served
+    by event loop, their queries are run in thread pool, so slow queries don't hold worker while
+    connection waits for them. Other requests are passed to Django WSGI handler in the same pool,
+    streaming responses are sent chunk by chunk, responses with async_streaming_content (function of
+    blocking calls runner returning async iterator, e.g. server-sent events) are iterated by event loop.
+
+    Async views don't run Django middleware, checks of middleware, which matter for read only API,
+    are repeated: host is validated, session and user are read, requests are throttled (see core.throttling)
+    and slow queries are logged with view name. Other middleware (e.g. sampling profiler) isn't run for them.
+    """
+
+    def __init__(self, threads=None):
+        self.wsgi_handler = WSGIHandler()
+        self.executor = ThreadPoolExecutor(threads or settings.ASGI_THREADS)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError('Unsupported scope type: {0}'.format(scope['type']))
+        match = self.get_async_view(scope)
+        if match is None:
+            return await self.handle_wsgi(scope, receive, send)
+        status, payload, headers = await self.run(self.get_payload, scope, match)
+        body = json.dumps(payload, cls=DjangoJSONEncoder).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode('latin-1')),
+            ] + headers,
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def get_async_view(self, scope):
+        """Resolver match of async view, None if request is handled by WSGI handler"""
+        if scope['method'] != 'GET':
+            return None
+        try:
+            match = resolve(scope['path'])
+        except Resolver404:
+            return None
+        if not hasattr(getattr(match.func, 'view_class', None), 'get_payload'):
+            return None
+        return match
+
+    async def run(self, function, *args):
+        """Run blocking function in thread pool, database connection is closed like after request"""
+        def call():
+            try:
+                return function(*args)
+            finally:
+                close_old_connections()
+        return await asyncio.get_event_loop().run_in_executor(self.executor, call)
+
+    def get_payload(self, scope, match):
+        """Response status, payload and extra headers of async view"""
+        request = AsyncRequest(scope, match)
+        try:
+            request.get_host()
+        except DisallowedHost:
+            return 400, {'detail': 'Invalid host header.'}, []
+        request.user = get_user(request)
+        if not request.user.is_authenticated:
+            return 403, {'detail': 'Authentication credentials were not provided.'}, []
+        retry_after = throttle(request, match.func)
+        if retry_after:
+            return 429, {'detail': _('Too many requests, please try again later.')}, [
+                (b'retry-after', str(retry_after).encode('latin-1'))]
+        view = match.func.view_class()
+        view.request = request
+        view.args = ()
+        view.kwargs = match.kwargs
+        slowqueries.context.view_name = match.view_name
+        try:
+            return 200, view.get_payload(), []
+        except Http404 as error:
+            return 404, {'detail': str(error)}, []
+        finally:
+            slowqueries.context.view_name = None
+
+    async def handle_wsgi(self, scope, receive, send):
+        body = b''
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        status, headers, content = await self.run(self.call_wsgi, get_wsgi_environ(scope, body))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        if isinstance(content, bytes):
+            await send({'type': 'http.response.body', 'body': content})
+            return
+        try:
+            async_stream = getattr(content, 'async_streaming_content', None)
+            if async_stream is not None:
+                # Stream waits by event loop, thread of pool is taken only to read next chunk
+                async for chunk in async_stream(self.run):
+                    await send({'type': 'http.response.body', 'body': content.make_bytes(chunk), 'more_body': True})
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+            chunks = iter(content)
+            while True:
+                chunk = await self.run(next, chunks, None)
+                if chunk is None:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            await self.run(content.close)
+
+    def call_wsgi(self, environ):
+        """Status, headers and content of Django response, streaming response is returned as content"""
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [
+                (name.lower().encode('latin-1'), value.strip().encode('latin-1')) for name, value in headers
+            ]
+
+        result = self.wsgi_handler(environ, start_response)
+        if getattr(result, 'streaming', False):
+            return response['status'], response['headers'], result
+        try:
+            content = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], response['headers'], content
+
@@ -0,0 +1,176 @@
+"""
+Response compression: whitespace of HTML is minified and responses are compressed with brotli or gzip
+
+Brotli is used only if brotli package is installed. Levels are lower than maximal ones: dynamic pages are
+compressed on every request, and the last levels cost several times more CPU for a few percent of size.
+Bytes saved and CPU time spent are counted by view in every process and are logged by core.compression logger.
+"""
+import gzip
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
+
+# Content of these elements is kept as is, whitespace is significant in it or it isn't HTML
+PRESERVED_RE = re.compile(r'<(pre|textarea|script|style)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+# Tags with their attributes, whitespace of attribute values is kept
+TAG_RE = re.compile(r'(<(?:[^>"\']|"[^"]*"|\'[^\']*\')*>)')
+# Only ASCII whitespace is collapsed, non-breaking spaces are content
+WHITESPACE_RE = re.compile(r'[ \t\r\n\f]{2,}|[\t\r\n\f]')
+ACCEPT_ENCODING_RE = re.compile(r'^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?\s*$')
+
+stats = defaultdict(Counter)
+stats_lock = threading.Lock()
+
+
+def get_cpu_time():
+    """CPU time of current thread, process CPU time where it isn't available"""
+    try:
+        return time.clock_gettime(time.CLOCK_THREAD_CPUTIME_ID)
+    except (AttributeError, OSError):
+        return time.process_time()
+
+
+def collapse_whitespace(match):
+    return '\n' if '\n' in match.group() else ' '
+
+
+def minify_fragment(html):
+    parts = TAG_RE.split(html)
+    # Odd parts are tags, even ones are text between them
+    parts[::2] = [WHITESPACE_RE.sub(collapse_whitespace, text) for text in parts[::2]]
+    return ''.join(parts)
+
+
+def minify_html(html):
+    """
+    Collapse runs of whitespace of text between tags into single space or line break,
+    it doesn't change rendering of page except content of preserved elements, which is kept
+    """
+    parts = []
+    position = 0
+    for match in PRESERVED_RE.finditer(html):
+        parts.append(minify_fragment(html[position:match.start()]))
+        parts.append(match.group())
+        position = match.end()
+    parts.append(minify_fragment(html[position:]))
+    return ''.join(parts)
+
+
+def get_accepted_encodings(header):
+    """Encodings accepted by client, encodings with zero quality are excluded"""
+    accepted = set()
+    for value in header.split(','):
+        match = ACCEPT_ENCODING_RE.match(value)
+        if not match:
+            continue
+        try:
+            quality = float(match.group(2)) if match.group(2) is not None else 1.0
+        except ValueError:
+            continue
+        if quality > 0:
+            accepted.add(match.group(1).lower())
+    return accepted
+
+
+def choose_encoding(header):
+    accepted = get_accepted_encodings(header)
+    if brotli is not None and ('br' in accepted or '*' in accepted):
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(content, compresslevel=settings.COMPRESSION_GZIP_LEVEL)
+
+
+def record(view_name, original_size, sent_size, cpu_time, encoding):
+    with stats_lock:
+        counters = stats[view_name]
+        counters['responses'] += 1
+        counters['original_bytes'] += original_size
+        counters['sent_bytes'] += sent_size
+        counters['cpu_time'] += cpu_time
+        if encoding:
+            counters[encoding] += 1
+    logger.debug('Response of %s: %d -> %d bytes', view_name, original_size, sent_size, extra={'data': {
+        'view': view_name,
+        'original_bytes': original_size,
+        'sent_bytes': sent_size,
+        'saved_bytes': original_size - sent_size,
+        'cpu_time': round(cpu_time, 6),
+        'encoding': encoding,
+    }})
+
+
+def get_compression_stats():
+    """Responses count, sizes, saved bytes and CPU time by view name of current process, most saved first"""
+    with stats_lock:
+        rows = [dict(counters, view=view_name) for view_name, counters in stats.items()]
+    for row in rows:
+        row['saved_bytes'] = row['original_bytes'] - row['sent_bytes']
+        row['saved_ratio'] = row['saved_bytes'] / row['original_bytes'] * 100 if row['original_bytes'] else 0
+    return sorted(rows, key=lambda row: row['saved_bytes'], reverse=True)
+
+
+class CompressionMiddleware(object):
+
+    """
+    Minifies HTML responses and compresses responses larger than COMPRESSION_MIN_SIZE bytes by Accept-Encoding,
+    streaming responses (e.g. live events) are passed as is. Middleware should be placed before other
+    middlewares, which change content of response.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.streaming or response.has_header('Content-Encoding') or not response.content:
+            return response
+        started = get_cpu_time()
+        original_size = len(response.content)
+        if settings.COMPRESSION_MINIFY_HTML and response.get('Content-Type', '').startswith('text/html'):
+            try:
+                response.content = minify_html(response.content.decode(response.charset)).encode(response.charset)
+            except UnicodeError:
+                pass
+        encoding = None
+        if len(response.content) >= settings.COMPRESSION_MIN_SIZE:
+            patch_vary_headers(response, ('Accept-Encoding',))
+            encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding:
+            compressed = compress(response.content, encoding)
+            if len(compressed) < len(response.content):
+                response.content = compressed
+                response['Content-Encoding'] = encoding
+                # Encoded representation has only weak ETag, conditional requests still match it
+                # (RFC 7232 section 2.1), minification keeps ETag strong, it always gives the same content
+                etag = response.get('ETag')
+                if etag and etag.startswith('"'):
+                    response['ETag'] = 'W/' + etag
+            else:
+                encoding = None
+        if len(response.content) != original_size:
+            response['Content-Length'] = str(len(response.content))
+        resolver_match = getattr(request, 'resolver_match', None)
+        record(
+            resolver_match.view_name if resolver_match else None, original_size, len(response.content),
+            get_cpu_time() - started, encoding)
+        return response
@@ -0,0 +1,32 @@
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.template import defaultfilters
+from django.urls import reverse
+from django.utils.translation import ugettext, ungettext
+from jinja2 import Environment, Undefined
+
+
+def url(viewname, *args, **kwargs):
+    return reverse(viewname, args=args, kwargs=kwargs)
+
+
+def floatformat(value, arg=-1):
+    # Missing values are formatted as empty string like in Django templates
+    if isinstance(value, Undefined):
+        return ''
+    return defaultfilters.floatformat(value, arg)
+
+
+def environment(**options):
+    """
+    Jinja2 environment of project templates: url() and static() globals, _() translations and
+    floatformat filter, so templates match their Django counterparts
+    """
+    options.setdefault('extensions', []).append('jinja2.ext.i18n')
+    env = Environment(**options)
+    env.install_gettext_callables(ugettext, ungettext, newstyle=True)
+    env.globals.update({
+        'static': staticfiles_storage.url,
+        'url': url,
+    })
+    env.filters['floatformat'] = floatformat
+    return env
@@ -0,0 +1,21 @@
+import json
+import logging
+
+
+class JsonFormatter(logging.Formatter):
+
+    """
+    Formats log record as JSON object, structured data of record is taken from its data attribute
+    """
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'data', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
@@ -0,0 +1,115 @@
+import cProfile
+import json
+import os
+import pstats
+import random
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+
+PROFILE_SUFFIX = '.prof'
+META_SUFFIX = '.json'
+
+
+def get_top_functions(profile, limit=10):
+    """The most expensive functions of profile by own time: list of (function, calls, own time, cumulative time)"""
+    stats = pstats.Stats(profile)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+    return [
+        ('{0}:{1}({2})'.format(*function), calls, round(own_time, 6), round(cumulative_time, 6))
+        for function, (primitive_calls, calls, own_time, cumulative_time, callers) in rows
+    ]
+
+
+def rotate(directory, max_files):
+    """Remove the oldest profiles, so no more than max_files profiles are kept"""
+    names = sorted(name[:-len(META_SUFFIX)] for name in os.listdir(directory) if name.endswith(META_SUFFIX))
+    for name in names[:max(len(names) - max_files, 0)]:
+        for suffix in (PROFILE_SUFFIX, META_SUFFIX):
+            try:
+                os.remove(os.path.join(directory, name + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def save_profile(profile, request, response, duration):
+    """Write profile stats and its metadata with top functions into profiles directory"""
+    directory = settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    now = timezone.now()
+    name = '{0}-{1:06d}'.format(now.strftime('%Y%m%d%H%M%S%f'), random.randrange(10 ** 6))
+    profile.dump_stats(os.path.join(directory, name + PROFILE_SUFFIX))
+    resolver_match = request.resolver_match
+    meta = {
+        'name': name,
+        'created': now.isoformat(),
+        'method': request.method,
+        'path': request.path,
+        'view': resolver_match.view_name if resolver_match else None,
+        'status': response.status_code,
+        'duration': duration,
+        'top_functions': get_top_functions(profile, settings.PROFILING_TOP_FUNCTIONS),
+    }
+    with open(os.path.join(directory, name + META_SUFFIX), 'w') as meta_file:
+        json.dump(meta, meta_file)
+    rotate(directory, settings.PROFILING_MAX_FILES)
+    return meta
+
+
+def load_profiles(limit=None):
+    """Metadata of captured profiles, the slowest requests first"""
+    directory = settings.PROFILING_DIR
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in os.listdir(directory):
+        if not name.endswith(META_SUFFIX):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as meta_file:
+                profiles.append(json.load(meta_file))
+        except (OSError, ValueError):
+            # Profile is removed by rotation or is not written yet
+            continue
+    profiles.sort(key=lambda meta: meta['duration'], reverse=True)
+    return profiles[:limit]
+
+
+def get_profile_path(name):
+    """Path of profile stats file, None if there is no such profile"""
+    if os.path.basename(name) != name:
+        return None
+    path = os.path.join(settings.PROFILING_DIR, name + PROFILE_SUFFIX)
+    return path if os.path.isfile(path) else None
+
+
+class ProfilingMiddleware(object):
+
+    """
+    Profiles sample of requests with cProfile, sample is configured by PROFILING_SAMPLE_RATE setting,
+    requests of staff users with PROFILING_HEADER header are always profiled.
+    Middleware should be placed after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def should_profile(self, request):
+        if settings.PROFILING_SAMPLE_RATE and random.random() < settings.PROFILING_SAMPLE_RATE:
+            return True
+        return settings.PROFILING_HEADER in request.META and request.user.is_staff
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.disable()
+        save_profile(profile, request, response, time.perf_counter() - started)
+        return response
@@ -0,0 +1,161 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.backends.utils import CursorWrapper, CursorDebugWrapper
+
+
+logger = logging.getLogger(__name__)
+
+# EXPLAIN prefixes by database vendor, ANALYZE prefixes execute query once more
+EXPLAIN_SQL = {
+    'postgresql': 'EXPLAIN ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'mysql': 'EXPLAIN ',
+}
+EXPLAIN_ANALYZE_SQL = {
+    'postgresql': 'EXPLAIN ANALYZE ',
+    'mysql': 'EXPLAIN ',
+}
+# Maximum number of remembered fingerprints of explained queries
+EXPLAINED_LIMIT = 10000
+
+LITERALS_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+PLACEHOLDERS_LIST_RE = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+SPACES_RE = re.compile(r'\s+')
+
+context = threading.local()
+explained = set()
+explained_lock = threading.Lock()
+
+
+def get_fingerprint(sql):
+    """Hash of query with literals and lists of parameters replaced by placeholders"""
+    sql = LITERALS_RE.sub('%s', sql)
+    sql = PLACEHOLDERS_LIST_RE.sub('(%s)', sql)
+    sql = SPACES_RE.sub(' ', sql).strip()
+    return hashlib.md5(sql.encode()).hexdigest()
+
+
+def get_app_stack(depth):
+    """The innermost frames of application code, which made query"""
+    apps_dir = str(settings.APPS_DIR)
+    this_file = os.path.splitext(os.path.abspath(__file__))[0]
+    frames = []
+    for frame in traceback.extract_stack():
+        # Apps are imported by relative path from sys.path
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(apps_dir) and os.path.splitext(filename)[0] != this_file:
+            frames.append('{0}:{1} {2}'.format(os.path.relpath(filename, apps_dir), frame.lineno, frame.name))
+    return frames[-depth:]
+
+
+def should_explain(sql, fingerprint):
+    """Every SELECT query is explained once per process"""
+    if not sql.lstrip()[:6].upper() == 'SELECT':
+        return False
+    with explained_lock:
+        if fingerprint in explained:
+            return False
+        if len(explained) >= EXPLAINED_LIMIT:
+            explained.clear()
+        explained.add(fingerprint)
+    return True
+
+
+def explain(connection, sql, params):
+    prefixes = EXPLAIN_ANALYZE_SQL if settings.SLOW_QUERY_EXPLAIN_ANALYZE else EXPLAIN_SQL
+    prefix = prefixes.get(connection.vendor, EXPLAIN_SQL.get(connection.vendor))
+    if prefix is None:
+        return None
+    # Separate unwrapped cursor keeps results of explained query and keeps EXPLAIN out of the log
+    cursor = connection.create_cursor()
+    try:
+        cursor.execute(prefix + sql, params)
+        return [' '.join(str(value) for value in row) for row in cursor.fetchall()]
+    except DatabaseError as error:
+        return ['EXPLAIN failed: {0}'.format(error)]
+    finally:
+        cursor.close()
+
+
+class SlowQueryMixin(object):
+
+    """
+    Cursor wrapper mixin, which logs queries running longer than SLOW_QUERY_THRESHOLD seconds
+    """
+
+    def execute(self, sql, params=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            self.log_slow_query(sql, params, time.perf_counter() - started)
+
+    def executemany(self, sql, param_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, param_list)
+        finally:
+            self.log_slow_query(sql, None, time.perf_counter() - started, many=True)
+
+    def log_slow_query(self, sql, params, duration, many=False):
+        threshold = settings.SLOW_QUERY_THRESHOLD
+        if threshold is None or duration < threshold:
+            return
+        fingerprint = get_fingerprint(sql)
+        data = {
+            'duration': round(duration, 6),
+            'sql': sql,
+            'params': None if many else params,
+            'fingerprint': fingerprint,
+            'database': self.db.alias,
+            'view': getattr(context, 'view_name', None),
+            'stack': get_app_stack(settings.SLOW_QUERY_STACK_DEPTH),
+        }
+        if not many and should_explain(sql, fingerprint):
+            data['explain'] = explain(self.db, sql, params)
+        logger.warning('Slow query (%.3f s) in %s', duration, data['view'], extra={'data': data})
+
+
+class SlowQueryCursorWrapper(SlowQueryMixin, CursorWrapper):
+    pass
+
+
+class SlowQueryDebugCursorWrapper(SlowQueryMixin, CursorDebugWrapper):
+    pass
+
+
+def install(connection):
+    """Wrap cursors of connection with slow queries logging wrappers"""
+    connection.make_cursor = lambda cursor: SlowQueryCursorWrapper(cursor, connection)
+    connection.make_debug_cursor = lambda cursor: SlowQueryDebugCursorWrapper(cursor, connection)
+
+
+def connection_created(sender, connection, **kwargs):
+    install(connection)
+
+
+class SlowQueryMiddleware(object):
+
+    """
+    Keeps name of current view for slow queries log
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            context.view_name = None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        context.view_name = request.resolver_match.view_name if request.resolver_match else None
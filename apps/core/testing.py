@@ -0,0 +1,57 @@
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin(object):
+
+    """
+    TestCase mixin, which checks that number of queries per request doesn't depend on data size
+
+    Scenario is seeded by seed(size) method for every size of query_sizes, seeded data and cache are dropped
+    after each size.
+    """
+
+    query_sizes = (10, 100, 1000)
+
+    def seed(self, size):
+        raise NotImplementedError('seed method should be implemented')
+
+    def count_queries(self, request, size):
+        """Captured queries of request made for scenario of given size"""
+        with transaction.atomic():
+            context = self.seed(size)
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = request(context)
+            self.assertLess(response.status_code, 400, 'Request failed for size {0}'.format(size))
+            transaction.set_rollback(True)
+        cache.clear()
+        return [query['sql'] for query in queries.captured_queries]
+
+    def format_duplicates(self, queries):
+        duplicates = [(sql, count) for sql, count in Counter(queries).most_common() if count > 1]
+        if not duplicates:
+            return ''
+        return '\nDuplicate queries:\n' + '\n'.join('{0}x {1}'.format(count, sql) for sql, count in duplicates)
+
+    def assertQueryBudget(self, budget, request, sizes=None):
+        """
+        Assert that request makes the same number of queries for all sizes and this number is within budget
+
+        request - callable, which gets context returned by seed and returns response
+        """
+        sizes = sizes or self.query_sizes
+        counts = []
+        for size in sizes:
+            queries = self.count_queries(request, size)
+            counts.append(len(queries))
+            if len(queries) > budget:
+                self.fail('{0} queries executed for size {1}, budget is {2}{3}'.format(
+                    len(queries), size, budget, self.format_duplicates(queries)))
+            if len(queries) > counts[0]:
+                self.fail('Queries count grows with data size: {0} for sizes {1}{2}'.format(
+                    counts, sizes[:len(counts)], self.format_duplicates(queries)))
+        return counts
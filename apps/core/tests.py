@@ -0,0 +1,315 @@
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+
+from model_mommy import mommy
+
+from core import compression, slowqueries
+from core.asgi import AsgiHandler
+from core.log import JsonFormatter
+from core.profiling import load_profiles
+from core.throttling import consume, get_client_address
+from questions.cache import load_topic_content
+from questions.models import Question, Topic, TopicQuestionRelation
+from stats.live import publish
+from users.models import TopicResult, User
+
+
+@override_settings(RATE_LIMITS={'topic-detail': (2, 60), 'account_login': (1, 60)})
+class ThrottleTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = mommy.make(User, username='test', password='123')
+        self.topic = mommy.make(Topic, title='Title1')
+        mommy.make(TopicQuestionRelation, topic=self.topic, question=mommy.make(Question, text='question1'))
+
+    def test_consume(self):
+        self.assertEqual(consume('route', 'client', 2, 60, now=120), 0)
+        self.assertEqual(consume('route', 'client', 2, 60, now=150), 0)
+        self.assertEqual(consume('route', 'client', 2, 60, now=150), 30)
+        self.assertEqual(consume('route', 'other', 2, 60, now=150), 0)
+        # Bucket is refilled in the next period
+        self.assertEqual(consume('route', 'client', 2, 60, now=180), 0)
+
+    def test_consume_time(self):
+        started = time.perf_counter()
+        for _ in range(1000):
+            consume('route', 'client', 1000, 60)
+        self.assertLess((time.perf_counter() - started) / 1000, 0.001)
+
+    def test_topic_start(self):
+        self.client.force_login(self.user)
+        url = reverse('topic-detail', kwargs={'pk': self.topic.pk})
+        for _ in range(2):
+            self.assertEqual(self.client.post(url).status_code, 302)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(0 < int(response['Retry-After']) <= 60)
+        # GET requests are not throttled
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_login(self):
+        url = reverse('account_login')
+        data = {'login': 'test', 'password': 'wrong'}
+        self.assertEqual(self.client.post(url, data=data).status_code, 200)
+        self.assertEqual(self.client.post(url, data=data).status_code, 429)
+        self.assertEqual(self.client.post(url, data=data, REMOTE_ADDR='10.0.0.1').status_code, 200)
+
+    def test_proxy_hops(self):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='1.1.1.1, 2.2.2.2')
+        self.assertEqual(get_client_address(request), '10.0.0.1')
+        with self.settings(THROTTLE_PROXY_HOPS=1):
+            self.assertEqual(get_client_address(request), '2.2.2.2')
+            with self.settings(THROTTLE_PROXY_HOPS=3):
+                self.assertEqual(get_client_address(request), '1.1.1.1')
+
+            url = reverse('account_login')
+            data = {'login': 'test', 'password': 'wrong'}
+            self.assertEqual(self.client.post(url, data=data, HTTP_X_FORWARDED_FOR='1.1.1.1').status_code, 200)
+            self.assertEqual(self.client.post(url, data=data, HTTP_X_FORWARDED_FOR='1.1.1.1').status_code, 429)
+            # Addresses forged by client don't change its limit
+            self.assertEqual(
+                self.client.post(url, data=data, HTTP_X_FORWARDED_FOR='3.3.3.3, 1.1.1.1').status_code, 429)
+            self.assertEqual(self.client.post(url, data=data, HTTP_X_FORWARDED_FOR='2.2.2.2').status_code, 200)
+
+
+class ProfilingTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.staff = mommy.make(User, username='admin', is_staff=True, is_superuser=True)
+        self.user = mommy.make(User, username='test')
+        self.url = reverse('topic-list')
+
+    def test_profile_header(self):
+        with self.settings(PROFILING_DIR=self.directory):
+            self.client.force_login(self.user)
+            self.client.get(self.url, HTTP_X_PROFILE='1')
+            self.assertEqual(load_profiles(), [])
+
+            self.client.force_login(self.staff)
+            self.client.get(self.url)
+            self.client.get(self.url, HTTP_X_PROFILE='1')
+            profiles = load_profiles()
+            self.assertEqual(len(profiles), 1)
+            self.assertEqual(profiles[0]['view'], 'topic-list')
+            self.assertTrue(profiles[0]['top_functions'])
+
+            response = self.client.get(reverse('profiles'))
+            self.assertContains(response, self.url)
+            response = self.client.get(reverse('profile-download', args=(profiles[0]['name'],)))
+            self.assertEqual(response.status_code, 200)
+
+    def test_sample_rate_and_rotation(self):
+        self.client.force_login(self.user)
+        with self.settings(PROFILING_DIR=self.directory, PROFILING_SAMPLE_RATE=1.0, PROFILING_MAX_FILES=3):
+            for _ in range(5):
+                self.client.get(self.url)
+            self.assertEqual(len(load_profiles()), 3)
+            self.assertEqual(len(os.listdir(self.directory)), 6)
+
+
+class SlowQueryTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        slowqueries.explained.clear()
+        self.user = mommy.make(User, username='test')
+        self.topic = mommy.make(Topic, title='Title1')
+        self.client.force_login(self.user)
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            slowqueries.get_fingerprint('SELECT * FROM t WHERE id IN (%s, %s) AND name = \'a\''),
+            slowqueries.get_fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = \'b\'')
+        )
+        self.assertNotEqual(
+            slowqueries.get_fingerprint('SELECT * FROM t WHERE id = 1'),
+            slowqueries.get_fingerprint('SELECT * FROM s WHERE id = 1')
+        )
+
+    def test_slow_queries_log(self):
+        with self.settings(SLOW_QUERY_THRESHOLD=0), self.assertLogs('core.slowqueries', 'WARNING') as logs:
+            self.client.get(reverse('topic-list'))
+            self.client.get(reverse('topic-list'))
+        records = [
+            record for record in logs.records if record.data['sql'].startswith('SELECT "questions_topic"."id"')
+        ]
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0].data['view'], 'topic-list')
+        self.assertTrue(records[0].data['explain'])
+        self.assertNotIn('explain', records[1].data)
+
+        with self.settings(SLOW_QUERY_THRESHOLD=0), self.assertLogs('core.slowqueries', 'WARNING') as logs:
+            load_topic_content(self.topic.id)
+        self.assertIn('questions/cache.py', logs.records[0].data['stack'][-1])
+        self.assertIn('core/tests.py', logs.records[0].data['stack'][-2])
+
+        entry = json.loads(JsonFormatter().format(records[0]))
+        self.assertEqual(entry['fingerprint'], records[0].data['fingerprint'])
+
+    def test_threshold(self):
+        with self.assertRaises(AssertionError), self.assertLogs('core.slowqueries', 'WARNING'):
+            self.client.get(reverse('topic-list'))
+
+
+class AsgiTestCase(TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = mommy.make(User, username='test')
+        self.topic = mommy.make(Topic, title='Title1')
+        self.question = mommy.make(Question, text='question1')
+        mommy.make(TopicQuestionRelation, topic=self.topic, question=self.question)
+        self.client.force_login(self.user)
+        self.handler = AsgiHandler(threads=2)
+        self.addCleanup(self.handler.executor.shutdown)
+
+    def request(self, path, method='GET', body=b'', cookies=True, headers=None, with_headers=False, query_string=b''):
+        headers = headers or [(b'host', b'testserver')]
+        if cookies:
+            headers.append((b'cookie', self.client.cookies.output(header='', sep=';').strip().encode()))
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query_string, 'headers': headers}
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.get_event_loop().run_until_complete(self.handler(scope, receive, send))
+        body = b''.join(message.get('body', b'') for message in messages[1:])
+        if with_headers:
+            return messages[0]['status'], body, dict(messages[0]['headers'])
+        return messages[0]['status'], body
+
+    def test_async_views(self):
+        status, body = self.request(reverse('api-topic', kwargs={'topic_id': self.topic.id}))
+        self.assertEqual(status, 200)
+        payload = json.loads(body.decode())
+        self.assertEqual(payload['questions_count'], 1)
+        self.assertEqual(payload['progress'], {'started': False})
+        # The same payload is served by WSGI view
+        response = self.client.get(reverse('api-topic', kwargs={'topic_id': self.topic.id}))
+        self.assertEqual(response.json(), payload)
+
+        status, body = self.request(reverse('api-question', kwargs={'topic_id': self.topic.id, 'number': 1}))
+        self.assertEqual(json.loads(body.decode())['text'], 'question1')
+        status, body = self.request(reverse('api-question', kwargs={'topic_id': self.topic.id, 'number': 2}))
+        self.assertEqual(status, 404)
+
+        mommy.make(TopicResult, topic=self.topic, user=self.user)
+        status, body = self.request(reverse('api-progress', kwargs={'topic_id': self.topic.id}))
+        self.assertEqual(json.loads(body.decode())['next_number'], 1)
+
+        status, body = self.request(reverse('api-topic-list'))
+        self.assertEqual(json.loads(body.decode())['topics'][0]['title'], 'Title1')
+
+        status, body = self.request(reverse('api-topic-list'), cookies=False)
+        self.assertEqual(status, 403)
+
+    def test_async_view_checks(self):
+        url = reverse('api-topic-list')
+        status, body = self.request(url, headers=[(b'host', b'evil.example.com')])
+        self.assertEqual(status, 400)
+
+        with self.settings(RATE_LIMITS={'api-topic-list': (1, 60)}):
+            self.assertEqual(self.request(url)[0], 200)
+            status, body, headers = self.request(url, with_headers=True)
+            self.assertEqual(status, 429)
+            self.assertTrue(0 < int(headers[b'retry-after']) <= 60)
+            # The same limit is applied by WSGI view
+            self.assertEqual(self.client.get(url).status_code, 429)
+
+    def test_wsgi_fallback(self):
+        status, body = self.request(reverse('topic-detail', kwargs={'pk': self.topic.id}))
+        self.assertEqual(status, 200)
+        self.assertIn(b'Title1', body)
+
+    @override_settings(LIVE_STREAM_DURATION=0, LIVE_MAX_STREAMS=0)
+    def test_streaming_response(self):
+        publish(self.topic.id, {'kind': 'started'})
+        self.client.force_login(mommy.make(User, username='admin', is_staff=True, is_superuser=True))
+        status, body = self.request(
+            reverse('admin:stats_topic_live_events', args=(self.topic.id,)), query_string=b'last_event_id=0')
+        self.assertEqual(status, 200)
+        self.assertTrue(body.startswith(b'retry: '))
+        # Async stream isn't limited by number of streams holding threads
+        self.assertIn(b'event: started', body)
+
+
+@override_settings(COMPRESSION_MIN_SIZE=200)
+class CompressionTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        compression.stats.clear()
+        self.staff = mommy.make(User, username='admin', is_staff=True, is_superuser=True)
+        mommy.make(Topic, title='Title1', _quantity=3)
+        self.client.force_login(self.staff)
+        self.url = reverse('topic-list')
+
+    def test_minify_html(self):
+        # Non-breaking spaces are kept
+        html = (
+            '<div class="a  b">\n    <p>Text   with\xa0\xa0 spaces</p>\n\n'
+            '<pre>  kept\n    as is</pre> <TEXTAREA name="t">  line\n\n  </TEXTAREA>\n'
+            '<script>\n  var a = "  x  ";\n</script>  <span title="x > y  z">  y  </span>\n</div>'
+        )
+        self.assertEqual(compression.minify_html(html), (
+            '<div class="a  b">\n<p>Text with\xa0\xa0 spaces</p>\n'
+            '<pre>  kept\n    as is</pre> <TEXTAREA name="t">  line\n\n  </TEXTAREA>\n'
+            '<script>\n  var a = "  x  ";\n</script> <span title="x > y  z"> y </span>\n</div>'
+        ))
+
+    def test_accepted_encodings(self):
+        self.assertEqual(compression.choose_encoding('deflate, gzip;q=0.5'), 'gzip')
+        self.assertIsNone(compression.choose_encoding('gzip;q=0, deflate'))
+        self.assertIsNone(compression.choose_encoding(''))
+
+    def test_gzip_response(self):
+        plain = self.client.get(self.url)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertNotIn(b'    ', plain.content)
+        self.assertEqual(plain['Content-Length'], str(len(plain.content)))
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        # Weak ETag of compressed response matches
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        with self.settings(COMPRESSION_MIN_SIZE=10 ** 6):
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertNotIn('Content-Encoding', response)
+
+        stats = {row['view']: row for row in compression.get_compression_stats()}['topic-list']
+        self.assertEqual((stats['responses'], stats['gzip']), (3, 1))
+        self.assertGreater(stats['saved_bytes'], 0)
+        self.assertContains(self.client.get(reverse('profiles')), 'topic-list')
+
+    @override_settings(LIVE_STREAM_DURATION=0)
+    def test_streaming_response(self):
+        topic = Topic.objects.first()
+        response = self.client.get(
+            reverse('admin:stats_topic_live_events', args=(topic.id,)), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'retry: '))
@@ -0,0 +1,97 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.translation import ugettext as _
+
+
+THROTTLE_KEY = 'throttle:{0}:{1}:{2}'
+THROTTLED_METHODS = ('POST',)
+
+
+def get_client_address(request):
+    """
+    IP address of client, behind THROTTLE_PROXY_HOPS trusted reverse proxies it is taken from X-Forwarded-For,
+    addresses added by client itself before the trusted ones are ignored
+    """
+    hops = settings.THROTTLE_PROXY_HOPS
+    forwarded = [address.strip() for address in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')]
+    forwarded = [address for address in forwarded if address]
+    if hops and forwarded:
+        return forwarded[-min(hops, len(forwarded))]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def get_client_ident(request):
+    """Requests of authenticated user are throttled by user, anonymous requests - by IP address"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return 'user-{0}'.format(user.pk)
+    return 'ip-{0}'.format(get_client_address(request))
+
+
+def consume(route, ident, capacity, period, now=None):
+    """
+    Take token from client's bucket of route,
+    bucket holds capacity tokens and is refilled every period seconds. Windows are fixed,
+    so up to twice capacity of requests can pass around the end of window.
+
+    returns 0 when token is taken, otherwise seconds till bucket refill
+    """
+    if now is None:
+        now = time.time()
+    window = int(now // period)
+    key = THROTTLE_KEY.format(route, ident, window)
+    # add and incr are atomic in memcached and redis, so concurrent requests can't take the same token
+    cache.add(key, 0, period + 1)
+    try:
+        used = cache.incr(key)
+    except ValueError:
+        # Bucket has expired between add and incr
+        cache.set(key, 1, period + 1)
+        used = 1
+    if used <= capacity:
+        return 0
+    return max(int((window + 1) * period - now), 1)
+
+
+def throttle(request, view_func):
+    """
+    Take token of request by RATE_LIMITS of its url name, POST requests and all requests of JSON API views
+    (views with get_payload method, they are served by ASGI application too) are limited
+
+    returns 0 when request is allowed, otherwise seconds till bucket refill
+    """
+    if request.resolver_match is None:
+        return 0
+    if request.method not in THROTTLED_METHODS and not hasattr(getattr(view_func, 'view_class', None), 'get_payload'):
+        return 0
+    route = request.resolver_match.url_name
+    limit = settings.RATE_LIMITS.get(route)
+    if limit is None:
+        return 0
+    capacity, period = limit
+    return consume(route, get_client_ident(request), capacity, period)
+
+
+class ThrottleMiddleware(object):
+
+    """
+    Limits requests rate per client and url name (see throttle), limits are configured by RATE_LIMITS setting:
+    dict of url name -> (capacity, period in seconds)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        retry_after = throttle(request, view_func)
+        if retry_after:
+            response = HttpResponse(_('Too many requests, please try again later.'), status=429)
+            response['Retry-After'] = str(retry_after)
+            return response
+        return None
@@ -0,0 +1,9 @@
+from django.conf.urls import url
+
+from core.views import profiles_view, profile_download
+
+
+urlpatterns = [
+    url(r'^profiles/$', profiles_view, name='profiles'),
+    url(r'^profiles/(?P<name>[\w-]+)/$', profile_download, name='profile-download'),
+]
@@ -0,0 +1,33 @@
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404
+from django.template.response import TemplateResponse
+from django.utils.translation import ugettext_lazy as _
+
+from core.compression import get_compression_stats
+from core.profiling import get_profile_path, load_profiles
+
+
+PROFILES_LIMIT = 50
+
+
+@staff_member_required
+def profiles_view(request):
+    """The slowest captured requests with their top functions and compression of responses by view"""
+    context = dict(
+        admin.site.each_context(request),
+        title=_('Slowest profiled requests'),
+        profiles=load_profiles(PROFILES_LIMIT),
+        compression=get_compression_stats(),
+    )
+    return TemplateResponse(request, 'admin/core/profiles.html', context)
+
+
+@staff_member_required
+def profile_download(request, name):
+    path = get_profile_path(name)
+    if path is None:
+        raise Http404(_('Profile not found'))
+    response = FileResponse(open(path, 'rb'), content_type='application/octet-stream')
+    response['Content-Disposition'] = 'attachment; filename="{0}.prof"'.format(name)
+    return response
@@ -0,0 +1,28 @@
+from django.contrib import admin
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _, ungettext
+
+from outbox.models import OutboxMessage
+
+
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'from_email', 'recipients', 'status', 'attempts', 'created', 'next_attempt', 'sent')
+    list_filter = ('status',)
+    search_fields = ('subject', 'recipients')
+    fields = ('subject', 'from_email', 'recipients', 'status', 'attempts', 'created', 'next_attempt', 'sent',
+              'last_error')
+    readonly_fields = fields
+    actions = ['retry']
+
+    def has_add_permission(self, request):
+        return False
+
+    def retry(self, request, queryset):
+        updated = queryset.filter(status__in=(OutboxMessage.STATUS_PENDING, OutboxMessage.STATUS_FAILED)).update(
+            status=OutboxMessage.STATUS_PENDING, attempts=0, next_attempt=timezone.now())
+        self.message_user(request, ungettext(
+            '%d message will be sent again.', '%d messages will be sent again.', updated) % updated)
+    retry.short_description = _('Send selected messages again')
+
+
+admin.site.register(OutboxMessage, OutboxMessageAdmin)
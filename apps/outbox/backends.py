@@ -0,0 +1,24 @@
+from django.core.mail.backends.base import BaseEmailBackend
+
+from outbox.models import OutboxMessage
+
+
+class OutboxEmailBackend(BaseEmailBackend):
+
+    """
+    Email backend, which stores messages into outbox table and returns at once,
+    messages are delivered by send_outbox command
+    """
+
+    def send_messages(self, email_messages):
+        messages = [
+            OutboxMessage(
+                from_email=email_message.from_email,
+                recipients='\n'.join(email_message.recipients()),
+                subject=email_message.subject[:255],
+                message=email_message.message().as_bytes(),
+            )
+            for email_message in email_messages if email_message.recipients()
+        ]
+        OutboxMessage.objects.bulk_create(messages)
+        return len(messages)
@@ -0,0 +1,33 @@
+import smtplib
+import time
+
+from django.core.management.base import BaseCommand
+
+from outbox.sender import send_outbox, BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Send due messages of email outbox, failed messages are retried with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Messages count claimed at once')
+        parser.add_argument(
+            '--loop', type=float, metavar='SECONDS',
+            help='Keep running and check outbox with this interval')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                sent, failed = send_outbox(batch_size=options['batch_size'])
+            except (smtplib.SMTPException, OSError) as error:
+                if not options['loop']:
+                    raise
+                # Worker keeps running while mail server is unavailable
+                self.stderr.write('Mail server error: {0}'.format(error))
+                time.sleep(options['loop'])
+                continue
+            if sent or failed or not options['loop']:
+                self.stdout.write('{0} messages were sent, {1} failed'.format(sent, failed))
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
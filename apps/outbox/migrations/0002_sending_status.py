@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.4 on 2026-10-19 03:06
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('outbox', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboxmessage',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'Pending'), (4, 'Sending'), (2, 'Sent'), (3, 'Failed')], default=1),
+        ),
+    ]
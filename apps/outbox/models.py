@@ -0,0 +1,49 @@
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+
+class OutboxMessage(models.Model):
+
+    """
+    Email message waiting for delivery by send_outbox command
+
+    recipients - envelope recipients, one per line
+    message - serialized MIME message
+    attempts - number of failed delivery attempts
+    next_attempt - message isn't sent before this time, it is moved forward with backoff after failures,
+    for message being sent it is the end of sender's lease, message is claimed again after it
+    """
+
+    STATUS_PENDING = 1
+    STATUS_SENT = 2
+    STATUS_FAILED = 3
+    STATUS_SENDING = 4
+    STATUSES = (
+        (STATUS_PENDING, _('Pending')),
+        (STATUS_SENDING, _('Sending')),
+        (STATUS_SENT, _('Sent')),
+        (STATUS_FAILED, _('Failed')),
+    )
+
+    created = models.DateTimeField(default=timezone.now)
+    from_email = models.CharField(max_length=254)
+    recipients = models.TextField()
+    subject = models.CharField(max_length=255, blank=True)
+    message = models.BinaryField()
+    status = models.PositiveSmallIntegerField(choices=STATUSES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    sent = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        index_together = ('status', 'next_attempt')
+        verbose_name = _('Outbox Message')
+        verbose_name_plural = _('Outbox Messages')
+
+    def __str__(self):
+        return '{0} -> {1}'.format(self.subject, ', '.join(self.get_recipients()))
+
+    def get_recipients(self):
+        return self.recipients.splitlines()
@@ -0,0 +1,134 @@
+import logging
+import smtplib
+from datetime import timedelta
+from email.message import Message
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.message import EmailMessage
+from django.db import transaction
+from django.utils import timezone
+
+from outbox.models import OutboxMessage
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+
+
+class RawMessage(Message):
+
+    """
+    MIME message, which is written out exactly as it was serialized
+    """
+
+    def __init__(self, raw_message):
+        super().__init__()
+        self.raw_message = raw_message
+
+    def as_bytes(self, unixfrom=False, linesep='\n'):
+        return self.raw_message.replace(b'\n', linesep.encode('ascii'))
+
+
+class StoredEmailMessage(EmailMessage):
+
+    """
+    Email message of outbox, which is sent as it was serialized by outbox backend
+    """
+
+    def __init__(self, outbox_message):
+        super().__init__(from_email=outbox_message.from_email, to=outbox_message.get_recipients())
+        self.raw_message = bytes(outbox_message.message)
+
+    def message(self):
+        return RawMessage(self.raw_message)
+
+
+def get_backoff(attempts):
+    """Delay before the next delivery attempt, it is doubled after every failure"""
+    return timedelta(seconds=min(settings.OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), settings.OUTBOX_MAX_RETRY_DELAY))
+
+
+def claim_batch(batch_size=BATCH_SIZE):
+    """
+    Lease next batch of due messages to this sender with short transaction, messages of lease expired
+    by crashed sender are claimed again
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        message_ids = list(OutboxMessage.objects.select_for_update(skip_locked=True).filter(
+            status__in=(OutboxMessage.STATUS_PENDING, OutboxMessage.STATUS_SENDING),
+            next_attempt__lte=now
+        ).order_by('next_attempt', 'id').values_list('id', flat=True)[:batch_size])
+        OutboxMessage.objects.filter(id__in=message_ids).update(
+            status=OutboxMessage.STATUS_SENDING, next_attempt=now + timedelta(seconds=settings.OUTBOX_LEASE))
+    messages = OutboxMessage.objects.in_bulk(message_ids)
+    return [messages[message_id] for message_id in message_ids]
+
+
+def release(messages):
+    """Return claimed messages, which weren't sent, to outbox without counting attempt"""
+    OutboxMessage.objects.filter(
+        id__in=[message.id for message in messages], status=OutboxMessage.STATUS_SENDING
+    ).update(status=OutboxMessage.STATUS_PENDING, next_attempt=timezone.now())
+
+
+def send_batch(connection, batch_size=BATCH_SIZE):
+    """
+    Claim next batch of due messages and send them over opened connection outside of transaction,
+    status of every message is saved right after its delivery attempt
+
+    returns pair of sent and failed messages counts
+    """
+    sent = failed = 0
+    messages = claim_batch(batch_size)
+    for position, message in enumerate(messages):
+        try:
+            connection.send_messages([StoredEmailMessage(message)])
+        except (smtplib.SMTPException, OSError) as error:
+            logger.warning('Message %s was not sent: %s', message.id, error)
+            failed += 1
+            message.attempts += 1
+            message.last_error = str(error)
+            if message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                message.status = OutboxMessage.STATUS_FAILED
+            else:
+                message.status = OutboxMessage.STATUS_PENDING
+                message.next_attempt = timezone.now() + get_backoff(message.attempts)
+            message.save(update_fields=['status', 'attempts', 'next_attempt', 'last_error'])
+            if isinstance(error, (smtplib.SMTPServerDisconnected, OSError)):
+                # Broken connection is reopened for the next messages, they are returned to outbox
+                # if server isn't available
+                try:
+                    connection.close()
+                    connection.open()
+                except (smtplib.SMTPException, OSError):
+                    release(messages[position + 1:])
+                    raise
+        else:
+            sent += 1
+            message.status = OutboxMessage.STATUS_SENT
+            message.sent = timezone.now()
+            message.save(update_fields=['status', 'sent'])
+    return sent, failed
+
+
+def send_outbox(batch_size=BATCH_SIZE):
+    """
+    Send all due messages over one connection, batch by batch
+
+    returns pair of sent and failed messages counts
+    """
+    total_sent = total_failed = 0
+    connection = get_connection(settings.OUTBOX_EMAIL_BACKEND)
+    connection.open()
+    try:
+        while True:
+            sent, failed = send_batch(connection, batch_size)
+            total_sent += sent
+            total_failed += failed
+            if sent + failed < batch_size:
+                return total_sent, total_failed
+    finally:
+        connection.close()
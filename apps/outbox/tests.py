@@ -0,0 +1,156 @@
+import asyncore
+import smtpd
+import smtplib
+import threading
+from datetime import timedelta
+from io import StringIO
+
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from outbox.models import OutboxMessage
+from outbox.sender import claim_batch, send_batch, send_outbox
+
+
+class SMTPServer(smtpd.SMTPServer):
+
+    """Local SMTP stand-in, rejects first `failures` messages"""
+
+    def __init__(self, failures=0):
+        super().__init__(('127.0.0.1', 0), None, decode_data=False)
+        self.port = self.socket.getsockname()[1]
+        self.failures = failures
+        self.messages = []
+        self.connections = 0
+
+    def handle_accepted(self, conn, addr):
+        self.connections += 1
+        super().handle_accepted(conn, addr)
+
+    def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            return '451 Try again later'
+        self.messages.append((mailfrom, rcpttos, data))
+
+
+class OutboxTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server = SMTPServer()
+        self.thread = threading.Thread(target=asyncore.loop, kwargs={'timeout': 0.05})
+        self.thread.start()
+        self.settings = override_settings(
+            EMAIL_BACKEND='outbox.backends.OutboxEmailBackend',
+            OUTBOX_EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=self.server.port,
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='',
+        )
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.server.close()
+        self.thread.join()
+        super().tearDown()
+
+    def send_mails(self, count):
+        for number in range(count):
+            mail.send_mail('Subject {0}'.format(number), 'Body', 'from@test.com', ['to{0}@test.com'.format(number)])
+
+    def test_backend(self):
+        self.send_mails(2)
+        self.assertEqual(OutboxMessage.objects.filter(status=OutboxMessage.STATUS_PENDING).count(), 2)
+        self.assertEqual(self.server.messages, [])
+        message = OutboxMessage.objects.order_by('id').first()
+        self.assertEqual(message.subject, 'Subject 0')
+        self.assertEqual(message.get_recipients(), ['to0@test.com'])
+
+    def test_send(self):
+        self.send_mails(5)
+        self.assertEqual(send_outbox(batch_size=2), (5, 0))
+        self.assertEqual(len(self.server.messages), 5)
+        self.assertEqual(self.server.connections, 1)
+        mailfrom, rcpttos, data = self.server.messages[0]
+        self.assertEqual(mailfrom, 'from@test.com')
+        self.assertEqual(rcpttos, ['to0@test.com'])
+        self.assertIn(b'Subject: Subject 0', data)
+        self.assertFalse(OutboxMessage.objects.exclude(status=OutboxMessage.STATUS_SENT).exists())
+        self.assertEqual(send_outbox(), (0, 0))
+        self.assertEqual(len(self.server.messages), 5)
+
+    def test_retry(self):
+        self.server.failures = 1
+        self.send_mails(2)
+        self.assertEqual(send_outbox(), (1, 1))
+        message = OutboxMessage.objects.get(status=OutboxMessage.STATUS_PENDING)
+        self.assertEqual(message.attempts, 1)
+        self.assertIn('Try again later', message.last_error)
+        self.assertGreater(message.next_attempt, timezone.now())
+        # Message isn't retried before backoff passes
+        self.assertEqual(send_outbox(), (0, 0))
+        OutboxMessage.objects.filter(id=message.id).update(next_attempt=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(send_outbox(), (1, 0))
+        self.assertEqual(len(self.server.messages), 2)
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=2)
+    def test_failed(self):
+        self.server.failures = 2
+        self.send_mails(1)
+        send_outbox()
+        OutboxMessage.objects.update(next_attempt=timezone.now())
+        send_outbox()
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.status, OutboxMessage.STATUS_FAILED)
+        self.assertEqual(message.attempts, 2)
+        self.assertEqual(send_outbox(), (0, 0))
+
+    def test_lease(self):
+        self.send_mails(2)
+        messages = claim_batch()
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(set(OutboxMessage.objects.values_list('status', flat=True)), {OutboxMessage.STATUS_SENDING})
+        # Claimed messages aren't sent by other senders
+        self.assertEqual(send_outbox(), (0, 0))
+        # Messages of crashed sender are sent after its lease expires
+        OutboxMessage.objects.update(next_attempt=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(send_outbox(), (2, 0))
+        self.assertEqual(len(self.server.messages), 2)
+
+    def test_server_gone(self):
+        self.send_mails(3)
+
+        class BrokenConnection(object):
+
+            def send_messages(self, messages):
+                raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+
+            def close(self):
+                pass
+
+            def open(self):
+                raise ConnectionRefusedError('Connection refused')
+
+        with self.assertRaises(ConnectionRefusedError):
+            send_batch(BrokenConnection())
+        messages = list(OutboxMessage.objects.order_by('id'))
+        # Failure of the first message is kept, messages after it are returned to outbox without attempts
+        self.assertEqual((messages[0].status, messages[0].attempts), (OutboxMessage.STATUS_PENDING, 1))
+        self.assertGreater(messages[0].next_attempt, timezone.now())
+        for message in messages[1:]:
+            self.assertEqual((message.status, message.attempts), (OutboxMessage.STATUS_PENDING, 0))
+            self.assertLessEqual(message.next_attempt, timezone.now())
+        self.assertEqual(send_outbox(), (2, 0))
+
+    def test_command(self):
+        self.send_mails(3)
+        out = StringIO()
+        call_command('send_outbox', batch_size=2, stdout=out)
+        self.assertEqual(len(self.server.messages), 3)
+        self.assertIn('3 messages were sent', out.getvalue())
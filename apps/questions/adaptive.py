@@ -0,0 +1,142 @@
+"""
+Adaptive topics: the next question is chosen by item response theory (1PL or 2PL logistic model)
+
+Probability of correct answer to question with difficulty b and discrimination a by user with ability theta
+is 1 / (1 + exp(-a * (theta - b))), 1PL model has a = 1 for all questions. Parameters are fitted offline
+from users' answers (see fit_parameters), at request time parameters of topic's questions are kept in NumPy
+arrays of in-process cache, so ability estimate and choice of the most informative question are
+a few vector operations over all questions of topic.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from questions.cache import get_topic_content, get_topic_questions_key, get_topic_version, local_cache
+
+
+# Abilities grid of expected a posteriori estimate with standard normal prior
+ABILITY_GRID = np.linspace(-4, 4, 81)
+ABILITY_PRIOR = np.exp(-ABILITY_GRID ** 2 / 2)
+# Standard deviations of priors of abilities, difficulties and discriminations (around 1) in fitting,
+# they keep estimates of users with all answers correct or incorrect and of short attempts finite
+ABILITY_PRIOR_SD = 1.0
+DIFFICULTY_PRIOR_SD = 2.0
+DISCRIMINATION_PRIOR_SD = 0.5
+DISCRIMINATION_BOUNDS = (0.2, 4.0)
+PARAMETER_BOUNDS = (-4.0, 4.0)
+
+MODEL_1PL = '1pl'
+MODEL_2PL = '2pl'
+
+# Parameters of topic's active questions in order of topic
+ItemBank = namedtuple('ItemBank', ('question_ids', 'difficulty', 'discrimination'))
+
+
+def get_probabilities(ability, difficulty, discrimination):
+    """Probabilities of correct answers, arguments are broadcasted"""
+    return 1 / (1 + np.exp(-discrimination * (ability - difficulty)))
+
+
+def get_item_bank(topic_id):
+    """Parameters of topic's questions from in-process cache, arrays are rebuilt when topic content is changed"""
+    key = '{0}:items'.format(get_topic_questions_key(topic_id, get_topic_version(topic_id)))
+    bank = local_cache.get(key)
+    if bank is None:
+        questions = get_topic_content(topic_id).questions
+        bank = ItemBank(
+            np.array([question.id for question in questions], dtype=np.int64),
+            np.array([question.difficulty for question in questions], dtype=np.float64),
+            np.array([question.discrimination for question in questions], dtype=np.float64),
+        )
+        for array in bank:
+            array.flags.writeable = False
+        local_cache.set(key, bank)
+    return bank
+
+
+def estimate_ability(bank, responses):
+    """
+    Expected a posteriori ability and its standard error by responses (dict of question id: correct)
+    """
+    answered = np.isin(bank.question_ids, list(responses))
+    correct = np.array([responses[question_id] for question_id in bank.question_ids[answered]], dtype=bool)
+    probabilities = np.clip(get_probabilities(
+        ABILITY_GRID[np.newaxis, :], bank.difficulty[answered, np.newaxis], bank.discrimination[answered, np.newaxis]
+    ), 1e-12, 1 - 1e-12)
+    log_likelihood = np.where(correct[:, np.newaxis], np.log(probabilities), np.log1p(-probabilities)).sum(axis=0)
+    posterior = np.exp(log_likelihood - log_likelihood.max()) * ABILITY_PRIOR
+    posterior /= posterior.sum()
+    ability = float((posterior * ABILITY_GRID).sum())
+    error = float(np.sqrt((posterior * (ABILITY_GRID - ability) ** 2).sum()))
+    return ability, error
+
+
+def choose_question(bank, responses, ability):
+    """Position of unanswered question with maximal information at ability, None if all are answered"""
+    probabilities = get_probabilities(ability, bank.difficulty, bank.discrimination)
+    information = bank.discrimination ** 2 * probabilities * (1 - probabilities)
+    information[np.isin(bank.question_ids, list(responses))] = -1
+    position = int(information.argmax())
+    return position if information[position] >= 0 else None
+
+
+def get_attempt_length(content):
+    """Number of questions asked in adaptive attempt"""
+    if content.adaptive_length:
+        return min(content.adaptive_length, len(content.questions))
+    return len(content.questions)
+
+
+def get_next_number(topic_result, content=None):
+    """
+    Number of the next question of adaptive attempt, 0 if attempt is complete,
+    ability estimate is stored into topic_result.ability
+    """
+    content = content or get_topic_content(topic_result.topic_id)
+    bank = get_item_bank(topic_result.topic_id)
+    responses = topic_result.get_responses()
+    topic_result.ability, _ = estimate_ability(bank, responses)
+    if len(responses) >= get_attempt_length(content):
+        return 0
+    position = choose_question(bank, responses, topic_result.ability)
+    return 0 if position is None else position + 1
+
+
+def fit_parameters(persons, items, correct, model=MODEL_2PL, iterations=50):
+    """
+    Fit abilities of attempts and parameters of questions by joint maximum a posteriori estimate,
+    every iteration is one Newton step for all abilities and for all parameters at once
+
+    persons, items - arrays of indexes of attempt and question of every response, starting from 0
+    correct - array of booleans, if response is correct
+    returns arrays of difficulties and discriminations of questions by index
+    """
+    correct = correct.astype(np.float64)
+    ability = np.zeros(persons.max() + 1)
+    difficulty = np.zeros(items.max() + 1)
+    discrimination = np.ones(items.max() + 1)
+    for _ in range(iterations):
+        for parameter in ('ability', 'difficulty', 'discrimination'):
+            if parameter == 'discrimination' and model != MODEL_2PL:
+                continue
+            a = discrimination[items]
+            distance = ability[persons] - difficulty[items]
+            probabilities = get_probabilities(distance, 0, a)
+            residuals = correct - probabilities
+            weights = probabilities * (1 - probabilities)
+            if parameter == 'ability':
+                gradient = np.bincount(persons, a * residuals, len(ability)) - ability / ABILITY_PRIOR_SD ** 2
+                hessian = np.bincount(persons, a ** 2 * weights, len(ability)) + 1 / ABILITY_PRIOR_SD ** 2
+                ability = np.clip(ability + gradient / hessian, *PARAMETER_BOUNDS)
+            elif parameter == 'difficulty':
+                gradient = -np.bincount(items, a * residuals, len(difficulty)) - \
+                    difficulty / DIFFICULTY_PRIOR_SD ** 2
+                hessian = np.bincount(items, a ** 2 * weights, len(difficulty)) + 1 / DIFFICULTY_PRIOR_SD ** 2
+                difficulty = np.clip(difficulty + gradient / hessian, *PARAMETER_BOUNDS)
+            else:
+                gradient = np.bincount(items, residuals * distance, len(discrimination)) - \
+                    (discrimination - 1) / DISCRIMINATION_PRIOR_SD ** 2
+                hessian = np.bincount(items, weights * distance ** 2, len(discrimination)) + \
+                    1 / DISCRIMINATION_PRIOR_SD ** 2
+                discrimination = np.clip(discrimination + gradient / hessian, *DISCRIMINATION_BOUNDS)
+    return difficulty, discrimination
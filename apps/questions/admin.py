@@ -1,7 +1,36 @@
-from django.contrib import admin
+from django import forms
+from django.conf.urls import url
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.core.urlresolvers import reverse
+from django.http import HttpResponseRedirect
+from django.template.response import TemplateResponse
+from django.utils.html import format_html
+from django.utils.http import urlencode
+from django.utils.translation import ugettext_lazy as _, ungettext
 
+from questions import search
+from questions.duplicates import DEFAULT_THRESHOLD, find_clusters, get_best_matches
 from questions.models import Answer, Question, Topic, TopicQuestionRelation
 from questions.forms import AnswerInlineFormSet, TopicQuestionRelationFormSet
+from users.admin import RegradeActionMixin
+from users.grading import start_job
+
+
+class FullTextSearchMixin(object):
+
+    """
+    Uses full-text search index instead of LIKE lookups when it is supported by database
+    """
+
+    search_kind = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if search_term:
+            matched = search.filter_queryset(queryset, self.search_kind, search_term)
+            if matched is not None:
+                return matched, False
+        return super().get_search_results(request, queryset, search_term)
 
 
 class AnswerAdminInline(admin.TabularInline):
@@ -10,28 +39,159 @@ class AnswerAdminInline(admin.TabularInline):
     extra = 1
 
 
-class QuestionAdmin(admin.ModelAdmin):
+class QuestionActionForm(helpers.ActionForm):
+    topic = forms.ModelChoiceField(Topic.objects.order_by('title'), label=_('Topic:'), required=False)
+
+
+class QuestionAdmin(RegradeActionMixin, FullTextSearchMixin, admin.ModelAdmin):
     inlines = [
         AnswerAdminInline,
     ]
     list_display = ('text', 'qtype')
     search_fields = ('text',)
+    search_kind = 'question'
     list_filter = ('qtype',)
+    action_form = QuestionActionForm
+    actions = ['add_to_topic', 'regrade', 'find_duplicates']
+
+    def get_urls(self):
+        return [
+            url(r'^duplicates/$', self.admin_site.admin_view(self.duplicates_view), name='questions_duplicates'),
+        ] + super().get_urls()
+
+    def duplicates_view(self, request):
+        """Clusters of near-duplicate questions, only clusters of questions from ids parameter if it is passed"""
+        if not self.has_change_permission(request):
+            return self.admin_site.login(request)
+        try:
+            threshold = float(request.GET.get('threshold', DEFAULT_THRESHOLD))
+        except ValueError:
+            threshold = DEFAULT_THRESHOLD
+        question_ids = [int(value) for value in request.GET.get('ids', '').split(',') if value.isdigit()] or None
+        clusters = find_clusters(threshold, question_ids)
+        questions = Question.objects.in_bulk(
+            [question_id for cluster in clusters for question_id in cluster.question_ids])
+        rows = []
+        for cluster in clusters:
+            matches = get_best_matches(cluster)
+            rows.append([
+                (questions[question_id], questions[matches[question_id][0]], matches[question_id][1])
+                for question_id in cluster.question_ids if question_id in questions
+            ])
+        context = dict(
+            self.admin_site.each_context(request),
+            title=_('Near-duplicate questions'),
+            opts=self.model._meta,
+            clusters=rows,
+            threshold=threshold,
+        )
+        return TemplateResponse(request, 'admin/questions/question_duplicates.html', context)
+
+    def add_to_topic(self, request, queryset):
+        form = self.action_form(request.POST, auto_id=None)
+        form.fields['action'].choices = self.get_action_choices(request)
+        topic = form.cleaned_data['topic'] if form.is_valid() else None
+        if topic is None:
+            self.message_user(request, _('Please choose topic.'), messages.ERROR)
+            return
+        relations = topic.add_questions(list(queryset.order_by('id').values_list('id', flat=True)))
+        self.message_user(request, ungettext(
+            '%(count)d question was added to topic "%(topic)s".',
+            '%(count)d questions were added to topic "%(topic)s".',
+            len(relations)
+        ) % {'count': len(relations), 'topic': topic})
+    add_to_topic.short_description = _('Add selected questions to topic')
+
+    def regrade(self, request, queryset):
+        job = start_job(question_ids=list(queryset.values_list('id', flat=True)))
+        self.message_regrade_job(request, job)
+    regrade.short_description = _('Regrade results of topics with selected questions')
+
+    def find_duplicates(self, request, queryset):
+        ids = ','.join(str(question_id) for question_id in queryset.values_list('id', flat=True))
+        return HttpResponseRedirect('{0}?{1}'.format(reverse('admin:questions_duplicates'), urlencode({'ids': ids})))
+    find_duplicates.short_description = _('Find near-duplicates of selected questions')
 
 
 class TopicQuestionRelationAdminInline(admin.TabularInline):
     model = TopicQuestionRelation
     formset = TopicQuestionRelationFormSet
+    raw_id_fields = ('question',)
     extra = 1
+    per_page = 50
+    page_var = 'relations_page'
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.per_page = self.per_page
+        formset.page = request.GET.get(self.page_var, 1)
+        return formset
 
 
-class TopicAdmin(admin.ModelAdmin):
+class TopicAdmin(FullTextSearchMixin, admin.ModelAdmin):
     inlines = [
         TopicQuestionRelationAdminInline,
     ]
-    list_display = ('title', 'description')
+    list_display = ('title', 'description', 'summary_link', 'live_link')
     search_fields = ('title', 'description')
+    search_kind = 'topic'
+
+    def summary_link(self, obj):
+        return format_html('<a href="{}">{}</a>', reverse('admin:stats_topic_summary', args=(obj.id,)), _('Summary'))
+    summary_link.short_description = _('Summary')
+
+    def live_link(self, obj):
+        return format_html('<a href="{}">{}</a>', reverse('admin:stats_topic_live', args=(obj.id,)), _('Live'))
+    live_link.short_description = _('Live activity')
+
+
+class TopicQuestionRelationActionForm(helpers.ActionForm):
+    offset = forms.IntegerField(label=_('Offset:'), required=False)
+
+
+class TopicQuestionRelationAdmin(admin.ModelAdmin):
+    list_display = ('question', 'topic', 'order', 'active', 'weight')
+    # Active flag is changed only by actions, deactivate action keeps started topics answerable
+    list_editable = ('order', 'weight')
+    list_filter = ('topic', 'active')
+    list_select_related = ('question', 'topic')
+    raw_id_fields = ('question', 'topic')
+    ordering = ('topic', 'order', 'id')
+    action_form = TopicQuestionRelationActionForm
+    actions = ['activate', 'deactivate', 'move']
+
+    def activate(self, request, queryset):
+        updated = queryset.set_active(True)
+        self.message_user(request, ungettext(
+            '%d linked question was activated.', '%d linked questions were activated.', updated) % updated)
+    activate.short_description = _('Activate selected linked questions')
+
+    def deactivate(self, request, queryset):
+        emptied = Topic.objects.filter(id__in=queryset.get_emptied_topic_ids()).order_by('title')
+        if emptied:
+            # Started topic without active questions can't be answered
+            self.message_user(request, _(
+                'Nothing was deactivated: topics would be left without active questions: %s.'
+            ) % ', '.join(str(topic) for topic in emptied), messages.ERROR)
+            return
+        updated = queryset.set_active(False)
+        self.message_user(request, ungettext(
+            '%d linked question was deactivated.', '%d linked questions were deactivated.', updated) % updated)
+    deactivate.short_description = _('Deactivate selected linked questions')
+
+    def move(self, request, queryset):
+        form = self.action_form(request.POST, auto_id=None)
+        form.fields['action'].choices = self.get_action_choices(request)
+        offset = form.cleaned_data['offset'] if form.is_valid() else None
+        if not offset:
+            self.message_user(request, _('Please enter order offset.'), messages.ERROR)
+            return
+        updated = queryset.move(offset)
+        self.message_user(request, ungettext(
+            '%d linked question was moved.', '%d linked questions were moved.', updated) % updated)
+    move.short_description = _('Move selected linked questions by offset')
 
 
 admin.site.register(Question, QuestionAdmin)
 admin.site.register(Topic, TopicAdmin)
+admin.site.register(TopicQuestionRelation, TopicQuestionRelationAdmin)
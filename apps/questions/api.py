@@ -0,0 +1,114 @@
+"""
+JSON payloads of read paths, shared by WSGI views and ASGI handlers
+"""
+from django.core.paginator import Paginator, InvalidPage
+from django.http import Http404
+from django.utils.translation import ugettext as _
+
+from questions.cache import get_topic_questions
+from questions.models import Topic
+from questions.search import search_topics
+from users.models import ArchivedTopicResult, TopicResult
+
+
+TOPICS_PER_PAGE = 10
+
+
+def get_topic(topic_id):
+    topic = Topic.objects.filter(id=topic_id).first()
+    if topic is None:
+        raise Http404(_('Topic not found'))
+    return topic
+
+
+def get_topic_result(topic_id, user):
+    return TopicResult.objects.for_user(user.id).filter(topic_id=topic_id, user=user).first()
+
+
+def get_archived_result(topic_id, user):
+    return ArchivedTopicResult.objects.filter(topic_id=topic_id, user=user).order_by('-date_finished').first()
+
+
+def get_progress(topic_result, archived_result=None):
+    if topic_result is None and archived_result is not None:
+        return {
+            'started': True,
+            'finished': True,
+            'archived': True,
+            'answered_count': archived_result.total_count,
+            'total_count': archived_result.total_count,
+            'correct_count': archived_result.correct_count,
+        }
+    if topic_result is None:
+        return {'started': False}
+    progress = {
+        'started': True,
+        'finished': topic_result.date_finished is not None,
+        'answered_count': topic_result.answered_count,
+        'total_count': topic_result.total_count,
+    }
+    if topic_result.date_finished:
+        progress['correct_count'] = topic_result.correct_count
+    else:
+        progress['next_number'] = topic_result.peek_next_number()
+    return progress
+
+
+def get_topics_payload(user, page=1, query=''):
+    topics = Topic.objects.order_by('id')
+    if query:
+        topics = search_topics(topics, query)
+    paginator = Paginator(topics.values('id', 'title', 'description'), TOPICS_PER_PAGE)
+    try:
+        page = paginator.page(page)
+    except InvalidPage:
+        raise Http404(_('Page not found'))
+    return {
+        'topics': list(page),
+        'page': page.number,
+        'num_pages': paginator.num_pages,
+    }
+
+
+def get_user_progress(topic_id, user):
+    topic_result = get_topic_result(topic_id, user)
+    if topic_result is None:
+        return get_progress(None, get_archived_result(topic_id, user))
+    return get_progress(topic_result)
+
+
+def get_topic_payload(user, topic_id):
+    topic = get_topic(topic_id)
+    return {
+        'id': topic.id,
+        'title': topic.title,
+        'description': topic.description,
+        'questions_count': len(get_topic_questions(topic.id)),
+        'progress': get_user_progress(topic.id, user),
+    }
+
+
+def get_question_payload(user, topic_id, number):
+    questions = get_topic_questions(topic_id)
+    number = int(number)
+    if number > len(questions) or number < 1:
+        raise Http404(_('Question not found'))
+    question = questions[number - 1]
+    topic_result = get_topic_result(topic_id, user)
+    answered = bool(topic_result) and topic_result.answers.filter(question=question).exists()
+    if not answered and get_topic(topic_id).mode == Topic.MODE_ADAPTIVE and (
+            topic_result is None or number != topic_result.peek_next_number()):
+        # Only the question chosen by ability estimate is shown in started adaptive topic
+        raise Http404(_('Question not found'))
+    return {
+        'number': number,
+        'id': question.id,
+        'text': question.text,
+        'qtype': question.qtype,
+        'answers': [{'id': answer.id, 'text': answer.text} for answer in question.answers.all()],
+        'answered': answered,
+    }
+
+
+def get_progress_payload(user, topic_id):
+    return get_user_progress(topic_id, user)
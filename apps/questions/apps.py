@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class QuestionsConfig(AppConfig):
     name = 'questions'
+
+    def ready(self):
+        # Connect cache invalidation, search and duplicates indexing signals
+        import questions.cache  # noqa
+        import questions.duplicates  # noqa
+        import questions.search  # noqa
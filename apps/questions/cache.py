@@ -0,0 +1,208 @@
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.db.models.signals import post_save, post_delete
+
+from questions.models import Answer, Question, Topic, TopicQuestionRelation, topic_content_changed
+
+
+TOPIC_VERSION_KEY = 'questions:topic:{}:version'
+# Format of cached content is a part of key, it is increased when fields of TopicContent are changed
+TOPIC_QUESTIONS_KEY = 'questions:topic:{}:content:v2:{}'
+TOPIC_QUESTIONS_TIMEOUT = 60 * 60
+
+# Content version of topic, its ordered active questions, mode and length of adaptive attempt,
+# scoring policy, penalty and weights of active questions by id
+TopicContent = namedtuple('TopicContent', (
+    'version', 'questions', 'mode', 'adaptive_length', 'scoring', 'penalty', 'weights'))
+
+
+class LocalCache(object):
+
+    """
+    Bounded in-process LRU cache with hits, misses and evictions counters.
+
+    Cached values are shared by all threads of process, they must not be modified.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.data = OrderedDict()
+        self.stats = Counter()
+
+    def get(self, key):
+        with self.lock:
+            try:
+                value = self.data[key]
+            except KeyError:
+                self.stats['misses'] += 1
+                return None
+            self.data.move_to_end(key)
+            self.stats['hits'] += 1
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.stats.clear()
+
+
+local_cache = LocalCache(settings.CONTENT_CACHE_LOCAL_SIZE)
+shared_stats = Counter()
+
+
+def get_cache_stats():
+    """Counters of in-process and shared content cache of current process"""
+    return {
+        'local': dict(local_cache.stats, size=len(local_cache.data)),
+        'shared': dict(shared_stats),
+    }
+
+
+def get_version_key(topic_id):
+    return TOPIC_VERSION_KEY.format(topic_id)
+
+
+def new_version():
+    # Version of evicted key isn't reused, so stale content of in-process caches is never read
+    return int(time.time() * 1000)
+
+
+def get_topic_version(topic_id):
+    """Version of cached topic content, it is kept in shared cache"""
+    key = get_version_key(topic_id)
+    version = cache.get(key)
+    if version is None:
+        version = new_version()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_topic_versions(topic_ids):
+    for topic_id in set(topic_ids):
+        try:
+            cache.incr(get_version_key(topic_id))
+        except ValueError:
+            cache.add(get_version_key(topic_id), new_version(), None)
+
+
+def get_topic_questions_key(topic_id, version=None):
+    if version is None:
+        version = get_topic_version(topic_id)
+    return TOPIC_QUESTIONS_KEY.format(topic_id, version)
+
+
+def load_topic_content(topic_id, version=None):
+    """
+    Load content version, settings and active questions of topic with prefetched answers and put them into caches
+    """
+    key = get_topic_questions_key(topic_id, version)
+    content_version, mode, adaptive_length, scoring, penalty = Topic.objects.filter(id=topic_id).values_list(
+        'content_version', 'mode', 'adaptive_length', 'scoring', 'penalty'
+    ).first() or (None, Topic.MODE_FIXED, None, Topic.SCORING_ALL_OR_NOTHING, 0)
+    # Questions are read with their relations in order of Topic.get_active_questions to get weights
+    relations = list(TopicQuestionRelation.objects.filter(
+        topic_id=topic_id, active=True
+    ).select_related('question').order_by('order', 'question_id'))
+    questions = [relation.question for relation in relations]
+    prefetch_related_objects(questions, 'answers')
+    weights = {relation.question_id: relation.weight for relation in relations}
+    content = TopicContent(content_version, questions, mode, adaptive_length, scoring, penalty, weights)
+    cache.set(key, content, TOPIC_QUESTIONS_TIMEOUT)
+    local_cache.set(key, content)
+    return content
+
+
+def get_topic_content(topic_id):
+    """
+    Get content version and ordered list of topic's active questions with prefetched answers,
+    content is looked up in in-process cache, then in shared cache and then it is loaded from database
+    """
+    version = get_topic_version(topic_id)
+    key = get_topic_questions_key(topic_id, version)
+    content = local_cache.get(key)
+    if content is not None:
+        return content
+    content = cache.get(key)
+    if content is None:
+        shared_stats['misses'] += 1
+        return load_topic_content(topic_id, version)
+    shared_stats['hits'] += 1
+    local_cache.set(key, content)
+    return content
+
+
+def get_topic_questions(topic_id):
+    """
+    Get ordered list of topic's active questions with prefetched answers
+    """
+    return get_topic_content(topic_id).questions
+
+
+def get_answer_key(topic_id):
+    """
+    Ids of correct answers by id of topic's active question
+    """
+    return {
+        question.id: [answer.id for answer in question.answers.all() if answer.is_correct]
+        for question in get_topic_content(topic_id).questions
+    }
+
+
+def invalidate_topics(topic_ids):
+    topic_ids = list(topic_ids)
+    bump_topic_versions(topic_ids)
+    # Content could be loaded by other process before the change was committed
+    transaction.on_commit(lambda: bump_topic_versions(topic_ids))
+
+
+def get_question_topic_ids(question_id):
+    return list(TopicQuestionRelation.objects.filter(
+        question_id=question_id
+    ).values_list('topic_id', flat=True))
+
+
+def topic_changed(sender, instance, *args, **kwargs):
+    invalidate_topics([instance.id])
+
+
+def relation_changed(sender, instance, *args, **kwargs):
+    invalidate_topics([instance.topic_id])
+
+
+def topic_content_bulk_changed(sender, topic_ids, *args, **kwargs):
+    invalidate_topics(topic_ids)
+
+
+def question_changed(sender, instance, *args, **kwargs):
+    invalidate_topics(get_question_topic_ids(instance.id))
+
+
+def answer_changed(sender, instance, *args, **kwargs):
+    invalidate_topics(get_question_topic_ids(instance.question_id))
+
+
+post_save.connect(topic_changed, sender=Topic)
+post_delete.connect(topic_changed, sender=Topic)
+post_save.connect(relation_changed, sender=TopicQuestionRelation)
+post_delete.connect(relation_changed, sender=TopicQuestionRelation)
+# Relations of deleted question are deleted with their own signals
+post_save.connect(question_changed, sender=Question)
+post_save.connect(answer_changed, sender=Answer)
+post_delete.connect(answer_changed, sender=Answer)
+topic_content_changed.connect(topic_content_bulk_changed)
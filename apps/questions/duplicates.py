@@ -0,0 +1,206 @@
+"""
+Near-duplicate questions detection with MinHash and locality-sensitive hashing
+
+Text of every question is split into character shingles, MinHash signature of shingles set is stored
+with question and split into bands. Each band is hashed into LSH bucket, questions sharing any bucket
+are candidates, which are verified by signatures similarity (estimate of Jaccard similarity of texts).
+Candidates are found by one query over buckets table, so clusters of the whole bank are listed in seconds.
+"""
+import hashlib
+import zlib
+from collections import defaultdict, namedtuple
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import post_init, post_save
+
+from questions.models import Question, QuestionBucket, QuestionSignature
+from questions.search import get_words
+
+
+SIGNATURE_SIZE = 64
+# Probability of questions to become candidates is 1 - (1 - s ** ROWS) ** BANDS for similarity s,
+# it is about 0.5 at s = 0.5 and 0.99 at s = 0.75
+BANDS = 16
+ROWS = SIGNATURE_SIZE // BANDS
+SHINGLE_SIZE = 4
+DEFAULT_THRESHOLD = 0.7
+# Members of larger buckets are compared only with the first member instead of each other
+MAX_PAIRWISE_BUCKET = 100
+BATCH_SIZE = 1000
+
+PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+# Coefficients of hash functions (a * x + b) % PRIME, they must never change, stored signatures depend on them
+_random = np.random.RandomState(4096)
+HASH_A = _random.randint(1, MAX_HASH, SIGNATURE_SIZE).astype(np.uint64)
+HASH_B = _random.randint(0, MAX_HASH, SIGNATURE_SIZE).astype(np.uint64)
+
+# Cluster of near-duplicate questions: sorted ids and list of (id, id, similarity) verified pairs
+Cluster = namedtuple('Cluster', ('question_ids', 'pairs'))
+
+
+def get_shingles(text):
+    """Set of character shingles of normalized text: lowercase words separated with single space"""
+    normalized = ' '.join(get_words(text.lower()))
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def get_signature(text):
+    """MinHash signature of text as array of unsigned 32-bit integers, None for text without words"""
+    shingles = get_shingles(text)
+    if not shingles:
+        return None
+    hashes = np.array([zlib.crc32(shingle.encode('utf-8')) for shingle in shingles], dtype=np.uint64)
+    # Products of 32-bit values don't overflow 64-bit integers
+    values = (np.outer(hashes, HASH_A) + HASH_B) % PRIME & MAX_HASH
+    return values.min(axis=0).astype(np.uint32)
+
+
+def get_bucket_keys(signature):
+    """LSH bucket keys of signature bands, positive 63-bit integers"""
+    keys = []
+    for band in range(BANDS):
+        digest = hashlib.md5(bytes([band]) + signature[band * ROWS:(band + 1) * ROWS].tobytes()).digest()
+        keys.append(int.from_bytes(digest[:8], 'big') >> 1)
+    return keys
+
+
+def load_signature(value):
+    return np.frombuffer(bytes(value), dtype=np.uint32)
+
+
+def index_questions(questions):
+    """Replace signatures and buckets of questions, questions - list of (id, text) pairs"""
+    signatures = []
+    buckets = []
+    for question_id, text in questions:
+        signature = get_signature(text)
+        if signature is None:
+            continue
+        signatures.append(QuestionSignature(question_id=question_id, signature=signature.tobytes()))
+        buckets.extend(QuestionBucket(question_id=question_id, key=key) for key in get_bucket_keys(signature))
+    question_ids = [question_id for question_id, _ in questions]
+    with transaction.atomic():
+        QuestionSignature.objects.filter(question_id__in=question_ids).delete()
+        QuestionBucket.objects.filter(question_id__in=question_ids).delete()
+        QuestionSignature.objects.bulk_create(signatures)
+        QuestionBucket.objects.bulk_create(buckets, batch_size=BATCH_SIZE)
+
+
+def rebuild_index(batch_size=BATCH_SIZE):
+    """Build signatures and buckets of all questions, returns number of indexed questions"""
+    QuestionSignature.objects.all().delete()
+    QuestionBucket.objects.all().delete()
+    count = 0
+    last_id = 0
+    while True:
+        questions = list(Question.objects.filter(id__gt=last_id).order_by('id').values_list(
+            'id', 'text')[:batch_size])
+        if not questions:
+            return count
+        index_questions(questions)
+        count += len(questions)
+        last_id = questions[-1][0]
+
+
+def get_candidate_pairs(question_ids=None):
+    """
+    Pairs of questions sharing LSH bucket, only pairs with given questions if question_ids are passed
+    """
+    shared = QuestionBucket.objects.values('key').annotate(size=Count('id')).filter(size__gt=1)
+    if question_ids is not None:
+        shared = shared.filter(key__in=QuestionBucket.objects.filter(question_id__in=question_ids).values('key'))
+    members = defaultdict(list)
+    for key, question_id in QuestionBucket.objects.filter(key__in=shared.values('key')).values_list(
+            'key', 'question_id'):
+        members[key].append(question_id)
+    pairs = set()
+    for bucket in members.values():
+        bucket.sort()
+        if len(bucket) > MAX_PAIRWISE_BUCKET:
+            pairs.update((bucket[0], other) for other in bucket[1:])
+            continue
+        pairs.update(
+            (first, second) for index, first in enumerate(bucket) for second in bucket[index + 1:]
+        )
+    if question_ids is not None:
+        question_ids = set(question_ids)
+        pairs = {pair for pair in pairs if pair[0] in question_ids or pair[1] in question_ids}
+    return sorted(pairs)
+
+
+def get_similarities(pairs):
+    """Signatures similarity of pairs of questions, computed for all pairs at once"""
+    if not pairs:
+        return []
+    question_ids = sorted({question_id for pair in pairs for question_id in pair})
+    positions = {question_id: position for position, question_id in enumerate(question_ids)}
+    signatures = np.zeros((len(question_ids), SIGNATURE_SIZE), dtype=np.uint32)
+    for start in range(0, len(question_ids), BATCH_SIZE):
+        for question_id, signature in QuestionSignature.objects.filter(
+                question_id__in=question_ids[start:start + BATCH_SIZE]).values_list('question_id', 'signature'):
+            signatures[positions[question_id]] = load_signature(signature)
+    first = np.array([positions[pair[0]] for pair in pairs])
+    second = np.array([positions[pair[1]] for pair in pairs])
+    return (signatures[first] == signatures[second]).mean(axis=1).tolist()
+
+
+def find_clusters(threshold=DEFAULT_THRESHOLD, question_ids=None):
+    """
+    Clusters of near-duplicate questions: connected components of candidate pairs with similarity
+    not less than threshold, larger clusters first
+    """
+    pairs = get_candidate_pairs(question_ids)
+    verified = [
+        (first, second, similarity)
+        for (first, second), similarity in zip(pairs, get_similarities(pairs)) if similarity >= threshold
+    ]
+    parents = {}
+
+    def find(question_id):
+        root = parents.setdefault(question_id, question_id)
+        while root != parents[root]:
+            root = parents[root]
+        while question_id != root:
+            parents[question_id], question_id = root, parents[question_id]
+        return root
+
+    for first, second, _ in verified:
+        parents[find(second)] = find(first)
+    clusters = defaultdict(lambda: Cluster([], []))
+    for question_id in list(parents):
+        clusters[find(question_id)].question_ids.append(question_id)
+    for pair in verified:
+        clusters[find(pair[0])].pairs.append(pair)
+    for cluster in clusters.values():
+        cluster.question_ids.sort()
+    return sorted(clusters.values(), key=lambda cluster: (-len(cluster.question_ids), cluster.question_ids))
+
+
+def get_best_matches(cluster):
+    """The most similar other question of cluster by question id, (id, similarity) pairs"""
+    matches = {}
+    for first, second, similarity in cluster.pairs:
+        for question_id, other in ((first, second), (second, first)):
+            if question_id not in matches or matches[question_id][1] < similarity:
+                matches[question_id] = (other, similarity)
+    return matches
+
+
+def question_post_init(sender, instance, *args, **kwargs):
+    # Save original text, signature is rebuilt only if it is changed, deferred text isn't loaded
+    instance._orig_text = instance.__dict__.get('text')
+
+
+def question_post_save(sender, instance, created, raw=False, *args, **kwargs):
+    if not raw and (created or instance.text != instance._orig_text):
+        index_questions([(instance.id, instance.text)])
+    instance._orig_text = instance.text
+
+
+post_init.connect(question_post_init, sender=Question)
+post_save.connect(question_post_save, sender=Question)
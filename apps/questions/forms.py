@@ -1,5 +1,7 @@
 import re
 from django import forms
+from django.core.paginator import Paginator, InvalidPage
+from django.db import IntegrityError, router, transaction
 from django.forms.models import BaseInlineFormSet
 from django.utils.translation import ugettext_lazy as _
 
@@ -50,9 +52,15 @@ class AnswerQuestionForm(forms.ModelForm):
         useranswer = super().save(commit=False)
         useranswer.topic_result = self.topic_result
         useranswer.question = self.question
-        useranswer.save()
-        for answer in self.answers:
-            useranswer.answers.add(answer)
+        # Answer is saved on shard database of its topic result
+        using = router.db_for_write(UserAnswer, instance=useranswer)
+        try:
+            with transaction.atomic(using=using):
+                useranswer.save()
+                useranswer.answers.add(*self.answers)
+        except IntegrityError:
+            # Question was answered by concurrent request, its answer is kept
+            return self.topic_result.answers.get(question=self.question)
         return useranswer
 
 
@@ -62,6 +70,20 @@ class TopicStartForm(forms.ModelForm):
         model = TopicResult
         fields = ('topic', 'user')
 
+    def validate_unique(self):
+        # Existing result is returned by save
+        pass
+
+    def save(self, commit=True):
+        if self.instance.pk:
+            return self.instance
+        user = self.cleaned_data['user']
+        topic_result, _ = TopicResult.objects.for_user(user.id).get_or_create(
+            topic=self.cleaned_data['topic'],
+            user=user
+        )
+        return topic_result
+
 
 class AnswerInlineFormSet(BaseInlineFormSet):
 
@@ -88,6 +110,34 @@ class AnswerInlineFormSet(BaseInlineFormSet):
 
 class TopicQuestionRelationFormSet(BaseInlineFormSet):
 
+    """
+    Formset of topic's linked questions
+
+    per_page - if set then only one page of relations is edited
+    page - number of edited page
+    """
+
+    per_page = None
+    page = 1
+    page_obj = None
+
+    def get_queryset(self):
+        if not hasattr(self, '_queryset') and self.per_page:
+            paginator = Paginator(super().get_queryset(), self.per_page)
+            try:
+                self.page_obj = paginator.page(self.page)
+            except InvalidPage:
+                self.page_obj = paginator.page(1)
+            self._queryset = self.page_obj.object_list
+        return super().get_queryset()
+
+    def get_other_active_count(self):
+        """Count of active relations, that are not edited by this formset"""
+        if self.instance.pk is None:
+            return 0
+        edited_ids = [obj.pk for obj in self.get_queryset()]
+        return self.instance.question_relation.filter(active=True).exclude(id__in=edited_ids).count()
+
     def clean(self):
         super().clean()
         active_count = 0
@@ -96,5 +146,7 @@ class TopicQuestionRelationFormSet(BaseInlineFormSet):
                 return  # There are other errors
             if form.cleaned_data and form.cleaned_data.get('active'):
                 active_count += 1
+        if not active_count and self.page_obj is not None:
+            active_count = self.get_other_active_count()
         if not active_count:
             raise forms.ValidationError(_('At least one active question is required.'))
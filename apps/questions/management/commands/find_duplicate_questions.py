@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from questions.duplicates import DEFAULT_THRESHOLD, find_clusters, get_best_matches, rebuild_index
+from questions.models import Question
+
+
+class Command(BaseCommand):
+    help = 'List clusters of near-duplicate questions with their similarity'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threshold', type=float, default=DEFAULT_THRESHOLD,
+            help='Minimal estimated similarity of question texts, from 0 to 1')
+        parser.add_argument(
+            '--rebuild', action='store_true', default=False,
+            help='Rebuild signatures of all questions before search, e.g. after the first deploy')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            count = rebuild_index()
+            self.stdout.write('{0} questions were indexed'.format(count))
+        clusters = find_clusters(options['threshold'])
+        texts = dict(Question.objects.filter(
+            id__in=[question_id for cluster in clusters for question_id in cluster.question_ids]
+        ).values_list('id', 'text'))
+        for number, cluster in enumerate(clusters, 1):
+            self.stdout.write('Cluster {0}: {1} questions'.format(number, len(cluster.question_ids)))
+            matches = get_best_matches(cluster)
+            for question_id in cluster.question_ids:
+                other, similarity = matches[question_id]
+                self.stdout.write('  #{0} {1:.2f} ~ #{2}: {3}'.format(
+                    question_id, similarity, other, texts.get(question_id, '')[:80].replace('\n', ' ')))
+        self.stdout.write(self.style.SUCCESS('{0} clusters of {1} questions were found'.format(
+            len(clusters), sum(len(cluster.question_ids) for cluster in clusters))))
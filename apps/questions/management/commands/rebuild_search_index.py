@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from questions.search import get_backend, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild full-text search index of questions and topics'
+
+    def handle(self, *args, **options):
+        if get_backend() is None:
+            raise CommandError('Full-text search is not supported by database')
+        rebuild_index()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt'))
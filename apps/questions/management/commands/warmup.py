@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from questions.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = 'Import views, compile templates and preload the most active topics into cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--topics', type=int, default=None,
+            help='Number of the most active topics to preload (WARMUP_TOPICS_COUNT by default)')
+
+    def handle(self, *args, **options):
+        timings = warm_up(topics_count=options['topics'])
+        total = 0
+        for name, (count, seconds) in timings.items():
+            total += seconds
+            self.stdout.write('{0}: {1} loaded in {2:.3f}s'.format(name, count, seconds))
+        self.stdout.write(self.style.SUCCESS('Warm up finished in {0:.3f}s'.format(total)))
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    from questions.search import get_backend
+
+    backend = get_backend(schema_editor.connection)
+    if backend is None:
+        return
+    backend.install()
+    Question = apps.get_model('questions', 'Question')
+    Topic = apps.get_model('questions', 'Topic')
+    backend.rebuild('question', ((obj.id, obj.text, '') for obj in Question.objects.iterator()))
+    backend.rebuild('topic', ((obj.id, obj.title, obj.description) for obj in Topic.objects.iterator()))
+
+
+def uninstall_search_index(apps, schema_editor):
+    from questions.search import get_backend
+
+    backend = get_backend(schema_editor.connection)
+    if backend is not None:
+        backend.uninstall()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.4 on 2026-10-19 02:29
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0005_duplicates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='difficulty',
+            field=models.FloatField(default=0.0, verbose_name='Difficulty'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='discrimination',
+            field=models.FloatField(default=1.0, verbose_name='Discrimination'),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='adaptive_length',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Adaptive attempt length'),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='mode',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'Fixed order'), (2, 'Adaptive')], default=1, verbose_name='Mode'),
+        ),
+    ]
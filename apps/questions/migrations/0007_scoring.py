@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.4 on 2026-10-19 02:35
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0006_adaptive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='topic',
+            name='penalty',
+            field=models.FloatField(default=0.25, verbose_name='Penalty'),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='scoring',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'All or nothing'), (2, 'Partial credit'), (3, 'Negative marking')], default=1, verbose_name='Scoring'),
+        ),
+        migrations.AddField(
+            model_name='topicquestionrelation',
+            name='weight',
+            field=models.FloatField(default=1.0, verbose_name='Weight'),
+        ),
+    ]
@@ -1,35 +1,146 @@
+import hashlib
+from calendar import timegm
+from functools import lru_cache
+from uuid import uuid4
+
 from django.shortcuts import redirect
 from braces.views import LoginRequiredMixin
+from django.conf import settings
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.forms.renderers import Jinja2
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.utils.translation import get_language
 from django.views.generic.detail import SingleObjectMixin, SingleObjectTemplateResponseMixin
 
 from users.models import TopicResult
 
 
+@lru_cache()
+def get_form_renderer(template_engine):
+    """Form widgets renderer of template engine, None for default renderer"""
+    if template_engine == 'jinja2':
+        return Jinja2()
+    return None
+
+
+class TemplateEngineMixin(object):
+
+    """
+    Renders templates with engine named by QUESTIONS_TEMPLATE_ENGINE setting,
+    forms widgets are rendered by the same engine
+    """
+
+    @property
+    def template_engine(self):
+        return settings.QUESTIONS_TEMPLATE_ENGINE
+
+    def get_form(self, form_class=None):
+        form = super().get_form(form_class)
+        renderer = get_form_renderer(self.template_engine)
+        if renderer is not None:
+            form.renderer = renderer
+        return form
+
+
+class ConditionalGetMixin(object):
+
+    """
+    Adds weak ETag and Last-Modified headers to GET responses and answers conditional GET requests
+    with 304 Not Modified before context is built and template is rendered.
+
+    ETag is built from get_etag_parts values (content and user's attempt versions), language and CSRF cookie,
+    so cached page stays valid for the next POST. It is weak, because pages differ by masked CSRF token
+    and idempotency key of every render. Responses must be revalidated by browsers on every use.
+    """
+
+    def get_etag_parts(self):
+        """Values, which identify content of response, None disables ETag"""
+        return None
+
+    def get_last_modified(self):
+        """Modification time of response content, None disables Last-Modified"""
+        return None
+
+    def get_etag(self):
+        parts = self.get_etag_parts()
+        if parts is None:
+            return None
+        # CSRF cookie is created before rendering, so the first response gets the same ETag as the next ones
+        get_token(self.request)
+        parts = list(parts) + [get_language(), self.request.META['CSRF_COOKIE']]
+        return 'W/"{0}"'.format(hashlib.md5(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest())
+
+    def get(self, request, *args, **kwargs):
+        etag = self.get_etag()
+        last_modified = self.get_last_modified()
+        last_modified = timegm(last_modified.utctimetuple()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            if etag:
+                response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
 class TopicDetailMixin(LoginRequiredMixin,
                        SingleObjectTemplateResponseMixin,
                        SingleObjectMixin):
 
     """
     Mixin for subviews with Topic as parent object.
+
+    Repeated POST requests with the same idempotency key (Idempotency-Key header or idempotency_key field)
+    are redirected to the stored location of the first request without processing.
     """
 
     topic_results = None
+    idempotency_header = 'HTTP_IDEMPOTENCY_KEY'
+    idempotency_field = 'idempotency_key'
+    idempotency_timeout = 60 * 60
 
     def get(self, request, *args, **kwargs):
         self.get_objects()
         return super().get(request, *args, **kwargs)
 
     def post(self, request, *args, **kwargs):
+        idempotency_key = self.get_idempotency_key()
+        if idempotency_key:
+            location = cache.get(idempotency_key)
+            if location:
+                return redirect(location)
         self.get_objects()
         if self.check_redirect():
-            return redirect(self.get_success_url())
-        return super().post(request, *args, **kwargs)
+            response = redirect(self.get_success_url())
+        else:
+            response = super().post(request, *args, **kwargs)
+        if idempotency_key and response.status_code == 302:
+            cache.set(idempotency_key, response.url, self.idempotency_timeout)
+        return response
+
+    def get_idempotency_key(self):
+        """Cache key of request's idempotency token, None if request has no token"""
+        token = self.request.META.get(self.idempotency_header) or self.request.POST.get(self.idempotency_field)
+        if token:
+            return 'questions:idempotency:{0}:{1}'.format(self.request.user.pk, token[:64])
+        return None
+
+    def get_context_data(self, *args, **kwargs):
+        kwargs = super().get_context_data(*args, **kwargs)
+        kwargs['idempotency_key'] = uuid4().hex
+        return kwargs
 
     def get_topic_result(self, topic):
         """ Get user's topic results by topic"""
         if topic:
-            return TopicResult.objects.filter(topic_id=topic.id, user=self.request.user).first()
+            return TopicResult.objects.for_user(self.request.user.id).filter(
+                topic_id=topic.id, user=self.request.user).first()
         return None
 
     def check_redirect(self):
@@ -1,6 +1,9 @@
 from django.db import models
-from django.db.models import F
-from django.db.models.signals import post_init, post_save
+from django.db.models import F, Max
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import Signal
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 
@@ -11,6 +14,9 @@ class Question(models.Model):
 
     text - question content
     qtype - type of question (single or multiple answers are allowed)
+    modified - time of the last change
+    difficulty, discrimination - item response theory parameters of question, they are fitted
+    from users' answers by fit_item_parameters command and used by adaptive topics
     """
 
     QTYPE_RADIO = 1
@@ -22,6 +28,9 @@ class Question(models.Model):
 
     text = models.TextField()
     qtype = models.IntegerField(_('Type'), choices=QTYPES, default=QTYPE_RADIO)
+    modified = models.DateTimeField(auto_now=True)
+    difficulty = models.FloatField(_('Difficulty'), default=0.0)
+    discrimination = models.FloatField(_('Discrimination'), default=1.0)
 
     def __str__(self):
         return self.text
@@ -39,15 +48,73 @@ class Answer(models.Model):
     question - related question
     text - answer's content
     is_correct - shows if answer is correct for this question
+    modified - time of the last change
     """
     question = models.ForeignKey(Question, related_name='answers')
     text = models.CharField(max_length=255)
     is_correct = models.BooleanField(default=False, blank=True)
+    modified = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.text
 
 
+class QuestionSignature(models.Model):
+
+    """
+    MinHash signature of question text, it is updated on question save (see questions.duplicates)
+
+    signature - packed array of unsigned 32-bit minimal hashes
+    """
+
+    question = models.OneToOneField(Question, primary_key=True, related_name='signature')
+    signature = models.BinaryField()
+
+
+class QuestionBucket(models.Model):
+
+    """
+    LSH bucket of question: hash of one band of its signature, questions in the same bucket are
+    candidate near-duplicates
+
+    key - hash of band number and its rows
+    """
+
+    question = models.ForeignKey(Question, related_name='buckets')
+    key = models.BigIntegerField(db_index=True)
+
+
+# Sent after set-based changes of topics content, which bypass model signals
+topic_content_changed = Signal(providing_args=['topic_ids'])
+
+
+class TopicQuestionRelationQuerySet(models.QuerySet):
+
+    def get_topic_ids(self):
+        return list(self.order_by().values_list('topic_id', flat=True).distinct())
+
+    def set_active(self, active):
+        """Activate or deactivate all relations with single statement"""
+        topic_ids = self.get_topic_ids()
+        updated = self.update(active=active)
+        topic_content_changed.send(sender=TopicQuestionRelation, topic_ids=topic_ids)
+        return updated
+
+    def get_emptied_topic_ids(self):
+        """Ids of topics, which would be left without active questions if all relations were deactivated"""
+        topic_ids = self.get_topic_ids()
+        remaining = TopicQuestionRelation.objects.filter(topic_id__in=topic_ids, active=True).exclude(
+            id__in=self.values('id')).get_topic_ids()
+        return sorted(set(topic_ids) - set(remaining))
+
+    def move(self, offset):
+        """Shift order of all relations by offset with single statement"""
+        topic_ids = self.get_topic_ids()
+        updated = self.update(order=Greatest(F('order') + offset, 0))
+        topic_content_changed.send(sender=TopicQuestionRelation, topic_ids=topic_ids)
+        return updated
+
+
 class TopicQuestionRelation(models.Model):
 
     """
@@ -57,12 +124,16 @@ class TopicQuestionRelation(models.Model):
     topic - linked topic
     order - specifies order of question in topic questions list
     active - indicates if question sould be shown in topic questions list
+    weight - points of fully correct answer to question in topic
     """
 
     question = models.ForeignKey(Question, related_name='topic_relation')
     topic = models.ForeignKey('questions.Topic', related_name='question_relation')
     order = models.PositiveIntegerField(default=0, blank=True)
     active = models.BooleanField(default=True, blank=True)
+    weight = models.FloatField(_('Weight'), default=1.0)
+
+    objects = TopicQuestionRelationQuerySet.as_manager()
 
     class Meta:
         unique_together = ('question', 'topic')
@@ -76,6 +147,17 @@ def topic_question_post_init(sender, instance, *args, **kwargs):
     instance._orig_order = instance.order
 
 
+def bump_content_version(topic_ids):
+    """Increase content version of topics, after their questions list was changed"""
+    Topic.objects.filter(id__in=topic_ids).update(
+        content_version=F('content_version') + 1, modified=timezone.now())
+
+
+def touch_question_topics(question_id):
+    """Update modification time of topics with question, after question or its answers were changed"""
+    Topic.objects.filter(question_relation__question_id=question_id).update(modified=timezone.now())
+
+
 def topic_question_post_save(sender, instance, created, *args, **kwargs):
     same_order_exists = TopicQuestionRelation.objects.filter(
         topic_id=instance.topic_id,
@@ -91,10 +173,34 @@ def topic_question_post_save(sender, instance, created, *args, **kwargs):
         ).exclude(id=instance.id).update(order=F('order') + 1)
     # Reset original value of order
     instance._orig_order = instance.order
+    bump_content_version([instance.topic_id])
+
+
+def topic_question_post_delete(sender, instance, *args, **kwargs):
+    bump_content_version([instance.topic_id])
+
+
+def topic_content_bulk_changed(sender, topic_ids, *args, **kwargs):
+    bump_content_version(topic_ids)
+
+
+def question_post_save(sender, instance, created, raw=False, *args, **kwargs):
+    if not created and not raw:
+        touch_question_topics(instance.id)
+
+
+def answer_changed(sender, instance, raw=False, *args, **kwargs):
+    if not raw:
+        touch_question_topics(instance.question_id)
 
 
 post_init.connect(topic_question_post_init, sender=TopicQuestionRelation)
 post_save.connect(topic_question_post_save, sender=TopicQuestionRelation)
+post_delete.connect(topic_question_post_delete, sender=TopicQuestionRelation)
+topic_content_changed.connect(topic_content_bulk_changed)
+post_save.connect(question_post_save, sender=Question)
+post_save.connect(answer_changed, sender=Answer)
+post_delete.connect(answer_changed, sender=Answer)
 
 
 class Topic(models.Model):
@@ -104,10 +210,39 @@ class Topic(models.Model):
     title - title of topic
     description - description of topic
     questions - questions list, related to topic
+    content_version - increased on every change of topic's questions list
+    modified - time of the last change of topic, its questions list, questions or answers
+    mode - questions are asked in fixed order or the next question is chosen by user's ability estimate
+    adaptive_length - number of questions of adaptive attempt, all questions are asked if it is empty
+    scoring - policy of answers scoring (see questions.scoring), answers are weighted by weights of relations
+    penalty - share of question weight deducted for incorrect answer by negative marking
     """
+
+    MODE_FIXED = 1
+    MODE_ADAPTIVE = 2
+    MODES = (
+        (MODE_FIXED, _('Fixed order')),
+        (MODE_ADAPTIVE, _('Adaptive')),
+    )
+
+    SCORING_ALL_OR_NOTHING = 1
+    SCORING_PARTIAL_CREDIT = 2
+    SCORING_NEGATIVE_MARKING = 3
+    SCORINGS = (
+        (SCORING_ALL_OR_NOTHING, _('All or nothing')),
+        (SCORING_PARTIAL_CREDIT, _('Partial credit')),
+        (SCORING_NEGATIVE_MARKING, _('Negative marking')),
+    )
+
     title = models.CharField(max_length=255)
     description = models.TextField()
     questions = models.ManyToManyField(Question, through=TopicQuestionRelation, related_name='topics')
+    content_version = models.PositiveIntegerField(default=0, editable=False)
+    modified = models.DateTimeField(auto_now=True)
+    mode = models.PositiveSmallIntegerField(_('Mode'), choices=MODES, default=MODE_FIXED)
+    adaptive_length = models.PositiveIntegerField(_('Adaptive attempt length'), blank=True, null=True)
+    scoring = models.PositiveSmallIntegerField(_('Scoring'), choices=SCORINGS, default=SCORING_ALL_OR_NOTHING)
+    penalty = models.FloatField(_('Penalty'), default=0.25)
 
     def __str__(self):
         return self.title
@@ -117,3 +252,25 @@ class Topic(models.Model):
         return self.questions.filter(
             topic_relation__active=True
         ).order_by('topic_relation', 'id')
+
+    def add_questions(self, question_ids, active=True):
+        """
+        Link questions to the end of topic with single insert, already linked questions are skipped
+
+        returns list of created relations
+        """
+        relations = TopicQuestionRelation.objects.filter(topic_id=self.id)
+        linked_ids = set(relations.filter(question_id__in=question_ids).values_list('question_id', flat=True))
+        order = relations.aggregate(max_order=Max('order'))['max_order']
+        order = -1 if order is None else order
+        new_relations = []
+        for question_id in question_ids:
+            if question_id in linked_ids:
+                continue
+            linked_ids.add(question_id)
+            order += 1
+            new_relations.append(TopicQuestionRelation(
+                topic_id=self.id, question_id=question_id, order=order, active=active))
+        TopicQuestionRelation.objects.bulk_create(new_relations)
+        topic_content_changed.send(sender=TopicQuestionRelation, topic_ids=[self.id])
+        return new_relations
@@ -0,0 +1,90 @@
+"""
+Scoring policies of topics
+
+Answers of many results are scored at once: policy gets arrays with counts of chosen correct answers,
+chosen incorrect answers and all correct answers of question for every user's answer, and returns array
+of shares of question weight, which are multiplied by weights of topic's questions. Policies are registered
+by value of Topic.scoring, other policies can be plugged with register_policy.
+"""
+import numpy as np
+
+from questions.models import Topic
+
+
+# Scores are rounded, so regrading doesn't detect changes caused by float arithmetic
+SCORE_DIGITS = 4
+
+
+def is_correct(correct, incorrect, total):
+    """Answers are fully correct if all correct answers and no incorrect ones are chosen"""
+    return (correct == total) & (incorrect == 0)
+
+
+class ScoringPolicy(object):
+
+    def get_credits(self, correct, incorrect, total, penalty):
+        """Shares of question weight earned by answers, arguments are arrays of equal length"""
+        raise NotImplementedError
+
+
+class AllOrNothingPolicy(ScoringPolicy):
+
+    """Full weight for fully correct answer and nothing otherwise"""
+
+    def get_credits(self, correct, incorrect, total, penalty):
+        return is_correct(correct, incorrect, total).astype(np.float64)
+
+
+class PartialCreditPolicy(ScoringPolicy):
+
+    """
+    Share of chosen correct answers, every chosen incorrect answer cancels one correct,
+    so choosing all answers doesn't earn anything
+    """
+
+    def get_credits(self, correct, incorrect, total, penalty):
+        return np.clip((correct - incorrect) / np.maximum(total, 1), 0, 1)
+
+
+class NegativeMarkingPolicy(ScoringPolicy):
+
+    """Full weight for fully correct answer, penalty share of weight is deducted for other answers"""
+
+    def get_credits(self, correct, incorrect, total, penalty):
+        return np.where(is_correct(correct, incorrect, total), 1.0, -penalty)
+
+
+POLICIES = {
+    Topic.SCORING_ALL_OR_NOTHING: AllOrNothingPolicy(),
+    Topic.SCORING_PARTIAL_CREDIT: PartialCreditPolicy(),
+    Topic.SCORING_NEGATIVE_MARKING: NegativeMarkingPolicy(),
+}
+
+
+def register_policy(scoring, policy):
+    POLICIES[scoring] = policy
+
+
+def get_policy(scoring):
+    return POLICIES[scoring]
+
+
+def score_answers(topic_ids, question_ids, correct, incorrect, total, contents):
+    """
+    Score users' answers of several topics with policies of their topics
+
+    topic_ids, question_ids, correct, incorrect, total - arrays of topic, question and answers counts
+    of every user's answer
+    contents - cached contents of topics by id (see questions.cache)
+    returns arrays of active flags and scores of answers, answers to inactive questions score nothing
+    """
+    active = np.zeros(len(question_ids), dtype=bool)
+    scores = np.zeros(len(question_ids), dtype=np.float64)
+    for topic_id, content in contents.items():
+        weighted_ids = np.array(sorted(content.weights), dtype=np.int64)
+        weights = np.array([content.weights[question_id] for question_id in weighted_ids], dtype=np.float64)
+        mask = (topic_ids == topic_id) & np.isin(question_ids, weighted_ids)
+        active |= mask
+        credits = get_policy(content.scoring).get_credits(correct[mask], incorrect[mask], total[mask], content.penalty)
+        scores[mask] = credits * weights[np.searchsorted(weighted_ids, question_ids[mask])]
+    return active, scores
@@ -0,0 +1,271 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+
+from questions.models import Question, Topic
+
+
+SEARCH_TABLE = 'questions_searchdocument'
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def get_words(query):
+    return WORD_RE.findall(query or '')
+
+
+def get_table(queryset):
+    return connection.ops.quote_name(queryset.model._meta.db_table)
+
+
+class BaseSearchBackend(object):
+
+    """
+    Full-text search index of questions and topics.
+
+    Each document is identified by kind ('question' or 'topic') and object id
+    and consists of title and body, title has greater weight in ranking.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def install(self):
+        raise NotImplementedError
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS {}'.format(SEARCH_TABLE))
+
+    def index(self, kind, object_id, title, body=''):
+        raise NotImplementedError
+
+    def remove(self, kind, object_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM {} WHERE kind = %s AND object_id = %s'.format(SEARCH_TABLE), [kind, object_id])
+
+    def rebuild(self, kind, documents):
+        """Replace all documents of kind, documents - iterable of (object_id, title, body)"""
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {} WHERE kind = %s'.format(SEARCH_TABLE), [kind])
+        for object_id, title, body in documents:
+            self.index(kind, object_id, title, body)
+
+    def match_sql(self, kind, query):
+        """SQL selecting ids of matched objects with its params"""
+        raise NotImplementedError
+
+    def search(self, kind, query, limit=100):
+        """Get ids of matched objects ordered by relevance"""
+        raise NotImplementedError
+
+    def rank_queryset(self, queryset, kind, query):
+        """Queryset joined with matched documents and ordered by relevance, it is paginated by database"""
+        raise NotImplementedError
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+
+    """Search by tsvector column with GIN index"""
+
+    config = 'english'
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TABLE {0} ('
+                'kind varchar(16) NOT NULL, '
+                'object_id integer NOT NULL, '
+                'document tsvector NOT NULL, '
+                'PRIMARY KEY (kind, object_id))'.format(SEARCH_TABLE))
+            cursor.execute('CREATE INDEX {0}_document ON {0} USING GIN (document)'.format(SEARCH_TABLE))
+
+    def index(self, kind, object_id, title, body=''):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO {} (kind, object_id, document) VALUES ('
+                '%s, %s, setweight(to_tsvector(%s, %s), \'A\') || setweight(to_tsvector(%s, %s), \'B\')) '
+                'ON CONFLICT (kind, object_id) DO UPDATE SET document = EXCLUDED.document'.format(SEARCH_TABLE),
+                [kind, object_id, self.config, title, self.config, body])
+
+    def get_tsquery(self, query):
+        return ' & '.join('{}:*'.format(word) for word in get_words(query))
+
+    def match_sql(self, kind, query):
+        return (
+            'SELECT object_id FROM {} WHERE kind = %s AND document @@ to_tsquery(%s, %s)'.format(SEARCH_TABLE),
+            [kind, self.config, self.get_tsquery(query)]
+        )
+
+    def search(self, kind, query, limit=100):
+        tsquery = self.get_tsquery(query)
+        if not tsquery:
+            return []
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT object_id FROM {}, to_tsquery(%s, %s) query '
+                'WHERE kind = %s AND document @@ query '
+                'ORDER BY ts_rank(document, query) DESC, object_id LIMIT %s'.format(SEARCH_TABLE),
+                [self.config, tsquery, kind, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+    def rank_queryset(self, queryset, kind, query):
+        return queryset.extra(
+            select={'search_rank': 'ts_rank({0}.document, to_tsquery(%s, %s))'.format(SEARCH_TABLE)},
+            select_params=[self.config, self.get_tsquery(query)],
+            tables=[SEARCH_TABLE],
+            where=[
+                '{0}.kind = %s'.format(SEARCH_TABLE),
+                '{0}.object_id = {1}.id'.format(SEARCH_TABLE, get_table(queryset)),
+                '{0}.document @@ to_tsquery(%s, %s)'.format(SEARCH_TABLE),
+            ],
+            params=[kind, self.config, self.get_tsquery(query)],
+            order_by=['-search_rank', 'id']
+        )
+
+
+class SqliteSearchBackend(BaseSearchBackend):
+
+    """Search by FTS5 virtual table"""
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE VIRTUAL TABLE {} USING fts5('
+                'kind UNINDEXED, object_id UNINDEXED, title, body, '
+                'tokenize = \'porter unicode61\')'.format(SEARCH_TABLE))
+
+    def index(self, kind, object_id, title, body=''):
+        self.remove(kind, object_id)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO {} (kind, object_id, title, body) VALUES (%s, %s, %s, %s)'.format(SEARCH_TABLE),
+                [kind, object_id, title, body])
+
+    def get_match(self, query):
+        return ' '.join('"{}"*'.format(word) for word in get_words(query))
+
+    def match_sql(self, kind, query):
+        return (
+            'SELECT object_id FROM {0} WHERE kind = %s AND {0} MATCH %s'.format(SEARCH_TABLE),
+            [kind, self.get_match(query)]
+        )
+
+    def search(self, kind, query, limit=100):
+        match = self.get_match(query)
+        if not match:
+            return []
+        with self.connection.cursor() as cursor:
+            # bm25 weights are given for every column, lower rank is better
+            cursor.execute(
+                'SELECT object_id FROM {0} WHERE kind = %s AND {0} MATCH %s '
+                'ORDER BY bm25({0}, 0, 0, 10.0, 1.0), object_id LIMIT %s'.format(SEARCH_TABLE),
+                [kind, match, limit])
+            return [int(row[0]) for row in cursor.fetchall()]
+
+    def rank_queryset(self, queryset, kind, query):
+        return queryset.extra(
+            select={'search_rank': 'bm25({0}, 0, 0, 10.0, 1.0)'.format(SEARCH_TABLE)},
+            tables=[SEARCH_TABLE],
+            where=[
+                '{0}.kind = %s'.format(SEARCH_TABLE),
+                '{0}.object_id = {1}.id'.format(SEARCH_TABLE, get_table(queryset)),
+                '{0} MATCH %s'.format(SEARCH_TABLE),
+            ],
+            params=[kind, self.get_match(query)],
+            order_by=['search_rank', 'id']
+        )
+
+
+SEARCH_BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SqliteSearchBackend,
+}
+
+
+def get_backend(conn=None):
+    """Get search backend for connection, None if database is not supported"""
+    conn = conn or connection
+    backend_class = SEARCH_BACKENDS.get(conn.vendor)
+    if backend_class is None:
+        return None
+    return backend_class(conn)
+
+
+def get_question_document(question):
+    return question.text, ''
+
+
+def get_topic_document(topic):
+    return topic.title, topic.description
+
+
+SEARCH_MODELS = {
+    'question': (Question, get_question_document),
+    'topic': (Topic, get_topic_document),
+}
+
+
+def filter_queryset(queryset, kind, query):
+    """
+    Filter queryset by search query, returns None if search backend is not available
+    """
+    backend = get_backend()
+    if backend is None:
+        return None
+    if not get_words(query):
+        return queryset.none()
+    sql, params = backend.match_sql(kind, query)
+    return queryset.extra(
+        where=['{}.id IN ({})'.format(get_table(queryset), sql)],
+        params=params
+    )
+
+
+def search(kind, query, limit=100):
+    """
+    Search objects of kind, returns ids ordered by relevance or None if search backend is not available
+    """
+    backend = get_backend()
+    if backend is None:
+        return None
+    return backend.search(kind, query, limit=limit)
+
+
+def search_topics(queryset, query):
+    """
+    Filter topics queryset by query and order it by relevance, all matched topics are kept,
+    so they can be paginated. LIKE lookups are used when full-text search is not supported by database
+    """
+    backend = get_backend()
+    if backend is None:
+        return queryset.filter(Q(title__icontains=query) | Q(description__icontains=query))
+    if not get_words(query):
+        return queryset.none()
+    return backend.rank_queryset(queryset, 'topic', query)
+
+
+def rebuild_index():
+    backend = get_backend()
+    for kind, (model, get_document) in SEARCH_MODELS.items():
+        backend.rebuild(kind, ((obj.id,) + get_document(obj) for obj in model.objects.iterator()))
+
+
+def index_object(sender, instance, *args, **kwargs):
+    backend = get_backend()
+    if backend is not None:
+        kind = sender._meta.model_name
+        backend.index(kind, instance.id, *SEARCH_MODELS[kind][1](instance))
+
+
+def remove_object(sender, instance, *args, **kwargs):
+    backend = get_backend()
+    if backend is not None:
+        backend.remove(sender._meta.model_name, instance.id)
+
+
+for kind, (model, get_document) in SEARCH_MODELS.items():
+    post_save.connect(index_object, sender=model)
+    post_delete.connect(remove_object, sender=model)
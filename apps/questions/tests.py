@@ -1,10 +1,20 @@
+import re
+import tempfile
+from io import StringIO
+
+from django.contrib.admin import helpers
+from django.core.cache import cache
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
 from django.forms.models import inlineformset_factory
-from django.test import TestCase
+from django.conf import settings
+from django.test import TestCase, override_settings
 from django.utils import timezone
 
 from model_mommy import mommy
 
+from core.testing import QueryBudgetMixin
+
 from questions.models import (
     Answer,
     Question,
@@ -16,10 +26,17 @@ from users.models import (
     TopicResult,
     UserAnswer
 )
+from users.sharding import get_user_shard
 from questions.forms import (
     AnswerInlineFormSet,
-    TopicQuestionRelationFormSet
+    AnswerQuestionForm,
+    TopicQuestionRelationFormSet,
+    TopicStartForm
 )
+from questions.duplicates import find_clusters, get_signature, rebuild_index
+from questions.cache import LocalCache, get_cache_stats, get_topic_questions, get_topic_questions_key, local_cache
+from questions.search import search
+from questions.warmup import get_active_topics, warm_up
 
 
 class TopicListViewTestCase(TestCase):
@@ -49,6 +66,54 @@ class TopicListViewTestCase(TestCase):
             self.assertContains(response, title)
 
 
+class TopicSearchTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = mommy.make(User, username='test', password='123')
+        self.url = reverse('topic-list')
+        self.python = mommy.make(Topic, title='Python basics', description='Variables and loops')
+        self.loops = mommy.make(Topic, title='Loops', description='Loops in python programs')
+        self.math = mommy.make(Topic, title='Math', description='Numbers')
+
+    def test_search_index(self):
+        self.assertEqual(search('topic', 'python'), [self.python.id, self.loops.id])
+        self.assertEqual(search('topic', 'loop'), [self.loops.id, self.python.id])
+        self.assertEqual(search('topic', 'numb'), [self.math.id])
+
+        self.math.description = 'Python numbers'
+        self.math.save()
+        self.assertEqual(search('topic', 'python numbers'), [self.math.id])
+
+        self.math.delete()
+        self.assertEqual(search('topic', 'numbers'), [])
+
+    def test_question_search(self):
+        question = mommy.make(Question, text='What is the capital of France?')
+        mommy.make(Question, text='What is the capital of Spain?')
+        self.assertEqual(search('question', 'capital france'), [question.id])
+
+        self.client.force_login(mommy.make(User, username='admin', is_staff=True, is_superuser=True))
+        response = self.client.get(reverse('admin:questions_question_changelist'), data={'q': 'France'})
+        self.assertEqual(list(response.context['cl'].result_list), [question])
+
+    def test_topic_list_search(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url, data={'q': 'loops'})
+        self.assertEqual(list(response.context['topics']), [self.loops, self.python])
+        self.assertNotContains(response, self.math.title)
+
+        response = self.client.get(self.url, data={'q': 'history'})
+        self.assertContains(response, 'No topics were found.')
+
+    def test_topic_list_search_pagination(self):
+        topics = [mommy.make(Topic, title='History {0}'.format(i)) for i in range(105)]
+        self.client.force_login(self.user)
+        response = self.client.get(self.url, data={'q': 'history', 'page': 11})
+        self.assertEqual(response.context['paginator'].count, 105)
+        self.assertEqual(list(response.context['topics']), topics[100:])
+
+
 class TopicDetailViewTestCase(TestCase):
 
     def setUp(self):
@@ -472,3 +537,492 @@ class TopicAdminFormsetTestCase(TestCase):
         data['question_relation-0-active'] = True
         questions_formset = QuestionsFormSet(data, instance=self.topic)
         self.assertTrue(questions_formset.is_valid())
+
+
+class TopicQuestionsCacheTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        local_cache.clear()
+        self.topic = mommy.make(Topic)
+        self.question = mommy.make(Question, text='question1', qtype=Question.QTYPE_RADIO)
+        self.answer = mommy.make(Answer, question=self.question, text='answer1', is_correct=True)
+        self.relation = mommy.make(
+            TopicQuestionRelation, question=self.question, topic=self.topic, order=0, active=True)
+
+    def test_cached_questions(self):
+        questions = get_topic_questions(self.topic.id)
+        self.assertEqual(questions, [self.question])
+        with self.assertNumQueries(0):
+            questions = get_topic_questions(self.topic.id)
+            self.assertEqual([answer.text for answer in questions[0].answers.all()], ['answer1'])
+
+    def test_invalidation(self):
+        get_topic_questions(self.topic.id)
+        self.answer.text = 'changed'
+        self.answer.save()
+        self.assertIsNone(cache.get(get_topic_questions_key(self.topic.id)))
+        self.assertEqual(get_topic_questions(self.topic.id)[0].answers.all()[0].text, 'changed')
+
+        self.relation.active = False
+        self.relation.save()
+        self.assertEqual(get_topic_questions(self.topic.id), [])
+
+    def test_cache_tiers(self):
+        get_topic_questions(self.topic.id)
+        get_topic_questions(self.topic.id)
+        self.assertEqual(get_cache_stats()['local']['hits'], 1)
+
+        # Content of other process is taken from shared cache
+        local_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_topic_questions(self.topic.id), [self.question])
+        self.assertEqual(get_cache_stats()['shared']['hits'], 1)
+
+    def test_file_based_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.settings(CACHES={'default': {
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}}):
+                get_topic_questions(self.topic.id)
+                local_cache.clear()
+                with self.assertNumQueries(0):
+                    self.assertEqual(get_topic_questions(self.topic.id), [self.question])
+                self.relation.delete()
+                self.assertEqual(get_topic_questions(self.topic.id), [])
+
+    def test_local_cache_eviction(self):
+        lru = LocalCache(2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('a'), 1)
+        self.assertEqual(lru.stats, {'hits': 2, 'misses': 1, 'evictions': 1})
+
+
+class WarmUpTestCase(TestCase):
+
+    multi_db = True
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = mommy.make(User, username='test', password='123')
+        self.topic = mommy.make(Topic)
+        self.inactive_topic = mommy.make(Topic)
+        for topic in (self.topic, self.inactive_topic):
+            question = mommy.make(Question, text='question1', qtype=Question.QTYPE_RADIO)
+            mommy.make(TopicQuestionRelation, question=question, topic=topic, order=0, active=True)
+        mommy.make(TopicResult, topic=self.topic, user=self.user)
+
+    def test_warm_up(self):
+        timings = warm_up(topics_count=1)
+        self.assertEqual(list(timings.keys()), ['views', 'templates', 'topics'])
+        self.assertTrue(timings['templates'][0] > 0)
+        self.assertEqual(timings['topics'][0], 1)
+        self.assertIsNotNone(cache.get(get_topic_questions_key(self.topic.id)))
+        self.assertIsNone(cache.get(get_topic_questions_key(self.inactive_topic.id)))
+
+    def test_command(self):
+        call_command('warmup', topics=2, stdout=StringIO())
+        self.assertIsNotNone(cache.get(get_topic_questions_key(self.inactive_topic.id)))
+
+    @override_settings(ATTEMPT_SHARDS=['default', 'shard1', 'shard2'])
+    def test_sharded_results(self):
+        # Results of users on other shards are counted
+        users = {}
+        while len(users) < 2:
+            user = mommy.make(User)
+            if get_user_shard(user.id) != 'default':
+                users.setdefault(get_user_shard(user.id), user)
+        for user in users.values():
+            mommy.make(TopicResult, topic=self.inactive_topic, user=user)
+        self.assertEqual(TopicResult.objects.using('default').filter(topic=self.inactive_topic).count(), 0)
+        self.assertEqual(get_active_topics(1), [self.inactive_topic.id])
+        self.assertEqual(get_active_topics(3), [self.inactive_topic.id, self.topic.id])
+
+
+class TopicCompositionAdminTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = mommy.make(User, username='admin', is_staff=True, is_superuser=True)
+        self.topic = mommy.make(Topic)
+        self.questions = Question.objects.bulk_create(
+            [Question(text='question{}'.format(i)) for i in range(60)])
+        self.questions = list(Question.objects.order_by('id'))
+        self.topic.add_questions([question.id for question in self.questions[:55]])
+        self.client.force_login(self.user)
+
+    def test_add_questions(self):
+        self.assertEqual(self.topic.question_relation.count(), 55)
+        self.assertEqual(
+            list(self.topic.question_relation.values_list('order', flat=True)[:3]), [0, 1, 2])
+
+        url = reverse('admin:questions_question_changelist')
+        response = self.client.post(url, data={
+            'action': 'add_to_topic',
+            'topic': self.topic.id,
+            helpers.ACTION_CHECKBOX_NAME: [question.id for question in self.questions[50:]]
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.topic.question_relation.count(), 60)
+        self.assertEqual(self.topic.question_relation.get(question=self.questions[-1]).order, 59)
+
+    def test_change_form_pagination(self):
+        url = reverse('admin:questions_topic_change', args=(self.topic.id,))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '?relations_page=2')
+        self.assertEqual(response.context['inline_admin_formsets'][0].formset.initial_form_count(), 50)
+
+        response = self.client.get(url, data={'relations_page': 2})
+        self.assertEqual(response.context['inline_admin_formsets'][0].formset.initial_form_count(), 5)
+
+    def test_set_active_and_move(self):
+        get_topic_questions(self.topic.id)
+        url = reverse('admin:questions_topicquestionrelation_changelist')
+        relations = list(self.topic.question_relation.order_by('order')[:10])
+        # Topic ids selection, update statement and content version bump
+        with self.assertNumQueries(3):
+            self.topic.question_relation.filter(id__in=[relation.id for relation in relations]).set_active(False)
+        self.assertEqual(len(get_topic_questions(self.topic.id)), 45)
+
+        response = self.client.post(url, data={
+            'action': 'activate',
+            helpers.ACTION_CHECKBOX_NAME: [relation.id for relation in relations]
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(get_topic_questions(self.topic.id)), 55)
+
+        response = self.client.post(url, data={
+            'action': 'move',
+            'offset': 100,
+            helpers.ACTION_CHECKBOX_NAME: [relation.id for relation in relations]
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(TopicQuestionRelation.objects.get(id=relations[0].id).order, 100)
+        self.assertEqual(get_topic_questions(self.topic.id)[-10], relations[0].question)
+
+    def test_deactivate_all(self):
+        url = reverse('admin:questions_topicquestionrelation_changelist')
+        relations = self.topic.question_relation.all()
+        selected = relations.filter(id__in=[relation.id for relation in relations[:10]])
+        self.assertEqual(selected.get_emptied_topic_ids(), [])
+        self.assertEqual(relations.get_emptied_topic_ids(), [self.topic.id])
+        response = self.client.post(url, data={
+            'action': 'deactivate',
+            helpers.ACTION_CHECKBOX_NAME: [relation.id for relation in relations]
+        }, follow=True)
+        self.assertContains(response, 'Nothing was deactivated')
+        self.assertEqual(len(get_topic_questions(self.topic.id)), 55)
+        self.assertNotContains(self.client.get(url), 'name="form-0-active"')
+
+
+class IdempotentSubmissionTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = mommy.make(User, username='test', password='123')
+        self.topic = mommy.make(Topic, title='Title1')
+        self.question = mommy.make(Question, text='question1', qtype=Question.QTYPE_RADIO)
+        self.answer1 = mommy.make(Answer, question=self.question, text='answer1', is_correct=True)
+        self.answer2 = mommy.make(Answer, question=self.question, text='answer2', is_correct=False)
+        mommy.make(TopicQuestionRelation, topic=self.topic, question=self.question, order=0)
+        self.client.force_login(self.user)
+
+    def test_start_topic_twice(self):
+        url = reverse('topic-detail', kwargs={'pk': self.topic.pk})
+        form = TopicStartForm(data={'topic': self.topic.id, 'user': self.user.id})
+        self.assertTrue(form.is_valid())
+        topic_result = form.save()
+
+        # Concurrent request, which didn't see started topic
+        form = TopicStartForm(data={'topic': self.topic.id, 'user': self.user.id})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.save(), topic_result)
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(TopicResult.objects.filter(topic=self.topic, user=self.user).count(), 1)
+
+    def test_answer_twice(self):
+        topic_result = mommy.make(TopicResult, topic=self.topic, user=self.user)
+        form = AnswerQuestionForm(data={'answer': self.answer1.id}, question=self.question, topic_result=topic_result)
+        self.assertTrue(form.is_valid())
+        user_answer = form.save()
+
+        # Concurrent request, which didn't see stored answer
+        form = AnswerQuestionForm(data={'answer': self.answer2.id}, question=self.question, topic_result=topic_result)
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.save(), user_answer)
+        self.assertEqual(list(user_answer.answers.all()), [self.answer1])
+
+    def test_idempotency_key(self):
+        url = reverse('topic-detail', kwargs={'pk': self.topic.pk})
+        response = self.client.get(url)
+        key = response.context['idempotency_key']
+        self.assertContains(response, key)
+
+        response = self.client.post(url, data={'idempotency_key': key})
+        self.assertEqual(response.status_code, 302)
+        topic_result = TopicResult.objects.get(topic=self.topic, user=self.user)
+
+        url = reverse('question-detail', kwargs={'pk': self.topic.pk, 'number': 1})
+        response = self.client.post(url, data={'answer': self.answer1.id}, HTTP_IDEMPOTENCY_KEY='answer-1')
+        self.assertEqual(response.status_code, 302)
+        location = response.url
+
+        # Repeated request is answered from stored outcome, only session and user are loaded
+        with self.assertNumQueries(2):
+            response = self.client.post(url, data={'answer': self.answer2.id}, HTTP_IDEMPOTENCY_KEY='answer-1')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, location)
+        self.assertEqual(list(UserAnswer.objects.get(topic_result=topic_result).answers.all()), [self.answer1])
+
+
+class QueryBudgetTestCase(QueryBudgetMixin, TestCase):
+
+    finished = False
+
+    def setUp(self):
+        super().setUp()
+        self.user = mommy.make(User, username='test', password='123', is_staff=True, is_superuser=True)
+        self.client.force_login(self.user)
+
+    def seed(self, size):
+        """
+        Topics and topic with size questions, all questions except the last one are answered by user
+        """
+        Topic.objects.bulk_create([Topic(title='Topic {0}'.format(number)) for number in range(size)])
+        topic = Topic.objects.create(title='Topic')
+        Question.objects.bulk_create([Question(text='Question {0}'.format(number)) for number in range(size)])
+        questions = list(Question.objects.order_by('id'))
+        Answer.objects.bulk_create([
+            Answer(question=question, text=str(number), is_correct=not number)
+            for question in questions for number in range(2)
+        ], batch_size=400)
+        topic.add_questions([question.id for question in questions])
+        topic_result = TopicResult.objects.create(topic=topic, user=self.user)
+        UserAnswer.objects.bulk_create([
+            UserAnswer(topic_result=topic_result, question=question) for question in questions[:-1]
+        ], batch_size=400)
+        if self.finished:
+            topic_result.get_next_number(allow_finish=True)
+        return {'topic': topic, 'topic_result': topic_result, 'size': size}
+
+    def test_topic_list(self):
+        self.assertQueryBudget(4, lambda context: self.client.get(reverse('topic-list')))
+
+    def test_topic_detail(self):
+        self.assertQueryBudget(8, lambda context: self.client.get(
+            reverse('topic-detail', kwargs={'pk': context['topic'].pk})))
+
+    def test_finished_topic_detail(self):
+        self.finished = True
+        self.assertQueryBudget(7, lambda context: self.client.get(
+            reverse('topic-detail', kwargs={'pk': context['topic'].pk})))
+
+    def test_question_detail(self):
+        self.assertQueryBudget(9, lambda context: self.client.get(
+            reverse('question-detail', kwargs={'pk': context['topic'].pk, 'number': context['size']})))
+
+    def test_admin_changelists(self):
+        # Related content of attempts is prefetched from default database instead of join
+        for name, budget in (('questions_question', 6), ('questions_topic', 6), ('questions_topicquestionrelation', 6),
+                             ('users_topicresult', 6), ('users_useranswer', 7)):
+            url = reverse('admin:{0}_changelist'.format(name))
+            self.assertQueryBudget(budget, lambda context: self.client.get(url))
+
+
+JINJA2_TEMPLATES = {
+    'BACKEND': 'django.template.backends.jinja2.Jinja2',
+    'DIRS': [str(settings.APPS_DIR.path('jinja2'))],
+    'OPTIONS': {
+        'environment': 'core.jinja.environment',
+    },
+}
+
+
+@override_settings(TEMPLATES=settings.TEMPLATES + [JINJA2_TEMPLATES])
+class Jinja2TemplatesTestCase(TestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        local_cache.clear()
+        self.user = mommy.make(User, username='test', password='123')
+        self.topic = mommy.make(Topic, title='Topic <1>', description='Description')
+        self.radio = mommy.make(Question, text='Radio', qtype=Question.QTYPE_RADIO)
+        self.checkbox = mommy.make(Question, text='Checkbox', qtype=Question.QTYPE_CHECKBOX)
+        for question in (self.radio, self.checkbox):
+            mommy.make(Answer, question=question, text='Right & wrong', is_correct=True)
+            mommy.make(Answer, question=question, text='Wrong', is_correct=False)
+        self.topic.add_questions([self.radio.id, self.checkbox.id])
+        self.client.force_login(self.user)
+
+    def render(self, engine, url, data=None):
+        with self.settings(QUESTIONS_TEMPLATE_ENGINE=engine):
+            response = self.client.post(url, data) if data is not None else self.client.get(url)
+        content = response.content.decode('utf-8')
+        # Random tokens and whitespace differ
+        content = re.sub(r'<input type=.hidden. name=.csrfmiddlewaretoken.[^>]*>', '', content)
+        content = re.sub(r'value="[0-9a-f]{32}"', 'value=""', content)
+        return ' '.join(content.split()).replace('> <', '><')
+
+    def assertSameRender(self, url, data=None):
+        django_content = self.render('django', url, data)
+        self.assertEqual(self.render('jinja2', url, data), django_content)
+        return django_content
+
+    def test_topic_list(self):
+        content = self.assertSameRender(reverse('topic-list'))
+        self.assertIn('Topic &lt;1&gt;', content)
+        self.assertSameRender(reverse('topic-list') + '?q=missing')
+
+    def test_topic_detail(self):
+        url = reverse('topic-detail', kwargs={'pk': self.topic.pk})
+        self.assertSameRender(url)
+        TopicResult.objects.create(topic=self.topic, user=self.user)
+        content = self.assertSameRender(url)
+        self.assertIn('Go to questions', content)
+
+    def test_question_detail(self):
+        TopicResult.objects.create(topic=self.topic, user=self.user)
+        for number in (1, 2):
+            url = reverse('question-detail', kwargs={'pk': self.topic.pk, 'number': number})
+            content = self.assertSameRender(url)
+            self.assertIn('Right &amp; wrong', content)
+            # Form errors
+            self.assertSameRender(url, {})
+
+    def test_finished_topic_detail(self):
+        topic_result = TopicResult.objects.create(topic=self.topic, user=self.user)
+        user_answer = UserAnswer.objects.create(topic_result=topic_result, question=self.radio)
+        user_answer.answers.add(self.radio.answers.get(is_correct=True))
+        UserAnswer.objects.create(topic_result=topic_result, question=self.checkbox)
+        topic_result.get_next_number(allow_finish=True)
+        content = self.assertSameRender(reverse('topic-detail', kwargs={'pk': self.topic.pk}))
+        self.assertIn('Congratulation', content)
+        self.assertIn('50%', content)
+
+
+class ConditionalGetTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        local_cache.clear()
+        self.user = mommy.make(User, username='test', password='123')
+        self.topic = mommy.make(Topic, title='Topic')
+        self.question1 = mommy.make(Question, text='question1', qtype=Question.QTYPE_RADIO)
+        self.answer1 = mommy.make(Answer, question=self.question1, text='answer1', is_correct=True)
+        self.question2 = mommy.make(Question, text='question2', qtype=Question.QTYPE_RADIO)
+        self.answer2 = mommy.make(Answer, question=self.question2, text='answer2', is_correct=True)
+        self.topic.add_questions([self.question1.id, self.question2.id])
+        self.topic_result = TopicResult.objects.create(topic=self.topic, user=self.user)
+        self.client.force_login(self.user)
+
+    def assertNotModified(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('private', response['Cache-Control'])
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        last_modified = response['Last-Modified']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        return etag
+
+    def test_topic_detail(self):
+        url = reverse('topic-detail', kwargs={'pk': self.topic.pk})
+        etag = self.assertNotModified(url)
+        # Answer changes user's attempt version
+        self.client.post(
+            reverse('question-detail', kwargs={'pk': self.topic.pk, 'number': 1}), {'answer': self.answer1.id})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        # Answer text changes content version
+        self.answer2.text = 'changed'
+        self.answer2.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_question_detail(self):
+        url = reverse('question-detail', kwargs={'pk': self.topic.pk, 'number': 2})
+        etag = self.assertNotModified(url)
+        self.assertNotEqual(etag, self.assertNotModified(
+            reverse('question-detail', kwargs={'pk': self.topic.pk, 'number': 1})))
+        self.question2.text = 'changed'
+        self.question2.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'changed')
+
+    def test_other_user(self):
+        url = reverse('topic-detail', kwargs={'pk': self.topic.pk})
+        etag = self.assertNotModified(url)
+        self.client.force_login(mommy.make(User, username='other'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_topic_list(self):
+        url = reverse('topic-list')
+        etag = self.assertNotModified(url)
+        self.assertNotEqual(etag, self.assertNotModified(url + '?q=topic'))
+        mommy.make(Topic, title='New topic')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class DuplicateQuestionsTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.original = mommy.make(Question, text='Which planet of the Solar system is the largest one?')
+        self.copy = mommy.make(Question, text='Which planet of the solar system is the largest one ?')
+        self.similar = mommy.make(Question, text='Which planet of the Solar system is the largest?')
+        self.other = mommy.make(Question, text='How many bits are there in one byte?')
+
+    def test_signature(self):
+        signature = get_signature(self.original.text)
+        self.assertEqual(len(signature), 64)
+        self.assertTrue((signature == get_signature(self.copy.text)).all())
+        self.assertIsNone(get_signature('?!'))
+
+    def test_clusters(self):
+        clusters = find_clusters(threshold=0.7)
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(clusters[0].question_ids, [self.original.id, self.copy.id, self.similar.id])
+        similarities = {(first, second): similarity for first, second, similarity in clusters[0].pairs}
+        self.assertEqual(similarities[self.original.id, self.copy.id], 1.0)
+
+        # Signature is updated on text change
+        self.similar.text = 'Who wrote War and Peace?'
+        self.similar.save()
+        self.assertEqual(find_clusters()[0].question_ids, [self.original.id, self.copy.id])
+        self.assertEqual(find_clusters(question_ids=[self.other.id]), [])
+
+        self.assertEqual(rebuild_index(batch_size=2), 4)
+        out = StringIO()
+        call_command('find_duplicate_questions', stdout=out)
+        self.assertIn('1 clusters of 2 questions were found', out.getvalue())
+
+    def test_admin(self):
+        self.client.force_login(mommy.make(User, username='admin', is_staff=True, is_superuser=True))
+        response = self.client.post(reverse('admin:questions_question_changelist'), data={
+            'action': 'find_duplicates',
+            '_selected_action': [self.copy.id],
+        }, follow=True)
+        self.assertContains(response, 'Cluster of 3 questions')
+        self.assertContains(response, '1.00')
+        response = self.client.get(reverse('admin:questions_duplicates'), {'threshold': '0.99'})
+        self.assertContains(response, 'Cluster of 2 questions')
@@ -1,5 +1,13 @@
 from django.conf.urls import url, include
-from .views import TopicDetailView, QuestionDetailView, TopicListView
+from .views import (
+    TopicDetailView,
+    QuestionDetailView,
+    TopicListView,
+    TopicListApiView,
+    TopicApiView,
+    QuestionApiView,
+    ProgressApiView
+)
 
 
 urlpatterns = [
@@ -7,5 +15,11 @@ urlpatterns = [
     url(r'^(?P<pk>\d+)/', include([
         url('^$', TopicDetailView.as_view(), name='topic-detail'),
         url(r'^question-(?P<number>\d+)/$', QuestionDetailView.as_view(), name='question-detail')
+    ])),
+    url(r'^api/$', TopicListApiView.as_view(), name='api-topic-list'),
+    url(r'^api/(?P<topic_id>\d+)/', include([
+        url('^$', TopicApiView.as_view(), name='api-topic'),
+        url(r'^question-(?P<number>\d+)/$', QuestionApiView.as_view(), name='api-question'),
+        url(r'^progress/$', ProgressApiView.as_view(), name='api-progress')
     ]))
 ]
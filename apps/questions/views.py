@@ -1,17 +1,21 @@
+from django.core.urlresolvers import reverse
+from django.db.models import Count, Max
 from django.shortcuts import get_object_or_404
-from django.http import Http404
+from django.http import Http404, JsonResponse
 from django.utils.translation import ugettext_lazy as _
-from django.views.generic import ListView, FormView
+from django.views.generic import ListView, FormView, View
 
 from braces.views import LoginRequiredMixin
 
-from questions.mixins import TopicDetailMixin
+from questions import api, search
+from questions.cache import get_topic_questions
+from questions.mixins import ConditionalGetMixin, TemplateEngineMixin, TopicDetailMixin
 from questions.models import Topic, Question
 from questions.forms import AnswerQuestionForm, TopicStartForm
-from users.models import UserAnswer
+from users.models import ArchivedTopicResult
 
 
-class TopicDetailView(TopicDetailMixin, FormView):
+class TopicDetailView(TemplateEngineMixin, TopicDetailMixin, ConditionalGetMixin, FormView):
     """
     Show topic details and allows to start topic
     """
@@ -24,6 +28,34 @@ class TopicDetailView(TopicDetailMixin, FormView):
     def get_objects(self):
         self.object = self.get_object()
         self.topic_result = self.get_topic_result(self.object)
+        self.archived_result = None
+        if self.topic_result is None:
+            self.archived_result = self.get_archived_result(self.object)
+
+    def get_archived_result(self, topic):
+        """User's archived result of topic, archived topic can't be started again"""
+        return ArchivedTopicResult.objects.filter(
+            topic_id=topic.id, user=self.request.user).order_by('-date_finished').first()
+
+    def check_redirect(self):
+        return self.topic_result is not None or self.archived_result is not None
+
+    def get_etag_parts(self):
+        return [
+            self.object.id, self.object.content_version, self.object.modified.timestamp(),
+            self.topic_result.get_attempt_version() if self.topic_result else None,
+            self.archived_result.id if self.archived_result else None,
+        ]
+
+    def get_last_modified(self):
+        if self.topic_result:
+            return max(self.object.modified, self.topic_result.modified)
+        return self.object.modified
+
+    def get_success_url(self):
+        if self.topic_result is None:
+            return reverse('topic-detail', kwargs={'pk': self.object.pk})
+        return super().get_success_url()
 
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
@@ -42,10 +74,14 @@ class TopicDetailView(TopicDetailMixin, FormView):
     def get_context_data(self, *args, **kwargs):
         kwargs = super().get_context_data(*args, **kwargs)
         kwargs['topic_result'] = self.topic_result
+        if self.topic_result and self.topic_result.date_finished:
+            kwargs['finished_result'] = self.topic_result
+        else:
+            kwargs['finished_result'] = self.archived_result
         return kwargs
 
 
-class QuestionDetailView(TopicDetailMixin, FormView):
+class QuestionDetailView(TemplateEngineMixin, TopicDetailMixin, ConditionalGetMixin, FormView):
     """
     Shows question with answers.
     """
@@ -63,7 +99,7 @@ class QuestionDetailView(TopicDetailMixin, FormView):
 
     def get_user_answer(self, question):
         if question and self.topic_result:
-            return UserAnswer.objects.filter(topic_result=self.topic_result, question=question).first()
+            return self.topic_result.answers.filter(question=question).first()
         return None
 
     def get_topic(self):
@@ -75,13 +111,17 @@ class QuestionDetailView(TopicDetailMixin, FormView):
         self.object = self.get_object()
         self.topic_result = self.get_topic_result(self.topic)
         self.user_answer = self.get_user_answer(self.object)
+        if self.user_answer is None and self.topic.mode == Topic.MODE_ADAPTIVE and (
+                self.topic_result is None or self.number != self.topic_result.get_next_number()):
+            # Only the question chosen by ability estimate can be answered in started adaptive topic
+            raise Http404(_('Question not found'))
 
     def get_object(self):
         self.number = int(self.kwargs.get('number'))
-        qs = self.get_queryset()
-        if self.number > qs.count() or self.number < 1:
+        questions = get_topic_questions(self.topic.id)
+        if self.number > len(questions) or self.number < 1:
             raise Http404(_('Question not found'))
-        return qs[self.number - 1]
+        return questions[self.number - 1]
 
     def form_valid(self, form):
         self.user_answer = form.save()
@@ -90,6 +130,17 @@ class QuestionDetailView(TopicDetailMixin, FormView):
     def check_redirect(self):
         return self.user_answer is not None
 
+    def get_etag_parts(self):
+        return [
+            self.topic.id, self.topic.content_version, self.topic.modified.timestamp(), self.number,
+            self.topic_result.get_attempt_version() if self.topic_result else None,
+        ]
+
+    def get_last_modified(self):
+        if self.topic_result:
+            return max(self.topic.modified, self.topic_result.modified)
+        return self.topic.modified
+
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
         kwargs['question'] = self.object
@@ -105,11 +156,89 @@ class QuestionDetailView(TopicDetailMixin, FormView):
         return kwargs
 
 
-class TopicListView(LoginRequiredMixin, ListView):
+class TopicListView(TemplateEngineMixin, LoginRequiredMixin, ConditionalGetMixin, ListView):
+    """
+    Shows list of topics, allows to search topics by title and description
+    """
     queryset = Topic.objects.order_by('id')
     context_object_name = 'topics'
     paginate_by = 10
+    search_kwarg = 'q'
+    query = ''
+    topics_state = None
+
+    def get_topics_state(self):
+        """Topics count and the last modification time, list can be changed only with them"""
+        if self.topics_state is None:
+            self.topics_state = Topic.objects.aggregate(count=Count('id'), modified=Max('modified'))
+        return self.topics_state
+
+    def get_etag_parts(self):
+        state = self.get_topics_state()
+        return [state['count'], state['modified'] and state['modified'].timestamp(), self.request.GET.urlencode()]
+
+    def get_last_modified(self):
+        return self.get_topics_state()['modified']
+
+    def get_paginator(self, queryset, *args, **kwargs):
+        paginator = super().get_paginator(queryset, *args, **kwargs)
+        if not self.query:
+            # Count of all topics is already known
+            paginator.count = self.get_topics_state()['count']
+        return paginator
+
+    def search_topics(self, queryset, query):
+        return search.search_topics(queryset, query)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        self.query = self.request.GET.get(self.search_kwarg, '').strip()
+        if self.query:
+            queryset = self.search_topics(queryset, self.query)
+        return queryset
 
     def get_context_data(self, *args, **kwargs):
         kwargs = super().get_context_data(*args, **kwargs)
+        kwargs['query'] = self.query
         return kwargs
+
+
+class ApiView(LoginRequiredMixin, View):
+    """
+    Read only JSON view, payload is built by payload function of questions.api
+
+    The same payload is served without WSGI worker by ASGI application (see core.asgi)
+    """
+    raise_exception = True
+    payload_function = None
+
+    def get_payload_kwargs(self):
+        return self.kwargs
+
+    def get_payload(self):
+        return self.payload_function(self.request.user, **self.get_payload_kwargs())
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(self.get_payload())
+
+
+class TopicListApiView(ApiView):
+    payload_function = staticmethod(api.get_topics_payload)
+
+    def get_payload_kwargs(self):
+        return {
+            'page': self.request.GET.get('page', 1),
+            'query': self.request.GET.get('q', '').strip(),
+        }
+
+
+class TopicApiView(ApiView):
+    payload_function = staticmethod(api.get_topic_payload)
+
+
+class QuestionApiView(ApiView):
+    payload_function = staticmethod(api.get_question_payload)
+
+
+class ProgressApiView(ApiView):
+    payload_function = staticmethod(api.get_progress_payload)
@@ -0,0 +1,87 @@
+import os
+import time
+from collections import Counter, OrderedDict
+from importlib import import_module
+
+from django.apps import apps
+from django.conf import settings
+from django.core.urlresolvers import get_resolver
+from django.db.models import Count
+from django.template import engines
+
+from questions.cache import load_topic_content
+from questions.models import Topic
+from users.models import TopicResult
+from users.sharding import get_shards
+
+
+def import_views():
+    """Import views modules of all apps and populate URL resolver"""
+    for app_config in apps.get_app_configs():
+        try:
+            import_module('{}.views'.format(app_config.name))
+        except ImportError:
+            pass
+    resolver = get_resolver()
+    # Accessing reverse_dict populates resolver's internal lookups
+    resolver.reverse_dict
+    return len(resolver.url_patterns)
+
+
+def compile_templates():
+    """Compile templates from project template directories, so they get into cached loader"""
+    count = 0
+    for engine in engines.all():
+        for directory in engine.dirs:
+            for root, dirs, files in os.walk(directory):
+                for filename in files:
+                    if not filename.endswith('.html'):
+                        continue
+                    name = os.path.relpath(os.path.join(root, filename), directory)
+                    engine.get_template(name)
+                    count += 1
+    return count
+
+
+def get_active_topics(count):
+    """Ids of topics with the largest number of results, results are counted on every shard"""
+    counts = Counter()
+    for database in get_shards():
+        counts.update(dict(TopicResult.objects.using(database).order_by().values('topic_id').annotate(
+            results_count=Count('id')).values_list('topic_id', 'results_count')))
+    topic_ids = list(Topic.objects.filter(id__in=list(counts)).values_list('id', flat=True))
+    topic_ids = sorted(topic_ids, key=lambda topic_id: (-counts[topic_id], topic_id))[:count]
+    if len(topic_ids) < count:
+        topic_ids.extend(Topic.objects.exclude(id__in=topic_ids).order_by('id').values_list(
+            'id', flat=True)[:count - len(topic_ids)])
+    return topic_ids
+
+
+def preload_topics(count):
+    """Load content of the most active topics into cache"""
+    topic_ids = get_active_topics(count)
+    for topic_id in topic_ids:
+        load_topic_content(topic_id)
+    return len(topic_ids)
+
+
+def warm_up(topics_count=None):
+    """
+    Warm up current process: import views, compile templates and preload topics content.
+
+    topics_count - number of the most active topics to preload, WARMUP_TOPICS_COUNT by default
+    returns ordered dict with (processed items count, seconds spent) pairs by stage
+    """
+    if topics_count is None:
+        topics_count = settings.WARMUP_TOPICS_COUNT
+    stages = (
+        ('views', import_views, ()),
+        ('templates', compile_templates, ()),
+        ('topics', preload_topics, (topics_count,)),
+    )
+    timings = OrderedDict()
+    for name, func, args in stages:
+        started = time.perf_counter()
+        count = func(*args)
+        timings[name] = (count, time.perf_counter() - started)
+    return timings
@@ -0,0 +1,112 @@
+from functools import partial
+
+from django.conf.urls import url
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.utils.translation import ugettext_lazy as _
+
+from questions.models import Topic
+from stats.live import get_last_event_id, stream_events, stream_events_async
+from stats.models import TopicDailyStats
+from stats.summary import get_topic_summary
+from users.models import TopicResult
+from users.sharding import get_shards
+
+
+# Number of the latest results of topic shown on live page when it is opened
+LIVE_RESULTS_COUNT = 100
+
+
+class TopicDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ('day', 'topic', 'started', 'answered', 'finished', 'average_duration', 'average_score')
+    list_filter = ('topic',)
+    list_select_related = ('topic',)
+    date_hierarchy = 'day'
+
+    def get_urls(self):
+        return [
+            url(r'^summary/(?P<topic_id>\d+)/$', self.admin_site.admin_view(self.summary_view),
+                name='stats_topic_summary'),
+            url(r'^live/(?P<topic_id>\d+)/$', self.admin_site.admin_view(self.live_view),
+                name='stats_topic_live'),
+            url(r'^live/(?P<topic_id>\d+)/events/$', self.admin_site.admin_view(self.live_events_view),
+                name='stats_topic_live_events'),
+        ] + super().get_urls()
+
+    def summary_view(self, request, topic_id):
+        """Topic summary report: completion rate, scores and timing"""
+        if not self.has_change_permission(request):
+            return self.admin_site.login(request)
+        topic = get_object_or_404(Topic, pk=topic_id)
+        context = dict(
+            self.admin_site.each_context(request),
+            title=_('Summary of topic "%s"') % topic,
+            opts=self.model._meta,
+            topic=topic,
+            summary=get_topic_summary(topic.id),
+        )
+        return TemplateResponse(request, 'admin/stats/topic_summary.html', context)
+
+    def get_live_results(self, topic_id):
+        """The latest results of topic from every shard with usernames"""
+        results = []
+        for database in get_shards():
+            results.extend(TopicResult.objects.using(database).filter(topic_id=topic_id).order_by(
+                '-modified').values('id', 'user_id', 'modified', 'date_finished', 'result', 'cursor_answered')[
+                :LIVE_RESULTS_COUNT])
+        results = sorted(results, key=lambda result: result['modified'], reverse=True)[:LIVE_RESULTS_COUNT]
+        usernames = dict(get_user_model().objects.filter(
+            id__in=[result['user_id'] for result in results]).values_list('id', 'username'))
+        for result in results:
+            result['username'] = usernames.get(result['user_id'], result['user_id'])
+        return results
+
+    def live_view(self, request, topic_id):
+        """Live activity of topic, the page is updated by server-sent events instead of reloads"""
+        if not self.has_change_permission(request):
+            return self.admin_site.login(request)
+        topic = get_object_or_404(Topic, pk=topic_id)
+        # Events published while results are read are applied to them once more, it is harmless
+        last_event_id = get_last_event_id(topic.id)
+        context = dict(
+            self.admin_site.each_context(request),
+            title=_('Live activity of topic "%s"') % topic,
+            opts=self.model._meta,
+            topic=topic,
+            results=self.get_live_results(topic.id),
+            last_event_id=last_event_id,
+        )
+        return TemplateResponse(request, 'admin/stats/topic_live.html', context)
+
+    def live_events_view(self, request, topic_id):
+        """Stream of topic's attempt events: started, answered and finished"""
+        if not self.has_change_permission(request):
+            return self.admin_site.login(request)
+        last_event_id = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('last_event_id')
+        try:
+            last_event_id = max(int(last_event_id), 0)
+        except (TypeError, ValueError):
+            last_event_id = get_last_event_id(topic_id)
+        response = StreamingHttpResponse(stream_events(int(topic_id), last_event_id),
+                                         content_type='text/event-stream')
+        # ASGI application sends async stream instead, it doesn't hold thread (see core.asgi)
+        response.async_streaming_content = partial(stream_events_async, int(topic_id), last_event_id)
+        response['Cache-Control'] = 'no-cache'
+        # Proxy shouldn't buffer the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def get_readonly_fields(self, request, obj=None):
+        return [field.name for field in self.model._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(TopicDailyStats, TopicDailyStatsAdmin)
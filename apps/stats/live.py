@@ -0,0 +1,136 @@
+"""
+Live activity of topic: pub/sub of attempt events over shared cache
+
+Every published event gets next number of topic's sequence and is stored under its own key for
+LIVE_EVENTS_TIMEOUT seconds. Subscribers poll the sequence number and read new events with one get_many,
+so streams of many moderators don't touch database. Cache must be shared by all workers (memcached or redis),
+events published to local memory cache are seen only by streams of the same process.
+
+Stream of WSGI worker holds its thread while it waits for events, so number of such streams is limited
+by LIVE_MAX_STREAMS per process. ASGI application runs streams by event loop (see stream_events_async).
+"""
+import asyncio
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+LIVE_SEQUENCE_KEY = 'stats:topic:{}:live'
+LIVE_EVENT_KEY = 'stats:topic:{}:live:{}'
+# Maximal number of events read by subscriber at once, older events are skipped
+LIVE_EVENTS_BACKLOG = 500
+
+active_streams = 0
+streams_lock = threading.Lock()
+
+
+def get_sequence_key(topic_id):
+    return LIVE_SEQUENCE_KEY.format(topic_id)
+
+
+def get_event_key(topic_id, event_id):
+    return LIVE_EVENT_KEY.format(topic_id, event_id)
+
+
+def get_last_event_id(topic_id):
+    return cache.get(get_sequence_key(topic_id)) or 0
+
+
+def publish(topic_id, event):
+    """Publish event (JSON serializable dict) to subscribers of topic, returns event id"""
+    key = get_sequence_key(topic_id)
+    try:
+        event_id = cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        event_id = cache.incr(key)
+    cache.set(get_event_key(topic_id, event_id), event, settings.LIVE_EVENTS_TIMEOUT)
+    return event_id
+
+
+def read_events(topic_id, last_event_id):
+    """
+    List of (id, event) pairs of events published after last_event_id, expired events are skipped.
+    Event, which isn't stored yet by concurrent publisher, is read next time if there are no events after it.
+    """
+    current = get_last_event_id(topic_id)
+    if current <= last_event_id:
+        return []
+    event_ids = range(max(last_event_id + 1, current - LIVE_EVENTS_BACKLOG + 1), current + 1)
+    found = cache.get_many([get_event_key(topic_id, event_id) for event_id in event_ids])
+    return [
+        (event_id, found[get_event_key(topic_id, event_id)])
+        for event_id in event_ids if get_event_key(topic_id, event_id) in found
+    ]
+
+
+def format_event(event_id, event):
+    return 'id: {0}\nevent: {1}\ndata: {2}\n\n'.format(event_id, event['kind'], json.dumps(event))
+
+
+def poll_stream(topic_id, last_event_id, duration, interval):
+    """
+    Generator of server-sent events text of topic after last_event_id: pairs of text chunks read by one poll
+    of cache and flag of the end of stream, caller waits interval seconds between polls
+    """
+    deadline = time.monotonic() + duration
+    chunks = ['retry: {0}\n\n'.format(int(interval * 1000))]
+    while True:
+        events = read_events(topic_id, last_event_id)
+        for event_id, event in events:
+            chunks.append(format_event(event_id, event))
+            last_event_id = event_id
+        if time.monotonic() >= deadline:
+            yield chunks, True
+            return
+        if not events:
+            # Comment line, write to closed connection stops the stream
+            chunks.append(':\n\n')
+        yield chunks, False
+        chunks = []
+
+
+def stream_events(topic_id, last_event_id, duration=None, interval=None):
+    """
+    Generator of server-sent events text of topic after last_event_id, it ends after duration seconds,
+    then EventSource reconnects with Last-Event-ID header. When LIVE_MAX_STREAMS streams are already run
+    by process, client is only asked to reconnect after stream duration.
+    """
+    global active_streams
+    duration = settings.LIVE_STREAM_DURATION if duration is None else duration
+    interval = settings.LIVE_POLL_INTERVAL if interval is None else interval
+    with streams_lock:
+        busy = active_streams >= settings.LIVE_MAX_STREAMS
+        if not busy:
+            active_streams += 1
+    if busy:
+        yield 'retry: {0}\n\n'.format(int(max(duration, interval) * 1000))
+        return
+    try:
+        for chunks, done in poll_stream(topic_id, last_event_id, duration, interval):
+            yield from chunks
+            if not done:
+                time.sleep(interval)
+    finally:
+        with streams_lock:
+            active_streams -= 1
+
+
+async def stream_events_async(topic_id, last_event_id, run, duration=None, interval=None):
+    """
+    Async generator of the same stream for ASGI application, it waits by event loop without thread,
+    run - coroutine function running blocking function in thread pool, cache is read with it
+    """
+    duration = settings.LIVE_STREAM_DURATION if duration is None else duration
+    interval = settings.LIVE_POLL_INTERVAL if interval is None else interval
+    polls = poll_stream(topic_id, last_event_id, duration, interval)
+    while True:
+        chunks, done = await run(next, polls)
+        for chunk in chunks:
+            yield chunk
+        if done:
+            return
+        await asyncio.sleep(interval)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from stats.rollup import rollup, BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Fold new attempt events into daily topic aggregates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Events count per transaction')
+
+    def handle(self, *args, **options):
+        count = rollup(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('{} events were folded'.format(count)))
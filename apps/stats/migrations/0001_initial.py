@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.4 on 2026-10-19 01:33
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('questions', '0002_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttemptEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'Started'), (2, 'Answered'), (3, 'Finished')])),
+                ('created', models.DateTimeField()),
+                ('topic_id', models.IntegerField()),
+                ('topic_result_id', models.IntegerField()),
+                ('user_id', models.IntegerField()),
+                ('duration', models.PositiveIntegerField(blank=True, null=True)),
+                ('score', models.PositiveIntegerField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Attempt Event',
+                'verbose_name_plural': 'Attempt Events',
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('last_event_id', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TopicDailyDuration',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('bucket', models.PositiveIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_durations', to='questions.Topic')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TopicDailyStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('started', models.PositiveIntegerField(default=0)),
+                ('answered', models.PositiveIntegerField(default=0)),
+                ('finished', models.PositiveIntegerField(default=0)),
+                ('duration_sum', models.PositiveIntegerField(default=0)),
+                ('score_sum', models.PositiveIntegerField(default=0)),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='questions.Topic')),
+            ],
+            options={
+                'verbose_name': 'Topic Daily Statistics',
+                'verbose_name_plural': 'Topic Daily Statistics',
+                'ordering': ('-day', 'topic'),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='topicdailystats',
+            unique_together=set([('topic', 'day')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='topicdailyduration',
+            unique_together=set([('topic', 'day', 'bucket')]),
+        ),
+    ]
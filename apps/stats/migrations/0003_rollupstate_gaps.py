@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.4 on 2026-10-19 03:01
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0002_scoring'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rollupstate',
+            name='gaps',
+            field=models.TextField(blank=True, default='{}'),
+        ),
+    ]
@@ -0,0 +1,194 @@
+from django.db import models, transaction
+from django.db.models.signals import post_init, post_save
+from django.utils.translation import ugettext_lazy as _
+
+from questions.models import Topic
+from stats.live import publish
+from stats.summary import invalidate_summary
+from users.models import TopicResult, UserAnswer
+
+
+class AttemptEvent(models.Model):
+
+    """
+    Append-only log of attempts events, it is never updated and is read only by rollups,
+    events are written on shard database of their attempt
+
+    kind - type of event
+    topic_id, topic_result_id, user_id - ids of attempt's objects, not foreign keys to keep writes cheap
+    duration - seconds from attempt start till finish, for finish events
+    score - score of attempt, for finish events
+    """
+
+    KIND_STARTED = 1
+    KIND_ANSWERED = 2
+    KIND_FINISHED = 3
+    KINDS = (
+        (KIND_STARTED, _('Started')),
+        (KIND_ANSWERED, _('Answered')),
+        (KIND_FINISHED, _('Finished')),
+    )
+
+    kind = models.PositiveSmallIntegerField(choices=KINDS)
+    created = models.DateTimeField()
+    topic_id = models.IntegerField()
+    topic_result_id = models.IntegerField()
+    user_id = models.IntegerField()
+    duration = models.PositiveIntegerField(blank=True, null=True)
+    score = models.FloatField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = _('Attempt Event')
+        verbose_name_plural = _('Attempt Events')
+
+    def __str__(self):
+        return '{0} #{1}'.format(self.get_kind_display(), self.topic_result_id)
+
+    @classmethod
+    def log(cls, kind, topic_result, created, **kwargs):
+        return cls.objects.using(topic_result._state.db).create(
+            kind=kind,
+            created=created,
+            topic_id=topic_result.topic_id,
+            topic_result_id=topic_result.id,
+            user_id=topic_result.user_id,
+            **kwargs
+        )
+
+
+class TopicDailyStats(models.Model):
+
+    """
+    Daily aggregates of topic attempts, folded from events by rollup
+
+    started - started attempts count
+    answered - answers count
+    finished - finished attempts count
+    duration_sum - total seconds spent on finished attempts
+    score_sum - total score of finished attempts
+    """
+
+    topic = models.ForeignKey(Topic, related_name='daily_stats')
+    day = models.DateField()
+    started = models.PositiveIntegerField(default=0)
+    answered = models.PositiveIntegerField(default=0)
+    finished = models.PositiveIntegerField(default=0)
+    duration_sum = models.PositiveIntegerField(default=0)
+    score_sum = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('topic', 'day')
+        ordering = ('-day', 'topic')
+        verbose_name = _('Topic Daily Statistics')
+        verbose_name_plural = _('Topic Daily Statistics')
+
+    def __str__(self):
+        return '{0} - {1}'.format(self.topic_id, self.day)
+
+    @property
+    def average_duration(self):
+        if self.finished:
+            return self.duration_sum / self.finished
+        return None
+
+    @property
+    def average_score(self):
+        if self.finished:
+            return self.score_sum / self.finished
+        return None
+
+
+class TopicDailyDuration(models.Model):
+
+    """
+    Histogram of finished attempts durations by day, used for median calculation
+
+    bucket - lower bound of durations bucket in seconds, one of DURATION_BUCKETS
+    """
+
+    DURATION_BUCKETS = (
+        0, 30, 60, 120, 180, 300, 450, 600, 900, 1200, 1800, 2700, 3600, 5400, 7200, 14400, 28800, 86400
+    )
+
+    topic = models.ForeignKey(Topic, related_name='daily_durations')
+    day = models.DateField()
+    bucket = models.PositiveIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('topic', 'day', 'bucket')
+
+    def __str__(self):
+        return '{0} - {1} - {2}'.format(self.topic_id, self.day, self.bucket)
+
+    @classmethod
+    def get_bucket(cls, duration):
+        bucket = 0
+        for bound in cls.DURATION_BUCKETS:
+            if duration < bound:
+                break
+            bucket = bound
+        return bucket
+
+
+class RollupState(models.Model):
+
+    """
+    High-water mark of rollup: id of the last event, which was folded into aggregates
+
+    gaps - JSON object of missing ids below the mark with time they were found, ids are allocated on insert,
+    but rows are visible on commit, so events of slower transactions can appear below the mark later
+    """
+
+    name = models.CharField(max_length=64, unique=True)
+    last_event_id = models.PositiveIntegerField(default=0)
+    gaps = models.TextField(blank=True, default='{}')
+
+    def __str__(self):
+        return '{0}: {1}'.format(self.name, self.last_event_id)
+
+
+def topic_result_post_init(sender, instance, *args, **kwargs):
+    # Save original finish date
+    instance._orig_date_finished = instance.date_finished
+
+
+def publish_live_event(kind, topic_result, **kwargs):
+    """Publish compact event to live stream of topic after commit of attempt's transaction"""
+    event = dict(kind=kind, result=topic_result.id, user=topic_result.user_id, **kwargs)
+    transaction.on_commit(lambda: publish(topic_result.topic_id, event), using=topic_result._state.db)
+
+
+def topic_result_post_save(sender, instance, created, raw=False, *args, **kwargs):
+    if raw:
+        return
+    if created:
+        AttemptEvent.log(AttemptEvent.KIND_STARTED, instance, instance.created)
+        publish_live_event('started', instance)
+    if instance.date_finished and not instance._orig_date_finished:
+        # Score is snapshotted into result on finish
+        AttemptEvent.log(
+            AttemptEvent.KIND_FINISHED, instance, instance.date_finished,
+            duration=max(int((instance.date_finished - instance.created).total_seconds()), 0),
+            score=instance.result
+        )
+        publish_live_event('finished', instance, score=instance.result)
+        # Summary isn't rebuilt from data of uncommitted attempt
+        topic_id = instance.topic_id
+        transaction.on_commit(lambda: invalidate_summary(topic_id), using=instance._state.db)
+    instance._orig_date_finished = instance.date_finished
+
+
+def user_answer_post_save(sender, instance, created, raw=False, *args, **kwargs):
+    if created and not raw:
+        topic_result = instance.topic_result
+        AttemptEvent.log(AttemptEvent.KIND_ANSWERED, topic_result, instance.created)
+        # Answers count is kept by progress cursor, it is counted only if cursor is stale
+        answered = topic_result.cursor_answered if topic_result.cursor_version is not None else \
+            topic_result.get_active_answers().count()
+        publish_live_event('answered', topic_result, answered=answered)
+
+
+post_init.connect(topic_result_post_init, sender=TopicResult)
+post_save.connect(topic_result_post_save, sender=TopicResult)
+post_save.connect(user_answer_post_save, sender=UserAnswer)
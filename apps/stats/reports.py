@@ -0,0 +1,51 @@
+from django.db.models import Sum
+
+from stats.models import TopicDailyStats, TopicDailyDuration
+
+
+def get_daily_stats(topic_id, date_from=None, date_to=None):
+    """Daily aggregates of topic for period"""
+    queryset = TopicDailyStats.objects.filter(topic_id=topic_id)
+    if date_from:
+        queryset = queryset.filter(day__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(day__lte=date_to)
+    return queryset.order_by('day')
+
+
+def get_totals(topic_id, date_from=None, date_to=None):
+    """Sums of topic aggregates for period"""
+    return get_daily_stats(topic_id, date_from, date_to).aggregate(
+        started=Sum('started'),
+        answered=Sum('answered'),
+        finished=Sum('finished'),
+        duration_sum=Sum('duration_sum'),
+        score_sum=Sum('score_sum'),
+    )
+
+
+def get_median_duration(topic_id, date_from=None, date_to=None):
+    """
+    Median seconds spent on finished attempts for period, estimated from durations histogram
+
+    returns None if there are no finished attempts
+    """
+    queryset = TopicDailyDuration.objects.filter(topic_id=topic_id)
+    if date_from:
+        queryset = queryset.filter(day__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(day__lte=date_to)
+    buckets = list(queryset.values_list('bucket').annotate(total=Sum('count')).order_by('bucket'))
+    total = sum(count for bucket, count in buckets)
+    if not total:
+        return None
+    bounds = TopicDailyDuration.DURATION_BUCKETS
+    half = total / 2
+    passed = 0
+    for bucket, count in buckets:
+        if passed + count >= half:
+            # Linear interpolation inside of bucket
+            index = bounds.index(bucket)
+            upper = bounds[index + 1] if index + 1 < len(bounds) else bucket
+            return bucket + (upper - bucket) * (half - passed) / count
+        passed += count
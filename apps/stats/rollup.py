@@ -0,0 +1,124 @@
+import json
+from collections import defaultdict
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from questions.models import Topic
+from stats.models import AttemptEvent, RollupState, TopicDailyStats, TopicDailyDuration
+from users.sharding import get_shards
+
+
+ROLLUP_NAME = 'topic_daily'
+BATCH_SIZE = 5000
+# Missing ids are waited for this time, then they are considered to be ids of rolled back transactions
+GAP_TIMEOUT = 3600
+# Larger jumps of ids aren't tracked, they are caused by sequence changes, not by concurrent transactions
+MAX_GAPS = 1000
+# Ids of gaps are queried by chunks, SQLite limits number of query parameters
+GAPS_CHUNK_SIZE = 500
+EVENT_FIELDS = ('id', 'kind', 'created', 'topic_id', 'duration', 'score')
+
+
+def aggregate_events(events):
+    """
+    Aggregate events by topic and day
+
+    returns pair of dicts: stats increments by (topic_id, day) and durations counts by (topic_id, day, bucket)
+    """
+    stats = defaultdict(lambda: defaultdict(int))
+    durations = defaultdict(int)
+    for kind, created, topic_id, duration, score in events:
+        key = (topic_id, timezone.localtime(created).date())
+        if kind == AttemptEvent.KIND_STARTED:
+            stats[key]['started'] += 1
+        elif kind == AttemptEvent.KIND_ANSWERED:
+            stats[key]['answered'] += 1
+        elif kind == AttemptEvent.KIND_FINISHED:
+            stats[key]['finished'] += 1
+            stats[key]['duration_sum'] += duration or 0
+            stats[key]['score_sum'] += score or 0
+            durations[key + (TopicDailyDuration.get_bucket(duration or 0),)] += 1
+    return stats, durations
+
+
+def increment(model, lookup, values):
+    """Add values to aggregate row, row is created if it doesn't exist"""
+    updated = model.objects.filter(**lookup).update(**{
+        field: F(field) + value for field, value in values.items()
+    })
+    if not updated:
+        model.objects.create(**dict(lookup, **values))
+
+
+def get_gaps(state, event_ids, last_event_id, now):
+    """
+    Ids missing below the new high-water mark by time they were found, ids of folded events
+    and expired ones are removed
+    """
+    found = set(event_ids)
+    gaps = {
+        int(event_id): found_time for event_id, found_time in json.loads(state.gaps or '{}').items()
+        if int(event_id) not in found and now - found_time < GAP_TIMEOUT
+    }
+    if last_event_id - state.last_event_id <= MAX_GAPS:
+        for event_id in range(state.last_event_id + 1, last_event_id):
+            if event_id not in found:
+                gaps.setdefault(event_id, now)
+    return gaps
+
+
+def get_rollup_name(using):
+    """Name of high-water mark of events on shard database, ids of events are allocated by every shard"""
+    if using == DEFAULT_DB_ALIAS:
+        return ROLLUP_NAME
+    return '{0}:{1}'.format(ROLLUP_NAME, using)
+
+
+def rollup_batch(batch_size=BATCH_SIZE, using=DEFAULT_DB_ALIAS):
+    """
+    Fold next batch of events on shard database and events, which appeared below its high-water mark,
+    into daily aggregates, returns number of folded events
+    """
+    with transaction.atomic():
+        state, _ = RollupState.objects.get_or_create(name=get_rollup_name(using))
+        # Lock high-water mark, so concurrent rollups do not fold the same events twice
+        state = RollupState.objects.select_for_update().get(id=state.id)
+        gap_ids = sorted(int(event_id) for event_id in json.loads(state.gaps or '{}'))
+        events = []
+        for start in range(0, len(gap_ids), GAPS_CHUNK_SIZE):
+            events.extend(AttemptEvent.objects.using(using).filter(
+                id__in=gap_ids[start:start + GAPS_CHUNK_SIZE]).order_by('id').values_list(*EVENT_FIELDS))
+        late_count = len(events)
+        events.extend(AttemptEvent.objects.using(using).filter(
+            id__gt=state.last_event_id
+        ).order_by('id').values_list(*EVENT_FIELDS)[:batch_size])
+        last_event_id = events[-1][0] if len(events) > late_count else state.last_event_id
+        gaps = get_gaps(state, [event[0] for event in events], last_event_id, timezone.now().timestamp())
+        if events:
+            # Events of deleted topics are skipped
+            topic_ids = set(Topic.objects.filter(
+                id__in={event[3] for event in events}).values_list('id', flat=True))
+            stats, durations = aggregate_events(event[1:] for event in events if event[3] in topic_ids)
+            for (topic_id, day), values in stats.items():
+                increment(TopicDailyStats, {'topic_id': topic_id, 'day': day}, values)
+            for (topic_id, day, bucket), count in durations.items():
+                increment(
+                    TopicDailyDuration, {'topic_id': topic_id, 'day': day, 'bucket': bucket}, {'count': count})
+        state.last_event_id = last_event_id
+        state.gaps = json.dumps({str(event_id): found_time for event_id, found_time in sorted(gaps.items())})
+        state.save(update_fields=['last_event_id', 'gaps'])
+    return len(events)
+
+
+def rollup(batch_size=BATCH_SIZE):
+    """Fold all new events of every shard into daily aggregates, returns number of folded events"""
+    total = 0
+    for database in get_shards():
+        while True:
+            count = rollup_batch(batch_size, database)
+            total += count
+            if count < batch_size:
+                break
+    return total
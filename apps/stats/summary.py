@@ -0,0 +1,113 @@
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Count
+from django.db.models.expressions import RawSQL
+
+from users.models import ArchivedTopicResult, TopicResult
+from users.sharding import get_shards
+
+
+SUMMARY_KEY = 'stats:topic:{}:summary'
+SUMMARY_TIMEOUT = 60
+
+# SQL of minutes spent on attempt by database vendor, formatted with results table name
+DURATION_MINUTES_SQL = {
+    'postgresql': 'FLOOR(EXTRACT(EPOCH FROM ("{table}"."date_finished" - "{table}"."created")) / 60)',
+    'sqlite': 'CAST(ROUND((julianday("{table}"."date_finished") - '
+              'julianday("{table}"."created")) * 86400) AS INTEGER) / 60',
+    'mysql': 'TIMESTAMPDIFF(MINUTE, `{table}`.`created`, `{table}`.`date_finished`)',
+}
+
+
+def get_summary_key(topic_id):
+    return SUMMARY_KEY.format(topic_id)
+
+
+def invalidate_summary(topic_id):
+    cache.delete(get_summary_key(topic_id))
+
+
+def get_median(histogram):
+    """
+    Median of values by histogram, histogram - sorted list of (value, count) pairs
+    """
+    total = sum(count for value, count in histogram)
+    if not total:
+        return None
+    passed = 0
+    lower = None
+    for value, count in histogram:
+        passed += count
+        if lower is None and passed * 2 >= total:
+            lower = value
+            if passed * 2 > total:
+                return lower
+        elif lower is not None:
+            return (lower + value) / 2
+    return lower
+
+
+def get_finished_histogram(results):
+    """
+    Counts of finished results grouped by score and minutes spent, single GROUP BY query
+    """
+    sql = DURATION_MINUTES_SQL[connections[results.db].vendor].format(table=results.model._meta.db_table)
+    return list(results.filter(date_finished__isnull=False).annotate(
+        minutes=RawSQL(sql, ())
+    ).values_list('result', 'minutes').annotate(count=Count('id')).order_by())
+
+
+def build_summary(topic_id, results=None, archived_results=None):
+    """
+    Build topic summary: starts, completions, scores and durations distribution of live and archived results
+
+    results - queryset or list of querysets of live results, by default results of every shard are merged
+    """
+    if results is None:
+        results = [TopicResult.objects.using(database) for database in get_shards()]
+    elif not isinstance(results, (list, tuple)):
+        results = [results]
+    if archived_results is None:
+        archived_results = ArchivedTopicResult.objects.all()
+    starts = 0
+    scores = defaultdict(int)
+    minutes = defaultdict(int)
+    for queryset in [queryset.filter(topic_id=topic_id) for queryset in results] + [
+            archived_results.filter(topic_id=topic_id)]:
+        starts += queryset.count()
+        for result, duration, count in get_finished_histogram(queryset):
+            scores[result] += count
+            minutes[max(int(duration), 0)] += count
+    return summarize(starts, scores, minutes)
+
+
+def summarize(starts, scores, minutes):
+    """
+    Summary by starts count, completions count by score and completions count by minutes spent
+    """
+    completions = sum(scores.values())
+    score_histogram = sorted(scores.items())
+    max_count = max(scores.values()) if scores else 0
+    return {
+        'starts': starts,
+        'completions': completions,
+        'completion_rate': completions / starts * 100 if starts else None,
+        'mean_score': sum(score * count for score, count in score_histogram) / completions if completions else None,
+        'median_score': get_median(score_histogram),
+        'score_histogram': [
+            (score, count, count / max_count * 100) for score, count in score_histogram
+        ],
+        'median_minutes': get_median(sorted(minutes.items())),
+    }
+
+
+def get_topic_summary(topic_id):
+    """Cached topic summary, cache is invalidated by new completions"""
+    key = get_summary_key(topic_id)
+    summary = cache.get(key)
+    if summary is None:
+        summary = build_summary(topic_id)
+        cache.set(key, summary, SUMMARY_TIMEOUT)
+    return summary
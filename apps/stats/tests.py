@@ -0,0 +1,224 @@
+import json
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from model_mommy import mommy
+
+from questions.models import (
+    Answer,
+    Question,
+    TopicQuestionRelation,
+    Topic
+)
+from stats.live import get_event_key, publish, read_events, stream_events
+from stats.models import AttemptEvent, RollupState, TopicDailyStats
+from stats.reports import get_median_duration, get_totals
+from stats.rollup import rollup, ROLLUP_NAME
+from stats.summary import get_topic_summary, get_median
+from users.models import (
+    User,
+    TopicResult,
+    UserAnswer
+)
+
+
+class AttemptEventsTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = mommy.make(User, username='test', password='123')
+        self.topic = mommy.make(Topic)
+        self.question = mommy.make(Question, text='question1', qtype=Question.QTYPE_RADIO)
+        self.answer = mommy.make(Answer, question=self.question, text='answer1', is_correct=True)
+        mommy.make(TopicQuestionRelation, question=self.question, topic=self.topic, order=0, active=True)
+
+    def test_events_log(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('topic-detail', kwargs={'pk': self.topic.pk}))
+        self.client.post(
+            reverse('question-detail', kwargs={'pk': self.topic.pk, 'number': 1}), data={'answer': self.answer.id})
+
+        topic_result = TopicResult.objects.get(topic=self.topic, user=self.user)
+        self.assertEqual(list(AttemptEvent.objects.order_by('id').values_list('kind', flat=True)), [
+            AttemptEvent.KIND_STARTED, AttemptEvent.KIND_ANSWERED, AttemptEvent.KIND_FINISHED
+        ])
+        finished = AttemptEvent.objects.get(kind=AttemptEvent.KIND_FINISHED)
+        self.assertEqual(finished.topic_result_id, topic_result.id)
+        self.assertEqual(finished.score, 1)
+
+        # Following saves do not log finish again
+        topic_result.save()
+        self.assertEqual(AttemptEvent.objects.filter(kind=AttemptEvent.KIND_FINISHED).count(), 1)
+
+    def test_rollup(self):
+        now = timezone.now()
+        users = mommy.make(User, _quantity=3)
+        for index, user in enumerate(users):
+            result = mommy.make(TopicResult, topic=self.topic, user=user)
+            mommy.make(UserAnswer, topic_result=result, question=self.question, answers=[self.answer])
+            if index:
+                result.date_finished = result.created + timedelta(seconds=100 * index)
+                result.result = result.get_score()
+                result.save()
+
+        self.assertEqual(rollup(batch_size=2), 8)
+        self.assertEqual(RollupState.objects.get(name=ROLLUP_NAME).last_event_id, AttemptEvent.objects.latest('id').id)
+        stats = TopicDailyStats.objects.get(topic=self.topic, day=timezone.localtime(now).date())
+        self.assertEqual((stats.started, stats.answered, stats.finished), (3, 3, 2))
+        self.assertEqual(stats.average_duration, 150)
+        self.assertEqual(stats.average_score, 1)
+
+        # Only new events are folded
+        self.assertEqual(rollup(), 0)
+        result = mommy.make(TopicResult, topic=self.topic, user=self.user)
+        result.date_finished = result.created + timedelta(seconds=1000)
+        result.save()
+        self.assertEqual(rollup(), 2)
+
+        totals = get_totals(self.topic.id)
+        self.assertEqual((totals['started'], totals['finished'], totals['duration_sum']), (4, 3, 1300))
+        median = get_median_duration(self.topic.id)
+        self.assertTrue(180 <= median <= 300)
+        self.assertIsNone(get_median_duration(mommy.make(Topic).id))
+
+    def test_rollup_late_commit(self):
+        result = mommy.make(TopicResult, topic=self.topic, user=self.user)
+        events = [AttemptEvent.log(AttemptEvent.KIND_ANSWERED, result, timezone.now()) for _ in range(3)]
+        # Event with lower id of slower transaction isn't visible yet, when events after it are folded
+        AttemptEvent.objects.filter(id=events[1].id).delete()
+        self.assertEqual(rollup(), 3)
+        state = RollupState.objects.get(name=ROLLUP_NAME)
+        self.assertEqual(state.last_event_id, events[2].id)
+        self.assertEqual(list(json.loads(state.gaps)), [str(events[1].id)])
+
+        events[1].save(force_insert=True)
+        self.assertEqual(rollup(), 1)
+        self.assertEqual(TopicDailyStats.objects.get(topic=self.topic).answered, 3)
+        self.assertEqual(json.loads(RollupState.objects.get(name=ROLLUP_NAME).gaps), {})
+        self.assertEqual(rollup(), 0)
+
+        # Ids of rolled back transactions are forgotten after timeout
+        RollupState.objects.filter(name=ROLLUP_NAME).update(gaps=json.dumps({str(events[2].id + 100): 0}))
+        self.assertEqual(rollup(), 0)
+        self.assertEqual(json.loads(RollupState.objects.get(name=ROLLUP_NAME).gaps), {})
+
+
+class TopicSummaryTestCase(TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.topic = mommy.make(Topic)
+        now = timezone.now()
+        for result, minutes in ((1, 10), (2, 20), (2, 30), (3, 40)):
+            topic_result = mommy.make(TopicResult, topic=self.topic, result=result, date_finished=now)
+            # Creation time is set automatically on save
+            TopicResult.objects.filter(id=topic_result.id).update(created=now - timedelta(minutes=minutes))
+        mommy.make(TopicResult, topic=self.topic, date_finished=None)
+
+    def test_median(self):
+        self.assertEqual(get_median([(1, 1), (2, 1), (3, 1)]), 2)
+        self.assertEqual(get_median([(1, 2), (3, 2)]), 2)
+        self.assertEqual(get_median([(1, 1), (3, 3)]), 3)
+        self.assertIsNone(get_median([]))
+
+    def test_summary(self):
+        # Count and histogram of live and archived results
+        with self.assertNumQueries(4):
+            summary = get_topic_summary(self.topic.id)
+        self.assertEqual(summary['starts'], 5)
+        self.assertEqual(summary['completions'], 4)
+        self.assertEqual(summary['completion_rate'], 80)
+        self.assertEqual(summary['mean_score'], 2)
+        self.assertEqual(summary['median_score'], 2)
+        self.assertEqual([row[:2] for row in summary['score_histogram']], [(1, 1), (2, 2), (3, 1)])
+        self.assertEqual(summary['median_minutes'], 25)
+
+        with self.assertNumQueries(0):
+            get_topic_summary(self.topic.id)
+
+        # New completion invalidates summary after commit
+        result = TopicResult.objects.get(topic=self.topic, date_finished__isnull=True)
+        with transaction.atomic():
+            result.date_finished = timezone.now()
+            result.save()
+            self.assertEqual(get_topic_summary(self.topic.id)['completions'], 4)
+        self.assertEqual(get_topic_summary(self.topic.id)['completions'], 5)
+
+    def test_admin_view(self):
+        self.client.force_login(mommy.make(User, username='admin', is_staff=True, is_superuser=True))
+        response = self.client.get(reverse('admin:stats_topic_summary', args=(self.topic.id,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '80%')
+
+
+class LiveActivityTestCase(TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = mommy.make(User, username='learner', password='123')
+        self.topic = mommy.make(Topic)
+        self.question = mommy.make(Question, text='question1', qtype=Question.QTYPE_RADIO)
+        self.answer = mommy.make(Answer, question=self.question, text='answer1', is_correct=True)
+        mommy.make(TopicQuestionRelation, question=self.question, topic=self.topic, order=0, active=True)
+
+    def test_pubsub(self):
+        self.assertEqual(read_events(self.topic.id, 0), [])
+        for number in range(3):
+            publish(self.topic.id, {'kind': 'answered', 'answered': number})
+        # Event, which isn't stored yet, is read next time
+        cache.delete(get_event_key(self.topic.id, 3))
+        self.assertEqual([event_id for event_id, event in read_events(self.topic.id, 0)], [1, 2])
+        # Expired event is skipped
+        cache.delete(get_event_key(self.topic.id, 2))
+        publish(self.topic.id, {'kind': 'finished', 'score': 1})
+        self.assertEqual([event_id for event_id, event in read_events(self.topic.id, 1)], [4])
+
+        chunks = list(stream_events(self.topic.id, 3, duration=0, interval=0))
+        self.assertEqual(chunks[0], 'retry: 0\n\n')
+        self.assertEqual(chunks[1], 'id: 4\nevent: finished\ndata: {"kind": "finished", "score": 1}\n\n')
+
+    @override_settings(LIVE_STREAM_DURATION=0)
+    def test_attempt_events(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('topic-detail', kwargs={'pk': self.topic.pk}))
+        self.client.post(
+            reverse('question-detail', kwargs={'pk': self.topic.pk, 'number': 1}), data={'answer': self.answer.id})
+        topic_result = TopicResult.objects.get(topic=self.topic, user=self.user)
+        events = [event for event_id, event in read_events(self.topic.id, 0)]
+        self.assertEqual(events, [
+            {'kind': 'started', 'result': topic_result.id, 'user': self.user.id},
+            {'kind': 'answered', 'result': topic_result.id, 'user': self.user.id, 'answered': 1},
+            {'kind': 'finished', 'result': topic_result.id, 'user': self.user.id, 'score': 1},
+        ])
+
+        url = reverse('admin:stats_topic_live_events', args=(self.topic.id,))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(mommy.make(User, username='admin', is_staff=True, is_superuser=True))
+        response = self.client.get(reverse('admin:stats_topic_live', args=(self.topic.id,)))
+        self.assertContains(response, 'learner')
+        self.assertContains(response, '?last_event_id=3')
+
+        response = self.client.get(url, HTTP_LAST_EVENT_ID='1')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = b''.join(response.streaming_content).decode()
+        self.assertNotIn('event: started', content)
+        self.assertIn('id: 3\nevent: finished', content)
+
+    @override_settings(LIVE_STREAM_DURATION=0, LIVE_MAX_STREAMS=1)
+    def test_streams_limit(self):
+        publish(self.topic.id, {'kind': 'started'})
+        stream = stream_events(self.topic.id, 0, interval=0)
+        self.assertEqual(next(stream), 'retry: 0\n\n')
+        # Other client is asked to reconnect later
+        self.assertEqual(list(stream_events(self.topic.id, 0, duration=10, interval=0)), ['retry: 10000\n\n'])
+        self.assertIn('event: started', ''.join(stream))
+        self.assertEqual(len(list(stream_events(self.topic.id, 0, interval=0))), 2)
@@ -1,30 +1,243 @@
-from django.contrib import admin
+import io
+
+from django import forms
+from django.conf import settings
+from django.conf.urls import url
+from django.contrib import admin, messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.forms.models import BaseInlineFormSet
+from django.template.response import TemplateResponse
+from django.utils.translation import ugettext_lazy as _
+
+from questions.models import Answer, Topic
+from users.grading import start_job
+from users.models import ArchivedTopicResult, TopicResult, UserAnswer, RegradeJob, ScoreChange
+from users.provisioning import import_users, read_rows
+from users.sharding import get_shards
+
+
+class RegradeActionMixin(object):
+
+    def message_regrade_job(self, request, job):
+        if job.status == RegradeJob.STATUS_DONE:
+            self.message_user(request, _('%(job)s is done: %(changed)d of %(processed)d results were changed.') % {
+                'job': job, 'changed': job.changed, 'processed': job.processed})
+        else:
+            self.message_user(request, _('%(job)s is created, run "./manage.py regrade --job %(id)d" '
+                                         'to process it.') % {'job': job, 'id': job.id})
+
 
-from users.models import TopicResult, UserAnswer
+class UserImportForm(forms.Form):
+    file = forms.FileField(
+        label=_('CSV file'), help_text=_('Columns: username, email, password, first_name, last_name, topics'))
+    topics = forms.ModelMultipleChoiceField(
+        Topic.objects.order_by('title'), label=_('Assigned topics'), required=False)
+    verified = forms.BooleanField(label=_('Email addresses are verified'), required=False)
 
 
 class UserAdmin(BaseUserAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff')
     list_filter = ('is_staff', 'is_superuser', 'is_active')
 
+    def get_urls(self):
+        return [
+            url(r'^import/$', self.admin_site.admin_view(self.import_view), name='users_user_import'),
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        """Upload of CSV file with users, report of import lists errors of skipped rows"""
+        if not self.has_add_permission(request):
+            return self.admin_site.login(request)
+        report = None
+        form = UserImportForm(request.POST or None, request.FILES or None)
+        if form.is_valid():
+            stream = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8-sig', newline='')
+            try:
+                report = import_users(
+                    read_rows(stream), topic_ids=[topic.id for topic in form.cleaned_data['topics']],
+                    verified=form.cleaned_data['verified'], workers=settings.USER_IMPORT_WORKERS)
+            except (ValueError, UnicodeDecodeError) as error:
+                form.add_error('file', str(error))
+            else:
+                self.message_user(request, _(
+                    '%(users)d users and %(results)d results were created, %(errors)d rows were skipped.'
+                ) % {'users': report.users, 'results': report.results, 'errors': len(report.errors)},
+                    messages.WARNING if report.errors else messages.SUCCESS)
+        context = dict(
+            self.admin_site.each_context(request),
+            title=_('Import users'),
+            opts=self.model._meta,
+            form=form,
+            report=report,
+        )
+        return TemplateResponse(request, 'admin/users/user_import.html', context)
+
+
+class ShardListFilter(admin.SimpleListFilter):
+
+    """
+    Choice of shard database of changelist, the first shard is shown by default
+    """
+
+    title = _('shard')
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        return [(shard, shard) for shard in get_shards()]
+
+    def queryset(self, request, queryset):
+        # Database is chosen by ShardAdminMixin.get_queryset
+        return queryset
+
+    def choices(self, changelist):
+        value = self.value() if self.value() in get_shards() else get_shards()[0]
+        for lookup, title in self.lookup_choices:
+            yield {
+                'selected': value == lookup,
+                'query_string': changelist.get_query_string({self.parameter_name: lookup}, []),
+                'display': title,
+            }
+
+
+class ShardAdminMixin(object):
+
+    """
+    Admin of attempts model: changelist shows results of one shard chosen by filter, objects are looked up
+    on every shard. Related users and topics are prefetched from default database instead of join.
+    """
+
+    list_select_related = ()
+    prefetch_fields = ()
+    # Total count of unfiltered changelist would be the count of one shard too
+    show_full_result_count = False
+
+    def get_shard(self, request):
+        shard = request.GET.get(ShardListFilter.parameter_name)
+        return shard if shard in get_shards() else get_shards()[0]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).using(self.get_shard(request)).prefetch_related(*self.prefetch_fields)
+
+    def get_object(self, request, object_id, from_field=None):
+        queryset = super().get_queryset(request)
+        field = self.model._meta.pk if from_field is None else self.model._meta.get_field(from_field)
+        try:
+            object_id = field.to_python(object_id)
+        except (ValidationError, ValueError):
+            return None
+        for shard in get_shards():
+            obj = queryset.using(shard).filter(**{field.name: object_id}).first()
+            if obj is not None:
+                return obj
+        return None
+
 
-class UserAnswerAdminInline(admin.TabularInline):
+class ShardInlineFormSet(BaseInlineFormSet):
+
+    """Inline formset of attempts, which are read from database of parent object"""
+
+    def __init__(self, *args, **kwargs):
+        instance = kwargs.get('instance')
+        if instance is not None and instance._state.db and kwargs.get('queryset') is not None:
+            kwargs['queryset'] = kwargs['queryset'].using(instance._state.db)
+        super().__init__(*args, **kwargs)
+
+
+class ChosenAnswersMixin(object):
+
+    def chosen_answers(self, obj):
+        # Chosen answers are on shard database of user answer, so they can't be joined with answers table
+        answer_ids = UserAnswer.answers.through.objects.using(obj._state.db).filter(
+            useranswer_id=obj.id).values_list('answer_id', flat=True)
+        return ', '.join(str(answer) for answer in Answer.objects.filter(id__in=list(answer_ids)))
+    chosen_answers.short_description = _('Answers')
+
+
+class UserAnswerAdminInline(ChosenAnswersMixin, admin.TabularInline):
     model = UserAnswer
+    formset = ShardInlineFormSet
+    fields = ('question', 'chosen_answers')
+    readonly_fields = ('chosen_answers',)
     extra = 0
 
 
-class TopicResultAdmin(admin.ModelAdmin):
+class TopicResultAdmin(RegradeActionMixin, ShardAdminMixin, admin.ModelAdmin):
     inlines = [UserAnswerAdminInline]
-    list_display = ('topic', 'user', 'date_finished')
+    list_display = ('topic', 'user', 'result', 'date_finished')
+    list_filter = (ShardListFilter,)
+    prefetch_fields = ('topic', 'user')
     search_fields = ('topic__title', 'user__username', 'user__first_name', 'user__last_name')
+    actions = ['regrade']
+
+    def get_search_results(self, request, queryset, search_term):
+        # Topics and users are searched on default database, results are filtered by their ids
+        if not search_term:
+            return queryset, False
+        topic_ids = Topic.objects.filter(title__icontains=search_term).values_list('id', flat=True)
+        user_ids = get_user_model().objects.filter(
+            Q(username__icontains=search_term) |
+            Q(first_name__icontains=search_term) |
+            Q(last_name__icontains=search_term)
+        ).values_list('id', flat=True)
+        return queryset.filter(Q(topic_id__in=list(topic_ids)) | Q(user_id__in=list(user_ids))), False
+
+    def regrade(self, request, queryset):
+        job = start_job(result_ids=list(queryset.values_list('id', flat=True)))
+        self.message_regrade_job(request, job)
+    regrade.short_description = _('Regrade selected results')
 
 
-class UserAnswerAdmin(admin.ModelAdmin):
+class UserAnswerAdmin(ChosenAnswersMixin, ShardAdminMixin, admin.ModelAdmin):
     list_display = ('question', 'topic_result')
+    list_filter = (ShardListFilter,)
+    list_select_related = ('topic_result',)
+    prefetch_fields = ('question', 'topic_result__topic', 'topic_result__user')
+    fields = ('topic_result', 'question', 'chosen_answers')
+    readonly_fields = fields
+
+
+class ScoreChangeAdminInline(admin.TabularInline):
+    model = ScoreChange
+    # Result can be on other shard than regrade job
+    fields = ('topic_result_id', 'old_result', 'new_result', 'created')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request):
+        return False
+
+
+class RegradeJobAdmin(admin.ModelAdmin):
+    inlines = [ScoreChangeAdminInline]
+    list_display = ('__str__', 'status', 'processed', 'changed', 'created', 'modified')
+    list_filter = ('status',)
+    fields = ('status', 'processed', 'changed')
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+
+class ArchivedTopicResultAdmin(admin.ModelAdmin):
+    list_display = ('topic', 'user', 'result', 'correct_count', 'total_count', 'date_finished', 'archived')
+    list_select_related = ('topic', 'user')
+    list_filter = ('topic',)
+    search_fields = ('topic__title', 'user__username', 'user__first_name', 'user__last_name')
+    raw_id_fields = ('topic', 'user')
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_readonly_fields(self, request, obj=None):
+        return [field.name for field in self.model._meta.fields]
 
 
 admin.site.register(get_user_model(), UserAdmin)
 admin.site.register(TopicResult, TopicResultAdmin)
 admin.site.register(UserAnswer, UserAnswerAdmin)
+admin.site.register(RegradeJob, RegradeJobAdmin)
+admin.site.register(ArchivedTopicResult, ArchivedTopicResultAdmin)
@@ -1,5 +1,10 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class UsersConfig(AppConfig):
     name = 'users'
+
+    def ready(self):
+        from users.sharding import sequences_post_migrate
+        post_migrate.connect(sequences_post_migrate, sender=self)
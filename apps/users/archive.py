@@ -0,0 +1,82 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from users.models import ArchivedTopicResult, RegradeJob, ScoreChange, TopicResult, UserAnswer, count_answers
+from users.sharding import get_shards
+
+
+BATCH_SIZE = 200
+
+
+def get_chosen_answers(result_ids, using=None):
+    """Chosen answers ids by question id by result id, answers without choices are kept too"""
+    chosen = defaultdict(dict)
+    for result_id, question_id in UserAnswer.objects.using(using).filter(
+            topic_result_id__in=result_ids).values_list('topic_result_id', 'question_id'):
+        chosen[result_id][question_id] = []
+    for result_id, question_id, answer_id in UserAnswer.answers.through.objects.using(using).filter(
+            useranswer__topic_result_id__in=result_ids).values_list(
+            'useranswer__topic_result_id', 'useranswer__question_id', 'answer_id'):
+        chosen[result_id][question_id].append(answer_id)
+    return chosen
+
+
+def archive_batch(finished_before, batch_size=BATCH_SIZE, using=None):
+    """
+    Move next batch of results on shard database finished before given date into archive,
+    returns number of archived results
+
+    Archive is committed before results are deleted from shard, results, which are already archived by
+    interrupted run, are only deleted.
+    """
+    with transaction.atomic(using=using), transaction.atomic():
+        rows = list(TopicResult.objects.using(using).select_for_update().filter(
+            date_finished__lt=finished_before
+        ).order_by('id').values_list(
+            'id', 'topic_id', 'user_id', 'created', 'date_finished', 'result'
+        )[:batch_size])
+        if not rows:
+            return 0
+        result_ids = [row[0] for row in rows]
+        counts = count_answers([(row[0], row[1]) for row in rows], using)
+        chosen = get_chosen_answers(result_ids, using)
+        archived_ids = set(ArchivedTopicResult.objects.filter(
+            result_id__in=result_ids).values_list('result_id', flat=True))
+        ArchivedTopicResult.objects.bulk_create([
+            ArchivedTopicResult(
+                result_id=result_id,
+                topic_id=topic_id,
+                user_id=user_id,
+                created=created,
+                date_finished=date_finished,
+                result=result,
+                correct_count=counts[result_id][0],
+                total_count=counts[result_id][1],
+                answers=ArchivedTopicResult.pack_answers(chosen[result_id])
+            ) for result_id, topic_id, user_id, created, date_finished, result in rows
+            if result_id not in archived_ids
+        ])
+        # Answers are deleted without loading them, results are deleted with their other relations
+        UserAnswer.answers.through.objects.using(using).filter(useranswer__topic_result_id__in=result_ids).delete()
+        UserAnswer.objects.using(using).filter(topic_result_id__in=result_ids).delete()
+        TopicResult.objects.using(using).filter(id__in=result_ids).delete()
+        # Regrade history is kept on default database, it isn't cascaded from other shards
+        ScoreChange.objects.filter(topic_result_id__in=result_ids).delete()
+        RegradeJob.results.through.objects.filter(topicresult_id__in=result_ids).delete()
+    return len(rows)
+
+
+def archive(days, batch_size=BATCH_SIZE):
+    """Archive all results on every shard finished more than days ago, returns number of archived results"""
+    finished_before = timezone.now() - timedelta(days=days)
+    total = 0
+    for database in get_shards():
+        while True:
+            count = archive_batch(finished_before, batch_size, database)
+            total += count
+            if count < batch_size:
+                break
+    return total
@@ -0,0 +1,78 @@
+"""
+Offline fitting of item response theory parameters of questions from users' answers (see questions.adaptive)
+"""
+import numpy as np
+from django.db import models, transaction
+from django.db.models import Case, When, Value
+
+from questions import adaptive
+from questions.cache import get_answer_key
+from questions.models import Question, Topic, TopicQuestionRelation, topic_content_changed
+from users.models import UserAnswer, annotate_correct_fields
+from users.sharding import get_shards
+
+
+BATCH_SIZE = 500
+MIN_RESPONSES = 20
+
+
+def get_responses(topic_ids):
+    """
+    Arrays of attempt ids, question ids and correctness of answers to active questions of topics,
+    read with one query per topic and shard
+    """
+    persons = []
+    items = []
+    correct = []
+    for topic_id in topic_ids:
+        answer_key = get_answer_key(topic_id)
+        if not answer_key:
+            continue
+        for using in get_shards():
+            answers = annotate_correct_fields(UserAnswer.objects.using(using).filter(
+                topic_result__topic_id=topic_id, question_id__in=list(answer_key)), answer_key)
+            for result_id, question_id, chosen_count, correct_count, total_correct in answers.values_list(
+                    'topic_result_id', 'question_id', 'chosen_count', 'correct_count', 'total_correct'):
+                # Attempt ids are unique across shards (see users.sharding)
+                persons.append(result_id)
+                items.append(question_id)
+                correct.append(chosen_count == correct_count == total_correct)
+    return np.array(persons, dtype=np.int64), np.array(items, dtype=np.int64), np.array(correct, dtype=bool)
+
+
+def fit_item_parameters(model=adaptive.MODEL_2PL, iterations=50, topic_ids=None, min_responses=MIN_RESPONSES):
+    """
+    Fit difficulty and discrimination of questions of topics (all topics by default) from answers
+    of all attempts, questions with less than min_responses answers are kept unchanged,
+    returns number of updated questions
+    """
+    if topic_ids is None:
+        topic_ids = Topic.objects.order_by('id').values_list('id', flat=True)
+    persons, items, correct = get_responses(list(topic_ids))
+    if not len(items):
+        return 0
+    _, persons = np.unique(persons, return_inverse=True)
+    question_ids, items, counts = np.unique(items, return_inverse=True, return_counts=True)
+    difficulty, discrimination = adaptive.fit_parameters(persons, items, correct, model, iterations)
+    fitted = [
+        (int(question_id), float(difficulty[index]), float(discrimination[index]))
+        for index, question_id in enumerate(question_ids) if counts[index] >= min_responses
+    ]
+    with transaction.atomic():
+        for start in range(0, len(fitted), BATCH_SIZE):
+            batch = fitted[start:start + BATCH_SIZE]
+            Question.objects.filter(id__in=[row[0] for row in batch]).update(
+                difficulty=Case(
+                    *[When(id=question_id, then=Value(value)) for question_id, value, _ in batch],
+                    output_field=models.FloatField()
+                ),
+                discrimination=Case(
+                    *[When(id=question_id, then=Value(value)) for question_id, _, value in batch],
+                    output_field=models.FloatField()
+                ),
+            )
+        if fitted:
+            # Item banks of topics are cached with their content
+            topic_content_changed.send(sender=Question, topic_ids=TopicQuestionRelation.objects.filter(
+                question_id__in=[row[0] for row in fitted]).get_topic_ids())
+    return len(fitted)
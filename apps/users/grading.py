@@ -0,0 +1,166 @@
+import math
+from collections import defaultdict
+from multiprocessing import Pool
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Q, Min, Max
+
+from questions.models import TopicQuestionRelation
+from users.models import (
+    RegradeJob,
+    RegradeTask,
+    ScoreChange,
+    TopicResult,
+    count_answers
+)
+from users.sharding import get_shards
+
+
+BATCH_SIZE = 500
+
+
+def create_job(question_ids=(), result_ids=()):
+    job = RegradeJob.objects.create()
+    job.questions.set(question_ids)
+    job.results.set(result_ids)
+    return job
+
+
+def get_job_results(job, using=None):
+    """
+    Finished results on shard database, which are regraded by job,
+    job's questions and results are read from default database before query on shard
+    """
+    results = TopicResult.objects.using(using).filter(date_finished__isnull=False)
+    condition = Q()
+    question_ids = list(job.questions.through.objects.filter(regradejob_id=job.id).values_list(
+        'question_id', flat=True))
+    if question_ids:
+        condition |= Q(topic_id__in=set(TopicQuestionRelation.objects.filter(
+            question_id__in=question_ids
+        ).values_list('topic_id', flat=True)))
+    result_ids = list(job.results.through.objects.filter(regradejob_id=job.id).values_list(
+        'topicresult_id', flat=True))
+    if result_ids:
+        condition |= Q(id__in=result_ids)
+    return results.filter(condition)
+
+
+def compute_results(results, using=None):
+    """
+    Scores by result id, computed with single query and scored in one batch for all results
+
+    results - list of (result id, topic id) pairs
+    """
+    return {result_id: counts[2] for result_id, counts in count_answers(results, using).items()}
+
+
+def process_batch(task_id, batch_size=BATCH_SIZE):
+    """
+    Regrade next batch of task's results and move task's checkpoint
+
+    returns number of processed results, 0 when task is done
+
+    Score changes and checkpoint are written on default database before results are updated on shard,
+    so batch is regraded again with the same old scores, if anything fails before shard is committed.
+    """
+    with transaction.atomic():
+        task = RegradeTask.objects.select_for_update().select_related('job').get(id=task_id)
+        if task.done:
+            return 0
+        with transaction.atomic(using=task.database):
+            rows = list(get_job_results(task.job, task.database).filter(
+                id__gt=max(task.cursor, task.first_id - 1),
+                id__lte=task.last_id
+            ).order_by('id').values_list('id', 'topic_id', 'result')[:batch_size])
+            if not rows:
+                task.done = True
+                task.save(update_fields=['done'])
+                return 0
+            scores = compute_results([(result_id, topic_id) for result_id, topic_id, _ in rows], task.database)
+            changes = [
+                ScoreChange(
+                    job_id=task.job_id, topic_result_id=result_id, old_result=old, new_result=scores[result_id])
+                for result_id, _, old in rows if scores[result_id] != old
+            ]
+            ScoreChange.objects.bulk_create(changes)
+            task.cursor = rows[-1][0]
+            task.save(update_fields=['cursor'])
+            RegradeJob.objects.filter(id=task.job_id).update(
+                processed=F('processed') + len(rows),
+                changed=F('changed') + len(changes)
+            )
+            # Results are updated with one statement per distinct new score
+            changed_ids = defaultdict(list)
+            for change in changes:
+                changed_ids[change.new_result].append(change.topic_result_id)
+            for result, result_ids in changed_ids.items():
+                TopicResult.objects.using(task.database).filter(id__in=result_ids).update(result=result)
+    return len(rows)
+
+
+def run_task(task_id, batch_size=BATCH_SIZE):
+    """Process task batch by batch till the end of its range"""
+    processed = 0
+    while True:
+        count = process_batch(task_id, batch_size)
+        if not count:
+            return processed
+        processed += count
+
+
+def plan_job(job, workers):
+    """Split ids range of job's results on every shard into one task per worker"""
+    if job.tasks.exists():
+        return
+    tasks = []
+    for database in get_shards():
+        bounds = get_job_results(job, database).aggregate(first_id=Min('id'), last_id=Max('id'))
+        if bounds['first_id'] is None:
+            continue
+        step = math.ceil((bounds['last_id'] - bounds['first_id'] + 1) / workers)
+        tasks.extend(
+            RegradeTask(job=job, database=database, first_id=first_id,
+                        last_id=min(first_id + step - 1, bounds['last_id']))
+            for first_id in range(bounds['first_id'], bounds['last_id'] + 1, step)
+        )
+    RegradeTask.objects.bulk_create(tasks)
+
+
+def run_job(job, workers=1, batch_size=BATCH_SIZE):
+    """
+    Run or resume regrade job
+
+    workers - number of worker processes, tasks are processed in current process if it is 1
+    """
+    with transaction.atomic():
+        plan_job(job, workers)
+        job.status = RegradeJob.STATUS_RUNNING
+        job.save(update_fields=['status', 'modified'])
+    task_ids = list(job.tasks.filter(done=False).values_list('id', flat=True))
+    if workers > 1 and len(task_ids) > 1:
+        # Forked workers should not share connections of parent process
+        connections.close_all()
+        with Pool(min(workers, len(task_ids))) as pool:
+            pool.starmap(run_task, [(task_id, batch_size) for task_id in task_ids])
+    else:
+        for task_id in task_ids:
+            run_task(task_id, batch_size)
+    job.refresh_from_db()
+    job.status = RegradeJob.STATUS_DONE
+    job.save(update_fields=['status', 'modified'])
+    return job
+
+
+def start_job(question_ids=(), result_ids=()):
+    """
+    Create regrade job and run it at once if it is small enough,
+    larger jobs are left pending for regrade command
+
+    returns created job
+    """
+    job = create_job(question_ids=question_ids, result_ids=result_ids)
+    if sum(get_job_results(job, database).count() for database in get_shards()) <= settings.REGRADE_INLINE_LIMIT:
+        run_job(job)
+    return job
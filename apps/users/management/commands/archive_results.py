@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from users.archive import archive, BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Move finished results older than given number of days into archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.ARCHIVE_RESULTS_AFTER_DAYS,
+            help='Archive results finished more than this number of days ago')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Results count per transaction')
+
+    def handle(self, *args, **options):
+        count = archive(options['days'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('{0} results were archived'.format(count)))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from questions.adaptive import MODEL_1PL, MODEL_2PL
+from users.calibration import MIN_RESPONSES, fit_item_parameters
+
+
+class Command(BaseCommand):
+    help = 'Fit difficulty and discrimination of questions for adaptive topics from answers of users'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', choices=[MODEL_1PL, MODEL_2PL], default=MODEL_2PL,
+            help='Item response model, 1pl fits only difficulty')
+        parser.add_argument('--iterations', type=int, default=50, help='Number of fitting iterations')
+        parser.add_argument(
+            '--topic', type=int, action='append', dest='topic_ids',
+            help='Id of topic to fit questions of, can be repeated, all topics by default')
+        parser.add_argument(
+            '--min-responses', type=int, default=MIN_RESPONSES,
+            help='Minimal number of answers to question to update its parameters')
+
+    def handle(self, *args, **options):
+        count = fit_item_parameters(
+            model=options['model'], iterations=options['iterations'],
+            topic_ids=options['topic_ids'], min_responses=options['min_responses'])
+        self.stdout.write(self.style.SUCCESS('Parameters of {0} questions were fitted'.format(count)))
@@ -0,0 +1,37 @@
+import sys
+from multiprocessing import cpu_count
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.provisioning import BATCH_SIZE, import_users, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Import users from CSV file with username, email, password, first_name, last_name and topics columns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path of CSV file with header, "-" to read standard input')
+        parser.add_argument(
+            '--topic', type=int, action='append', dest='topic_ids', default=[],
+            help='Id of topic assigned to every user, its result is created, can be repeated')
+        parser.add_argument('--verified', action='store_true', help='Mark email addresses as verified')
+        parser.add_argument('--delimiter', default=',', help='Delimiter of CSV columns')
+        parser.add_argument(
+            '--workers', type=int, default=cpu_count(), help='Number of processes hashing passwords')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Users count per transaction')
+
+    def handle(self, *args, **options):
+        stream = sys.stdin if options['path'] == '-' else open(options['path'], encoding='utf-8-sig', newline='')
+        try:
+            report = import_users(
+                read_rows(stream, options['delimiter']), topic_ids=options['topic_ids'],
+                verified=options['verified'], batch_size=options['batch_size'], workers=options['workers'])
+        except ValueError as error:
+            raise CommandError(error)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        for error in report.errors:
+            self.stderr.write('Line {0}: {1}'.format(error.line, ' '.join(error.messages)))
+        self.stdout.write(self.style.SUCCESS('{0} users and {1} results were created, {2} rows were skipped'.format(
+            report.users, report.results, len(report.errors))))
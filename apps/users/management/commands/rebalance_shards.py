@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from users.rebalance import rebalance
+
+
+class Command(BaseCommand):
+    help = 'Move attempts of users to their shard databases after list of shards was changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source', action='append', dest='sources',
+            help='Database to move attempts from, can be repeated, all shards by default')
+        parser.add_argument(
+            '--dry-run', action='store_true', default=False, help='Only count results, which would be moved')
+
+    def handle(self, *args, **options):
+        moved = rebalance(sources=options['sources'], dry_run=options['dry_run'])
+        for (source, target), count in sorted(moved.items()):
+            self.stdout.write('{0} -> {1}: {2} results'.format(source, target, count))
+        verb = 'would be moved' if options['dry_run'] else 'were moved'
+        self.stdout.write(self.style.SUCCESS('{0} results {1}'.format(sum(moved.values()), verb)))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.grading import create_job, run_job, BATCH_SIZE
+from users.models import RegradeJob
+
+
+class Command(BaseCommand):
+    help = 'Regrade finished results after answer keys changes, unfinished jobs are resumed from checkpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job', type=int, action='append', default=[], help='Resume job with this id')
+        parser.add_argument('--resume', action='store_true', help='Resume all unfinished jobs')
+        parser.add_argument(
+            '--question', type=int, action='append', default=[],
+            help='Regrade results of topics with this question, all results are regraded if not set')
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of worker processes, database should support concurrent writes (e.g. PostgreSQL)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Results count per transaction')
+
+    def handle(self, *args, **options):
+        if options['job'] or options['resume']:
+            jobs = RegradeJob.objects.exclude(status=RegradeJob.STATUS_DONE).order_by('id')
+            if options['job']:
+                jobs = jobs.filter(id__in=options['job'])
+            jobs = list(jobs)
+            if not jobs:
+                raise CommandError('There are no unfinished jobs to resume')
+        else:
+            jobs = [create_job(question_ids=options['question'])]
+        for job in jobs:
+            job = run_job(job, workers=options['workers'], batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS('{0}: {1} of {2} results were changed'.format(
+                job, job.changed, job.processed)))
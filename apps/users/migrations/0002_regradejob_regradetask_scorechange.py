@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.4 on 2026-10-19 01:35
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0002_search_index'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegradeJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'Pending'), (2, 'Running'), (3, 'Done')], default=1)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('changed', models.PositiveIntegerField(default=0)),
+                ('questions', models.ManyToManyField(blank=True, to='questions.Question')),
+                ('results', models.ManyToManyField(blank=True, to='users.TopicResult')),
+            ],
+            options={
+                'verbose_name': 'Regrade Job',
+                'verbose_name_plural': 'Regrade Jobs',
+            },
+        ),
+        migrations.CreateModel(
+            name='RegradeTask',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_id', models.PositiveIntegerField()),
+                ('last_id', models.PositiveIntegerField()),
+                ('cursor', models.PositiveIntegerField(default=0)),
+                ('done', models.BooleanField(default=False)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tasks', to='users.RegradeJob')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ScoreChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('old_result', models.PositiveIntegerField()),
+                ('new_result', models.PositiveIntegerField()),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='score_changes', to='users.RegradeJob')),
+                ('topic_result', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='score_changes', to='users.TopicResult')),
+            ],
+            options={
+                'verbose_name': 'Score Change',
+                'verbose_name_plural': 'Score Changes',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.4 on 2026-10-19 01:38
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_regradejob_regradetask_scorechange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='topicresult',
+            name='cursor_answered',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='topicresult',
+            name='cursor_position',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='topicresult',
+            name='cursor_version',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
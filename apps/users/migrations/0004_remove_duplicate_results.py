@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def remove_duplicate_results(apps, schema_editor):
+    """
+    Keep one result of each user per topic: the finished one, then the one with the most answers, then the newest
+    """
+    using = schema_editor.connection.alias
+    TopicResult = apps.get_model('users', 'TopicResult')
+    duplicates = TopicResult.objects.using(using).values('topic_id', 'user_id').annotate(
+        count=Count('id')
+    ).filter(count__gt=1).order_by()
+    for duplicate in duplicates:
+        results = TopicResult.objects.using(using).filter(
+            topic_id=duplicate['topic_id'], user_id=duplicate['user_id']
+        ).annotate(answers_count=Count('answers'))
+        kept = max(results, key=lambda result: (
+            result.date_finished is not None, result.answers_count, result.created, result.id))
+        TopicResult.objects.using(using).filter(
+            topic_id=duplicate['topic_id'], user_id=duplicate['user_id']
+        ).exclude(id=kept.id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_topicresult_progress_cursor'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_results, migrations.RunPython.noop),
+    ]
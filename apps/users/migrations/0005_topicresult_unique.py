@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    # Duplicates are removed by separate migration, so deferred triggers of cascaded deletes are fired
+    # by its commit before the table is altered (PostgreSQL doesn't alter tables with pending trigger events)
+    dependencies = [
+        ('users', '0004_remove_duplicate_results'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='topicresult',
+            unique_together=set([('topic', 'user')]),
+        ),
+    ]
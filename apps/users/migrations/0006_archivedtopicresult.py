@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.4 on 2026-10-19 01:55
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0003_topic_content_version'),
+        ('users', '0005_topicresult_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTopicResult',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('result_id', models.PositiveIntegerField(unique=True)),
+                ('created', models.DateTimeField()),
+                ('date_finished', models.DateTimeField()),
+                ('result', models.PositiveIntegerField(default=0)),
+                ('correct_count', models.PositiveIntegerField(default=0)),
+                ('total_count', models.PositiveIntegerField(default=0)),
+                ('answers', models.TextField(blank=True, default='[]')),
+                ('archived', models.DateTimeField(default=django.utils.timezone.now)),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_results', to='questions.Topic')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_results', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Archived Topic Result',
+                'verbose_name_plural': 'Archived Topic Results',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='archivedtopicresult',
+            index_together=set([('topic', 'user')]),
+        ),
+    ]
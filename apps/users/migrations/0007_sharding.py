@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.4 on 2026-10-19 02:16
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_archivedtopicresult'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='regradetask',
+            name='database',
+            field=models.CharField(default='default', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='regradejob',
+            name='results',
+            field=models.ManyToManyField(blank=True, db_constraint=False, to='users.TopicResult'),
+        ),
+        migrations.AlterField(
+            model_name='scorechange',
+            name='topic_result',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='score_changes', to='users.TopicResult'),
+        ),
+        migrations.AlterField(
+            model_name='topicresult',
+            name='topic',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='results', to='questions.Topic'),
+        ),
+        migrations.AlterField(
+            model_name='topicresult',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='results', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='useranswer',
+            name='answers',
+            field=models.ManyToManyField(db_constraint=False, to='questions.Answer'),
+        ),
+        migrations.AlterField(
+            model_name='useranswer',
+            name='question',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='questions.Question'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.4 on 2026-10-19 02:29
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_sharding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='topicresult',
+            name='ability',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
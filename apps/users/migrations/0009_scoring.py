@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.4 on 2026-10-19 02:35
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_adaptive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivedtopicresult',
+            name='result',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='scorechange',
+            name='new_result',
+            field=models.FloatField(),
+        ),
+        migrations.AlterField(
+            model_name='scorechange',
+            name='old_result',
+            field=models.FloatField(),
+        ),
+        migrations.AlterField(
+            model_name='topicresult',
+            name='result',
+            field=models.FloatField(blank=True, default=0),
+        ),
+    ]
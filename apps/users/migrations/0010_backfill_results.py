@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import defaultdict
+
+from django.db import DEFAULT_DB_ALIAS, migrations
+
+
+BATCH_SIZE = 500
+SCORE_DIGITS = 4
+SCORING_PARTIAL_CREDIT = 2
+SCORING_NEGATIVE_MARKING = 3
+
+
+def get_contents(apps, topic_ids):
+    """Scoring, penalty, weights of active questions and answer keys of topics, content is on default database"""
+    Topic = apps.get_model('questions', 'Topic')
+    TopicQuestionRelation = apps.get_model('questions', 'TopicQuestionRelation')
+    Answer = apps.get_model('questions', 'Answer')
+    contents = {}
+    for topic_id, scoring_id, penalty in Topic.objects.using(DEFAULT_DB_ALIAS).filter(
+            id__in=topic_ids).values_list('id', 'scoring', 'penalty'):
+        weights = dict(TopicQuestionRelation.objects.using(DEFAULT_DB_ALIAS).filter(
+            topic_id=topic_id, active=True).values_list('question_id', 'weight'))
+        answer_key = defaultdict(set)
+        for question_id, answer_id in Answer.objects.using(DEFAULT_DB_ALIAS).filter(
+                question_id__in=list(weights), is_correct=True).values_list('question_id', 'id'):
+            answer_key[question_id].add(answer_id)
+        contents[topic_id] = (scoring_id, penalty, weights, answer_key)
+    return contents
+
+
+def get_credit(scoring_id, correct, incorrect, total, penalty):
+    """Share of question weight earned by answer, scoring policies as they were when scores were snapshotted"""
+    fully_correct = correct == total and not incorrect
+    if scoring_id == SCORING_PARTIAL_CREDIT:
+        return min(max((correct - incorrect) / max(total, 1), 0), 1)
+    if scoring_id == SCORING_NEGATIVE_MARKING:
+        return 1.0 if fully_correct else -penalty
+    return 1.0 if fully_correct else 0.0
+
+
+def backfill_results(apps, schema_editor):
+    """
+    Score results finished before scores were snapshotted on finish, their result was never written.
+    Answers to active questions are scored by policies of topics like on finish.
+    """
+    using = schema_editor.connection.alias
+    TopicResult = apps.get_model('users', 'TopicResult')
+    UserAnswer = apps.get_model('users', 'UserAnswer')
+    rows = list(TopicResult.objects.using(using).filter(
+        date_finished__isnull=False, result=0).order_by('id').values_list('id', 'topic_id'))
+    contents = {}
+    for start in range(0, len(rows), BATCH_SIZE):
+        topic_ids = dict(rows[start:start + BATCH_SIZE])
+        contents.update(get_contents(apps, set(topic_ids.values()) - set(contents)))
+        chosen = defaultdict(set)
+        for user_answer_id, answer_id in UserAnswer.answers.through.objects.using(using).filter(
+                useranswer__topic_result_id__in=list(topic_ids)).values_list('useranswer_id', 'answer_id'):
+            chosen[user_answer_id].add(answer_id)
+        scores = defaultdict(float)
+        for user_answer_id, result_id, question_id in UserAnswer.objects.using(using).filter(
+                topic_result_id__in=list(topic_ids)).values_list('id', 'topic_result_id', 'question_id'):
+            content = contents.get(topic_ids[result_id])
+            if content is None or question_id not in content[2]:
+                continue
+            scoring_id, penalty, weights, answer_key = content
+            correct = len(chosen[user_answer_id] & answer_key[question_id])
+            scores[result_id] += get_credit(
+                scoring_id, correct, len(chosen[user_answer_id]) - correct, len(answer_key[question_id]), penalty
+            ) * weights[question_id]
+        for result_id, score in scores.items():
+            if round(score, SCORE_DIGITS):
+                TopicResult.objects.using(using).filter(id=result_id).update(result=round(score, SCORE_DIGITS))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_scoring'),
+        ('questions', '0007_scoring'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_results, migrations.RunPython.noop),
+    ]
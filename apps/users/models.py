@@ -1,14 +1,20 @@
+import json
+
+import numpy as np
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth import get_user_model
 from django.db import models
-from django.db.models import Sum, Case, When, F
-from django.db.models.expressions import RawSQL
+from django.db.models import Count, Sum, Case, When, F, Value
+from django.db.models.signals import post_save, pre_delete
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 from model_utils.models import TimeStampedModel
 
+from questions import adaptive, scoring
+from questions.cache import get_answer_key, get_topic_content
 from questions.models import Topic, Answer, Question
+from users.sharding import AttemptQuerySet, get_shards
 
 
 class User(AbstractUser):
@@ -23,14 +29,95 @@ class User(AbstractUser):
         return self.username
 
 
+def annotate_correct_fields(answers, answer_key):
+    """
+    Annotate user answers queryset with count of chosen answers, count of chosen correct answers
+    and total count of correct answers
+
+    answer_key - ids of correct answers by question id, they are passed into query instead of join with answers table,
+    so user answers can be on other database than questions
+    """
+    correct_ids = [answer_id for answer_ids in answer_key.values() for answer_id in answer_ids]
+    if correct_ids:
+        correct_count = Sum(Case(
+            When(answers__in=correct_ids, then=1),
+            default=0, output_field=models.IntegerField()
+        ))
+    else:
+        correct_count = Value(0, output_field=models.IntegerField())
+    return answers.annotate(
+        chosen_count=Count('answers'),
+        correct_count=correct_count,
+        total_correct=Case(
+            *[When(question_id=question_id, then=len(answer_ids)) for question_id, answer_ids in answer_key.items()],
+            default=0, output_field=models.IntegerField()
+        )
+    )
+
+
+def count_answers(results, using=None):
+    """
+    Correct and total answers count and score of active questions by result id, answers are read
+    with single query and scored by policies of topics in one batch
+
+    results - list of (result id, topic id) pairs of results on the same database
+    """
+    topic_ids = dict(results)
+    contents = {topic_id: get_topic_content(topic_id) for topic_id in set(topic_ids.values())}
+    merged_key = {}
+    for topic_id in contents:
+        merged_key.update(get_answer_key(topic_id))
+    answers = annotate_correct_fields(
+        UserAnswer.objects.using(using).filter(topic_result_id__in=list(topic_ids)), merged_key)
+    rows = np.array(list(answers.values_list(
+        'topic_result_id', 'question_id', 'chosen_count', 'correct_count', 'total_correct'
+    )), dtype=np.int64).reshape(-1, 5)
+    result_ids = np.array(sorted(topic_ids), dtype=np.int64)
+    positions = np.searchsorted(result_ids, rows[:, 0])
+    result_topic_ids = np.array([topic_ids[result_id] for result_id in result_ids.tolist()], dtype=np.int64)
+    chosen, correct, total = rows[:, 2], rows[:, 3], rows[:, 4]
+    # Answers to inactive questions aren't counted
+    active, scores = scoring.score_answers(
+        result_topic_ids[positions], rows[:, 1], correct, chosen - correct, total, contents)
+    correct_counts = np.bincount(
+        positions, active & scoring.is_correct(correct, chosen - correct, total), len(result_ids))
+    total_counts = np.bincount(positions, active, len(result_ids))
+    score_sums = np.bincount(positions, scores, len(result_ids)).round(scoring.SCORE_DIGITS)
+    return {
+        result_id: [int(correct_count), int(total_count), float(score)]
+        for result_id, correct_count, total_count, score in zip(
+            result_ids.tolist(), correct_counts, total_counts, score_sums)
+    }
+
+
 class TopicResult(TimeStampedModel):
 
-    topic = models.ForeignKey(Topic, related_name='results')
-    user = models.ForeignKey(get_user_model(), related_name='results')
-    result = models.PositiveIntegerField(blank=True, default=0)
+    """
+    User's attempt of topic
+
+    result - score by scoring policy of topic, snapshotted on finish and changed only by regrading
+    cursor_position - progress cursor, number of the next question or 0 if all questions are answered
+    cursor_answered - progress cursor, answered questions count
+    cursor_version - topic content version, which cursor is valid for, cursor is repaired if it differs
+    ability - user's ability estimate at finish of adaptive topic
+
+    Results are placed on shard databases by user (see users.sharding), foreign keys to topic and user
+    have no database constraints.
+    """
+
+    topic = models.ForeignKey(Topic, related_name='results', db_constraint=False)
+    user = models.ForeignKey(get_user_model(), related_name='results', db_constraint=False)
+    result = models.FloatField(blank=True, default=0)
     date_finished = models.DateTimeField(blank=True, null=True)
+    cursor_position = models.PositiveIntegerField(default=0, editable=False)
+    cursor_answered = models.PositiveIntegerField(default=0, editable=False)
+    cursor_version = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    ability = models.FloatField(blank=True, null=True)
+
+    objects = AttemptQuerySet.as_manager()
 
     class Meta:
+        unique_together = ('topic', 'user')
         verbose_name = _('User\'s Topic Result')
         verbose_name_plural = _('User\'s Topic Results')
 
@@ -38,29 +125,11 @@ class TopicResult(TimeStampedModel):
         return '{0} - {1}'.format(self.user, self.topic)
 
     def get_active_answers(self, with_correct_fields=False):
-        answers = self.answers.select_related('question').filter(
-            question__topic_relation__active=True,
-            question__topic_relation__topic_id=self.topic_id
-        )
-
+        """User's answers to active questions, questions are taken from cached content instead of join"""
+        content = get_topic_content(self.topic_id)
+        answers = self.answers.filter(question_id__in=[question.id for question in content.questions])
         if with_correct_fields:
-            answers = answers.prefetch_related('answers').annotate(
-                correct_count=Sum(
-                    Case(
-                        When(answers__is_correct=True, then=1),
-                        default=0, output_field=models.IntegerField()
-                    )
-                ),
-                total_correct=RawSQL(
-                    """
-                    SELECT count(*)
-                        FROM "questions_answer"
-                        WHERE question_id="users_useranswer".question_id AND is_correct=True
-                    """,
-                    params=(),
-                    output_field=models.IntegerField()
-                )
-            )
+            answers = annotate_correct_fields(answers, get_answer_key(self.topic_id))
         return answers
 
     @property
@@ -70,7 +139,10 @@ class TopicResult(TimeStampedModel):
         """
         self.__answered_count = getattr(self, '__answered_count', None)
         if self.__answered_count is None:
-            self.__answered_count = self.get_active_answers().count()
+            if self.is_cursor_valid():
+                self.__answered_count = self.cursor_answered
+            else:
+                self.__answered_count = self.get_active_answers().count()
         return self.__answered_count
 
     @property
@@ -78,8 +150,8 @@ class TopicResult(TimeStampedModel):
         """Correct answered questions count"""
         self.__incorrect_count = getattr(self, '__incorrect_count', None)
         if self.__incorrect_count is None:
-            self.__incorrect_count = self.get_active_answers(
-                with_correct_fields=True).filter(total_correct=F('correct_count')).count()
+            self.__incorrect_count = self.get_active_answers(with_correct_fields=True).filter(
+                total_correct=F('correct_count'), chosen_count=F('correct_count')).count()
         return self.__incorrect_count
 
     @property
@@ -87,8 +159,8 @@ class TopicResult(TimeStampedModel):
         """Incorrect answered questions count"""
         self.__incorrect_count = getattr(self, '__incorrect_count', None)
         if self.__incorrect_count is None:
-            self.__incorrect_count = self.get_active_answers(
-                with_correct_fields=True).exclude(correct_count=F('total_correct')).count()
+            self.__incorrect_count = self.get_active_answers(with_correct_fields=True).exclude(
+                total_correct=F('correct_count'), chosen_count=F('correct_count')).count()
         return self.__incorrect_count
 
     @property
@@ -99,7 +171,11 @@ class TopicResult(TimeStampedModel):
             # If topic is already finished by user then do not count new questions into result
             self.__total_count = self.get_active_answers().count()
         if self.__total_count is None:
-            self.__total_count = self.topic.get_active_questions().count()
+            content = get_topic_content(self.topic_id)
+            if content.mode == Topic.MODE_ADAPTIVE:
+                self.__total_count = adaptive.get_attempt_length(content)
+            else:
+                self.__total_count = len(content.questions)
         return self.__total_count
 
     @property
@@ -114,11 +190,107 @@ class TopicResult(TimeStampedModel):
     def answered_ratio(self):
         return self.answered_count / self.total_count * 100
 
+    def is_cursor_valid(self, content=None):
+        """Check if progress cursor was built for current content of topic"""
+        if self.cursor_version is None:
+            return False
+        content = content or get_topic_content(self.topic_id)
+        return self.cursor_version == content.version
+
+    def save_cursor(self, **kwargs):
+        """
+        Update cursor fields with single statement, update is skipped if cursor was changed concurrently
+
+        returns True if cursor was updated
+        """
+        updated = TopicResult.objects.using(self._state.db).filter(
+            id=self.id,
+            cursor_position=self.cursor_position,
+            cursor_version=self.cursor_version
+        ).update(modified=timezone.now(), **kwargs)
+        if updated:
+            for field, value in kwargs.items():
+                setattr(self, field, value)
+        return bool(updated)
+
+    def build_cursor(self, content=None):
+        """Values of progress cursor fields built from user's answers, nothing is saved"""
+        content = content or get_topic_content(self.topic_id)
+        answered = set(self.get_active_answers().values_list('question_id', flat=True))
+        position = 0
+        for number, question in enumerate(content.questions, 1):
+            if question.id not in answered:
+                position = number
+                break
+        # Cursor can be advanced only if all questions before it are answered and no questions after it,
+        # otherwise it is rebuilt every time
+        in_order = len(answered) == (position - 1 if position else len(content.questions))
+        return {
+            'cursor_position': position,
+            'cursor_answered': len(answered),
+            'cursor_version': content.version if in_order else None,
+        }
+
+    def repair_cursor(self, content=None):
+        """
+        Rebuild progress cursor from user's answers, is used when topic content was changed
+        """
+        cursor = self.build_cursor(content)
+        TopicResult.objects.using(self._state.db).filter(id=self.id).update(**cursor)
+        for field, value in cursor.items():
+            setattr(self, field, value)
+
+    def advance_cursor(self, question_id):
+        """
+        Move progress cursor to the next question after answer to question, modification time is updated anyway
+        """
+        if self.cursor_version is not None:
+            content = get_topic_content(self.topic_id)
+            position = self.cursor_position
+            if self.is_cursor_valid(content) and 0 < position <= len(content.questions) and \
+                    content.questions[position - 1].id == question_id:
+                if self.save_cursor(
+                        cursor_position=position + 1 if position < len(content.questions) else 0,
+                        cursor_answered=self.cursor_answered + 1):
+                    return
+        # Question was answered out of order or cursor was changed concurrently, it will be repaired on next use
+        self.modified = timezone.now()
+        TopicResult.objects.using(self._state.db).filter(id=self.id).update(
+            cursor_version=None, modified=self.modified)
+        self.cursor_version = None
+
+    def get_responses(self):
+        """If answers to active questions are correct by question id, read with single query"""
+        return {
+            question_id: chosen_count == correct_count == total_correct
+            for question_id, chosen_count, correct_count, total_correct in self.get_active_answers(
+                with_correct_fields=True).values_list('question_id', 'chosen_count', 'correct_count', 'total_correct')
+        }
+
+    def get_score(self):
+        """Score of answers to active questions by scoring policy of topic"""
+        return count_answers([(self.id, self.topic_id)], self._state.db)[self.id][2]
+
+    def get_attempt_version(self):
+        """Version of user's attempt, it is changed by answers, finish and regrading"""
+        return '{0}.{1}.{2}'.format(self.id, self.modified.timestamp(), self.result)
+
     @property
     def current_step(self):
-        answered_questions = self.get_active_answers().values_list('question_id', flat=True)
-        questions = self.topic.get_active_questions().exclude(id__in=answered_questions)
-        return questions.first()
+        """Next question to answer"""
+        number = self.get_next_number()
+        if number:
+            return get_topic_content(self.topic_id).questions[number - 1]
+        return None
+
+    def peek_next_number(self):
+        """Gets next question number for read paths, stale progress cursor is rebuilt, but isn't saved"""
+        content = get_topic_content(self.topic_id)
+        if content.mode == Topic.MODE_ADAPTIVE:
+            return adaptive.get_next_number(self, content)
+        if self.is_cursor_valid(content):
+            return self.cursor_position
+        return self.build_cursor(content)['cursor_position']
 
     def get_next_number(self, allow_finish=False):
         """
@@ -127,13 +299,17 @@ class TopicResult(TimeStampedModel):
         allow_finish - if set to true, when there is no next question currect results will be finished
         returns 0 if there is no next question and question number otherwise
         """
-        questions = list(self.topic.get_active_questions().values_list('id', flat=True))
-        current = self.current_step
-        result = 0
-        if current:
-            result = questions.index(current.id) + 1
+        content = get_topic_content(self.topic_id)
+        if content.mode == Topic.MODE_ADAPTIVE:
+            # Questions are chosen by ability estimate, progress cursor isn't used
+            result = adaptive.get_next_number(self, content)
+        else:
+            if not self.is_cursor_valid(content):
+                self.repair_cursor(content)
+            result = self.cursor_position
         if not result and allow_finish:
             self.date_finished = timezone.now()
+            self.result = self.get_score()
             self.save()
         return result
 
@@ -141,11 +317,170 @@ class TopicResult(TimeStampedModel):
 class UserAnswer(TimeStampedModel):
 
     topic_result = models.ForeignKey(TopicResult, related_name='answers')
-    answers = models.ManyToManyField(Answer)
-    question = models.ForeignKey(Question)
+    answers = models.ManyToManyField(Answer, db_constraint=False)
+    question = models.ForeignKey(Question, db_constraint=False)
 
     class Meta:
         unique_together = ('topic_result', 'question')
 
     def __str__(self):
         return 'Answer of {0} to question: {1}'.format(self.topic_result.user, self.question)
+
+
+def user_answer_post_save(sender, instance, created, raw=False, *args, **kwargs):
+    if created and not raw:
+        instance.topic_result.advance_cursor(instance.question_id)
+
+
+post_save.connect(user_answer_post_save, sender=UserAnswer)
+
+
+def delete_attempts(sender, instance, using, *args, **kwargs):
+    """
+    Delete attempt data of deleted user or content on other shards, foreign keys of attempts
+    have no database constraints and deletion cascades only on the database of deleted object
+    """
+    for shard in get_shards():
+        if shard == using:
+            continue
+        if isinstance(instance, User):
+            TopicResult.objects.using(shard).filter(user_id=instance.pk).delete()
+        elif isinstance(instance, Topic):
+            TopicResult.objects.using(shard).filter(topic_id=instance.pk).delete()
+        elif isinstance(instance, Question):
+            UserAnswer.objects.using(shard).filter(question_id=instance.pk).delete()
+        elif isinstance(instance, Answer):
+            UserAnswer.answers.through.objects.using(shard).filter(answer_id=instance.pk).delete()
+
+
+for model in (User, Topic, Question, Answer):
+    pre_delete.connect(delete_attempts, sender=model)
+
+
+class RegradeJob(TimeStampedModel):
+
+    """
+    Recalculation of snapshotted results after answer keys changes
+
+    questions - results of topics with these questions are regraded
+    results - explicitly selected results
+    If both are empty then all finished results are regraded.
+    """
+
+    STATUS_PENDING = 1
+    STATUS_RUNNING = 2
+    STATUS_DONE = 3
+    STATUSES = (
+        (STATUS_PENDING, _('Pending')),
+        (STATUS_RUNNING, _('Running')),
+        (STATUS_DONE, _('Done')),
+    )
+
+    status = models.PositiveSmallIntegerField(choices=STATUSES, default=STATUS_PENDING)
+    questions = models.ManyToManyField(Question, blank=True)
+    results = models.ManyToManyField(TopicResult, blank=True, db_constraint=False)
+    processed = models.PositiveIntegerField(default=0)
+    changed = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = _('Regrade Job')
+        verbose_name_plural = _('Regrade Jobs')
+
+    def __str__(self):
+        return 'Regrade #{0}'.format(self.id)
+
+
+class RegradeTask(models.Model):
+
+    """
+    Range of results ids of regrade job, that is processed by single worker
+
+    database - shard database of results
+    first_id, last_id - bounds of ids range, inclusive
+    cursor - id of the last processed result, checkpoint for resume
+    """
+
+    job = models.ForeignKey(RegradeJob, related_name='tasks')
+    database = models.CharField(max_length=64, default='default')
+    first_id = models.PositiveIntegerField()
+    last_id = models.PositiveIntegerField()
+    cursor = models.PositiveIntegerField(default=0)
+    done = models.BooleanField(default=False)
+
+    def __str__(self):
+        return '{0}: {1}-{2}'.format(self.job, self.first_id, self.last_id)
+
+
+class ScoreChange(models.Model):
+
+    """
+    Audit record of result changed by regrade job
+    """
+
+    job = models.ForeignKey(RegradeJob, related_name='score_changes')
+    topic_result = models.ForeignKey(TopicResult, related_name='score_changes', db_constraint=False)
+    old_result = models.FloatField()
+    new_result = models.FloatField()
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = _('Score Change')
+        verbose_name_plural = _('Score Changes')
+
+    def __str__(self):
+        return '{0}: {1} -> {2}'.format(self.topic_result_id, self.old_result, self.new_result)
+
+
+class ArchivedTopicResult(models.Model):
+
+    """
+    Finished attempt moved out of TopicResult by archival, its scores are frozen
+
+    result_id - id of original TopicResult
+    result - snapshotted result of attempt
+    correct_count, total_count - correct and total answers count of active questions on archival
+    answers - packed list of user's answers: JSON list of [question id, [chosen answers ids]]
+    """
+
+    result_id = models.PositiveIntegerField(unique=True)
+    topic = models.ForeignKey(Topic, related_name='archived_results')
+    user = models.ForeignKey(get_user_model(), related_name='archived_results')
+    created = models.DateTimeField()
+    date_finished = models.DateTimeField()
+    result = models.FloatField(default=0)
+    correct_count = models.PositiveIntegerField(default=0)
+    total_count = models.PositiveIntegerField(default=0)
+    answers = models.TextField(blank=True, default='[]')
+    archived = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        index_together = ('topic', 'user')
+        verbose_name = _('Archived Topic Result')
+        verbose_name_plural = _('Archived Topic Results')
+
+    def __str__(self):
+        return '{0} - {1}'.format(self.user, self.topic)
+
+    @property
+    def incorrect_count(self):
+        return self.total_count - self.correct_count
+
+    @property
+    def correct_ratio(self):
+        return self.correct_count / self.total_count * 100 if self.total_count else 0
+
+    @property
+    def incorrect_ratio(self):
+        return self.incorrect_count / self.total_count * 100 if self.total_count else 0
+
+    def get_answers(self):
+        """Chosen answers ids by question id"""
+        return {question_id: answer_ids for question_id, answer_ids in json.loads(self.answers)}
+
+    @staticmethod
+    def pack_answers(answers):
+        """Pack dict of chosen answers ids by question id"""
+        return json.dumps(
+            sorted([question_id, sorted(answer_ids)] for question_id, answer_ids in answers.items()),
+            separators=(',', ':')
+        )
@@ -0,0 +1,226 @@
+"""
+Bulk import of users from CSV with allauth email addresses and optional pre-created topic results
+
+Rows are read as stream and imported batch by batch: rows are validated, passwords are hashed by pool
+of worker processes (PBKDF2 takes the most of time of user creation), then users, email addresses and
+results are inserted with one bulk insert per batch and database. Bulk inserts don't send signals,
+so pre-created results aren't logged as started attempts in statistics events.
+"""
+import csv
+import re
+from collections import defaultdict, namedtuple
+from itertools import islice
+from multiprocessing import Pool
+
+from allauth.account.models import EmailAddress
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+
+from questions.models import Topic
+from users.models import TopicResult, User
+from users.sharding import get_shards, get_user_shard
+
+
+BATCH_SIZE = 500
+REQUIRED_COLUMNS = ('username', 'email')
+TOPICS_SEPARATOR = re.compile(r'[\s,;]+')
+
+# Row of CSV which wasn't imported: line number and error messages
+RowError = namedtuple('RowError', ('line', 'messages'))
+ImportReport = namedtuple('ImportReport', ('users', 'results', 'errors'))
+
+
+def read_rows(stream, delimiter=','):
+    """Rows of CSV stream with header as (line number, dict) pairs"""
+    reader = csv.DictReader(stream, delimiter=delimiter)
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or ())]
+    if missing:
+        raise ValueError('Required columns are missing: {0}'.format(', '.join(missing)))
+    for row in reader:
+        yield reader.line_num, row
+
+
+def hash_passwords(passwords, pool=None):
+    """Hashes of passwords, unusable passwords for empty ones"""
+    if pool is None:
+        return [make_password(password or None) for password in passwords]
+    return pool.map(make_password, [password or None for password in passwords], chunksize=16)
+
+
+class UserImporter(object):
+
+    """
+    Importer of users, it keeps usernames and emails of imported batches to detect duplicates in file
+
+    topic_ids - topics assigned to every user, topics of user's row are added to them
+    verified - if email addresses are marked as verified
+    """
+
+    def __init__(self, topic_ids=(), verified=False, pool=None):
+        self.topic_ids = list(topic_ids)
+        self.verified = verified
+        self.pool = pool
+        self.usernames = set()
+        self.emails = set()
+        self.known_topic_ids = set(Topic.objects.filter(id__in=self.topic_ids).values_list('id', flat=True))
+        missing = set(self.topic_ids) - self.known_topic_ids
+        if missing:
+            raise ValueError('Topics do not exist: {0}'.format(', '.join(map(str, sorted(missing)))))
+        self.users = 0
+        self.results = 0
+        self.errors = []
+
+    def get_topic_ids(self, value):
+        topic_ids = []
+        for topic_id in TOPICS_SEPARATOR.split((value or '').strip()):
+            if not topic_id:
+                continue
+            if not topic_id.isdigit():
+                raise ValidationError('Invalid topic id: {0}'.format(topic_id))
+            topic_ids.append(int(topic_id))
+        return topic_ids
+
+    def clean_row(self, row):
+        """User and ids of assigned topics of valid row, raises ValidationError"""
+        user = User(
+            username=(row.get('username') or '').strip(),
+            email=(row.get('email') or '').strip(),
+            first_name=(row.get('first_name') or '').strip(),
+            last_name=(row.get('last_name') or '').strip(),
+        )
+        messages = []
+        try:
+            user.full_clean(exclude=['password'], validate_unique=False)
+        except ValidationError as error:
+            messages.extend('{0}: {1}'.format(field, ' '.join(errors)) for field, errors in error.message_dict.items())
+        if not user.email:
+            messages.append('email: This field cannot be blank.')
+        if user.username in self.usernames:
+            messages.append('username: Duplicate username in file.')
+        if user.email.lower() in self.emails:
+            messages.append('email: Duplicate email in file.')
+        try:
+            topic_ids = self.get_topic_ids(row.get('topics'))
+        except ValidationError as error:
+            messages.extend(error.messages)
+            topic_ids = []
+        if messages:
+            raise ValidationError(messages)
+        return user, topic_ids
+
+    def import_batch(self, rows):
+        """Import batch of (line number, row) pairs"""
+        valid = []
+        for line, row in rows:
+            try:
+                user, topic_ids = self.clean_row(row)
+            except ValidationError as error:
+                self.errors.append(RowError(line, error.messages))
+                continue
+            self.usernames.add(user.username)
+            self.emails.add(user.email.lower())
+            valid.append((line, row, user, topic_ids))
+        # Existing users and topics are checked with one query each for the whole batch
+        existing_usernames = set(User.objects.filter(
+            username__in=[user.username for _, _, user, _ in valid]).values_list('username', flat=True))
+        emails = [user.email.lower() for _, _, user, _ in valid]
+        # Email can be only in user's field, if user was created without allauth
+        existing_emails = set(EmailAddress.objects.annotate(lower_email=Lower('email')).filter(
+            lower_email__in=emails).values_list('lower_email', flat=True))
+        existing_emails.update(User.objects.annotate(lower_email=Lower('email')).filter(
+            lower_email__in=emails).values_list('lower_email', flat=True))
+        unknown_topic_ids = {topic_id for _, _, _, topic_ids in valid for topic_id in topic_ids} - self.known_topic_ids
+        if unknown_topic_ids:
+            self.known_topic_ids.update(Topic.objects.filter(id__in=unknown_topic_ids).values_list('id', flat=True))
+        lines = []
+        users = []
+        assigned = []
+        passwords = []
+        for line, row, user, topic_ids in valid:
+            messages = []
+            if user.username in existing_usernames:
+                messages.append('username: User with this username already exists.')
+            if user.email.lower() in existing_emails:
+                messages.append('email: User with this email already exists.')
+            messages.extend(
+                'Topic {0} does not exist.'.format(topic_id)
+                for topic_id in topic_ids if topic_id not in self.known_topic_ids)
+            if messages:
+                self.errors.append(RowError(line, messages))
+                continue
+            lines.append(line)
+            users.append(user)
+            assigned.append(set(self.topic_ids + topic_ids))
+            passwords.append(row.get('password') or '')
+        if not users:
+            return
+        for user, password in zip(users, hash_passwords(passwords, self.pool)):
+            user.password = password
+        try:
+            self.save_batch(users, assigned)
+        except IntegrityError:
+            # Users with the same usernames or emails were created concurrently,
+            # rows are inserted one by one to find them
+            for line, user, topic_ids in zip(lines, users, assigned):
+                user.pk = None
+                try:
+                    self.save_batch([user], [topic_ids])
+                except IntegrityError:
+                    self.errors.append(RowError(line, ['User with this username or email already exists.']))
+
+    def save_batch(self, users, assigned):
+        """
+        Insert valid users with their email addresses and results of assigned topics,
+        nothing is inserted if IntegrityError is raised
+        """
+        results = defaultdict(list)
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+            # Ids of inserted rows aren't returned by every database
+            user_ids = dict(User.objects.filter(
+                username__in=[user.username for user in users]).values_list('username', 'id'))
+            EmailAddress.objects.bulk_create([
+                EmailAddress(user_id=user_ids[user.username], email=user.email, primary=True, verified=self.verified)
+                for user in users
+            ])
+            for user, topic_ids in zip(users, assigned):
+                user_id = user_ids[user.username]
+                results[get_user_shard(user_id)].extend(
+                    TopicResult(topic_id=topic_id, user_id=user_id) for topic_id in sorted(topic_ids))
+            for database in get_shards():
+                if results[database]:
+                    with transaction.atomic(using=database):
+                        TopicResult.objects.using(database).bulk_create(results[database])
+        self.users += len(users)
+        self.results += sum(len(database_results) for database_results in results.values())
+
+    def get_report(self):
+        return ImportReport(self.users, self.results, self.errors)
+
+
+def import_users(rows, topic_ids=(), verified=False, batch_size=BATCH_SIZE, workers=1):
+    """
+    Import users from iterable of (line number, row) pairs (see read_rows), rows are dicts with username,
+    email and optional password, first_name, last_name and topics (ids separated by spaces, commas or semicolons)
+
+    topic_ids - topics, which results are created for every imported user
+    workers - number of processes hashing passwords
+    returns ImportReport with numbers of created users and results and list of errors of rows
+    """
+    rows = iter(rows)
+    pool = None
+    if workers > 1:
+        # Workers only hash passwords, they don't use inherited database connections
+        pool = Pool(workers)
+    try:
+        importer = UserImporter(topic_ids=topic_ids, verified=verified, pool=pool)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return importer.get_report()
+            importer.import_batch(batch)
+    finally:
+        if pool is not None:
+            pool.terminate()
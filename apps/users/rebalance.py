@@ -0,0 +1,81 @@
+from django.db import transaction
+from django.db.models import Count
+
+from users.models import TopicResult, UserAnswer
+from users.sharding import get_shards, get_user_shard
+
+
+def get_misplaced_users(using):
+    """Ids of users, whose attempts are on the given database, but belong to other shard"""
+    user_ids = TopicResult.objects.using(using).order_by().values_list('user_id', flat=True).distinct()
+    return [user_id for user_id in user_ids if get_user_shard(user_id) != using]
+
+
+def get_completeness(result):
+    """Finished attempt is kept, then the one with the most answers, then the newest"""
+    return result.date_finished is not None, result.answers_count, result.created, result.id
+
+
+def move_user(user_id, source, target):
+    """
+    Move user's attempts with their answers from source database to target, ids are kept.
+    Users are placed on new shard as soon as ATTEMPT_SHARDS is changed, so user can start topic on target
+    before the old attempt is moved. Only the most complete attempt of topic is kept (see get_completeness),
+    the other one is deleted with its answers.
+
+    returns number of moved results
+    """
+    through = UserAnswer.answers.through
+    with transaction.atomic(using=source), transaction.atomic(using=target):
+        results = list(TopicResult.objects.using(source).select_for_update().filter(
+            user_id=user_id).annotate(answers_count=Count('answers')))
+        if not results:
+            return 0
+        existing = {
+            result.topic_id: result for result in TopicResult.objects.using(target).select_for_update().filter(
+                user_id=user_id, topic_id__in=[result.topic_id for result in results]
+            ).annotate(answers_count=Count('answers'))
+        }
+        replaced_ids = [
+            existing[result.topic_id].id for result in results
+            if result.topic_id in existing and get_completeness(result) > get_completeness(existing[result.topic_id])
+        ]
+        if replaced_ids:
+            TopicResult.objects.using(target).filter(id__in=replaced_ids).delete()
+        moved = [
+            result for result in results
+            if result.topic_id not in existing or existing[result.topic_id].id in replaced_ids
+        ]
+        result_ids = [result.id for result in moved]
+        answers = list(UserAnswer.objects.using(source).filter(topic_result_id__in=result_ids))
+        choices = list(through.objects.using(source).filter(useranswer__topic_result_id__in=result_ids))
+        for choice in choices:
+            choice.id = None
+        TopicResult.objects.using(target).bulk_create(moved)
+        UserAnswer.objects.using(target).bulk_create(answers)
+        through.objects.using(target).bulk_create(choices)
+        # Rows of moved and superseded attempts are deleted without loading them
+        all_ids = [result.id for result in results]
+        through.objects.using(source).filter(useranswer__topic_result_id__in=all_ids).delete()
+        UserAnswer.objects.using(source).filter(topic_result_id__in=all_ids).delete()
+        TopicResult.objects.using(source).filter(id__in=all_ids).delete()
+    return len(moved)
+
+
+def rebalance(sources=None, dry_run=False):
+    """
+    Move attempts of users to their shards after ATTEMPT_SHARDS was changed
+
+    sources - databases to move attempts from, all shards by default
+    returns dict of moved results count by (source, target) pair
+    """
+    moved = {}
+    for source in sources or get_shards():
+        for user_id in get_misplaced_users(source):
+            target = get_user_shard(user_id)
+            if dry_run:
+                count = TopicResult.objects.using(source).filter(user_id=user_id).count()
+            else:
+                count = move_user(user_id, source, target)
+            moved[source, target] = moved.get((source, target), 0) + count
+    return moved
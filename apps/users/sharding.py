@@ -0,0 +1,115 @@
+"""
+Horizontal sharding of attempt data
+
+Topic results and user's answers are placed on one of ATTEMPT_SHARDS databases by rendezvous hash of user id,
+all other data (users, content, archive, statistics) stays on default database. Queries of single user
+are routed to user's shard, queries over all users are run on every shard and their results are merged.
+
+Every shard is migrated with full schema (./manage.py migrate --database=<alias>), tables other than attempts
+and their events stay empty there. Attempt ids are allocated from separate range of every shard, so they stay
+unique after rebalancing, ATTEMPT_SHARDS list can only be appended to.
+"""
+import hashlib
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, models
+
+
+SHARDED_MODELS = ('users.topicresult', 'users.useranswer', 'users.useranswer_answers')
+
+# SQL statements moving id sequence of table to the start value, if it is lower, by database vendor
+SEQUENCE_SQL = {
+    'postgresql': (
+        "SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+        "GREATEST(%s, (SELECT COALESCE(MAX(id), 1) FROM {table})))",
+    ),
+    'sqlite': (
+        "UPDATE sqlite_sequence SET seq = %s WHERE name = '{table}' AND seq < %s",
+        "INSERT INTO sqlite_sequence (name, seq) SELECT '{table}', %s "
+        "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = '{table}')",
+    ),
+    'mysql': (
+        'ALTER TABLE {table} AUTO_INCREMENT = %s',
+    ),
+}
+
+
+def get_shards():
+    return list(settings.ATTEMPT_SHARDS)
+
+
+def get_user_shard(user_id, shards=None):
+    """Database of user's attempts, only users of removed shard are moved when shards are added or removed"""
+    shards = shards or get_shards()
+    if len(shards) == 1:
+        return shards[0]
+    return max(shards, key=lambda shard: hashlib.md5('{0}:{1}'.format(shard, user_id).encode('ascii')).digest())
+
+
+def is_sharded(model):
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+class AttemptQuerySet(models.QuerySet):
+
+    def for_user(self, user_id):
+        """Queryset on database of user's attempts"""
+        return self.using(get_user_shard(user_id))
+
+
+class AttemptRouter(object):
+
+    """
+    Routes attempt models by instance hint: saved instance stays on its database,
+    new topic result goes to user's shard, new answer goes to database of its result,
+    related managers of user use user's shard. Related content and users of attempts are read
+    from default database. Queries without hints go to default database.
+    """
+
+    def get_db(self, model, hints):
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        if not is_sharded(model):
+            return DEFAULT_DB_ALIAS if is_sharded(type(instance)) else None
+        if is_sharded(type(instance)):
+            # Database of new instance can be set by assignment of related content object, it is ignored
+            if instance._state.db and not instance._state.adding:
+                return instance._state.db
+            if getattr(instance, 'user_id', None):
+                return get_user_shard(instance.user_id)
+            if getattr(instance, 'topic_result_id', None):
+                return self.get_db(type(instance.topic_result), {'instance': instance.topic_result})
+            return instance._state.db
+        if isinstance(instance, models.Model) and instance._meta.label_lower == settings.AUTH_USER_MODEL.lower():
+            return get_user_shard(instance.pk)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self.get_db(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self.get_db(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Foreign keys of attempts to users and content have no constraints and can cross databases
+        if is_sharded(type(obj1)) or is_sharded(type(obj2)):
+            return True
+        return None
+
+
+def init_sequences(using):
+    """Move id sequences of attempt tables on shard to the start of its range"""
+    shards = get_shards()
+    if using not in shards or not shards.index(using):
+        return
+    connection = connections[using]
+    start = shards.index(using) * settings.ATTEMPT_SHARD_ID_SPAN
+    with connection.cursor() as cursor:
+        for table in ('users_topicresult', 'users_useranswer'):
+            for sql in SEQUENCE_SQL[connection.vendor]:
+                cursor.execute(sql.format(table=table), [start] * sql.count('%s'))
+
+
+def sequences_post_migrate(sender, using, **kwargs):
+    init_sequences(using)
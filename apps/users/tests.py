@@ -1,22 +1,49 @@
+import os
+import tempfile
+from importlib import import_module
+from io import StringIO
+from types import SimpleNamespace
+
+from allauth.account.models import EmailAddress
+from django.apps import apps
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
 from django.core.urlresolvers import reverse
+from django.db import DatabaseError, connection
 from django.db.models import F
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.utils import timezone
 
+import numpy as np
 from model_mommy import mommy
 from model_mommy.recipe import Recipe, related
 
+from questions import adaptive
 from questions.models import (
     Answer,
     Question,
     TopicQuestionRelation,
     Topic
 )
+from stats.models import AttemptEvent, TopicDailyStats
+from stats.rollup import rollup
+from stats.summary import build_summary
+from users.archive import archive
+from users.grading import create_job, plan_job, process_batch, run_job
 from users.models import (
+    ArchivedTopicResult,
     User,
     TopicResult,
-    UserAnswer
+    UserAnswer,
+    RegradeJob,
+    RegradeTask,
+    ScoreChange,
+    count_answers
 )
+from users.provisioning import UserImporter, import_users
+from users.rebalance import rebalance
+from users.sharding import get_user_shard, init_sequences
 
 
 class TestTopicResultModel(TestCase):
@@ -108,8 +135,14 @@ class TestTopicResultModel(TestCase):
         self.assertEqual(self.topic_result.total_count, 3)
         self.assertEqual(self.topic_result.answered_count, 3)
 
+        # Choosing all answers isn't correct
         self.topic_result = TopicResult.objects.get(id=self.topic_result.id)
         user_answer2.answers.add(self.answer2_1)
+        self.assertEqual(self.topic_result.correct_count, 2)
+        self.assertEqual(self.topic_result.incorrect_count, 1)
+
+        self.topic_result = TopicResult.objects.get(id=self.topic_result.id)
+        user_answer2.answers.remove(self.answer2_2)
         self.assertEqual(self.topic_result.correct_count, 3)
         self.assertEqual(self.topic_result.incorrect_count, 0)
         self.assertEqual(self.topic_result.total_count, 3)
@@ -151,3 +184,687 @@ class TestTopicResultModel(TestCase):
         mommy.make(
             UserAnswer, topic_result=self.topic_result, question=new_question, answers=(new_answer,))
         self.assertEqual(self.topic_result.get_next_number(), 0)
+
+
+class ProgressCursorTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = mommy.make(User, username='test', password='123')
+        self.topic = mommy.make(Topic)
+        self.questions = []
+        self.relations = []
+        for order in range(4):
+            question = mommy.make(Question, text='question{}'.format(order), qtype=Question.QTYPE_RADIO)
+            mommy.make(Answer, question=question, text='answer{}'.format(order), is_correct=True)
+            self.relations.append(mommy.make(
+                TopicQuestionRelation, question=question, topic=self.topic, order=order, active=True))
+            self.questions.append(question)
+        self.topic_result = mommy.make(TopicResult, user=self.user, topic=self.topic, date_finished=None)
+
+    def answer(self, question):
+        mommy.make(UserAnswer, topic_result=self.topic_result, question=question,
+                   answers=list(question.answers.all()))
+
+    def test_cursor_advance(self):
+        self.assertEqual(self.topic_result.get_next_number(), 1)
+        for number, question in enumerate(self.questions[:3], 2):
+            self.answer(question)
+            # Next question is resolved without queries
+            with self.assertNumQueries(0):
+                self.assertEqual(self.topic_result.get_next_number(), number)
+                self.assertEqual(self.topic_result.answered_count, number - 1)
+        topic_result = TopicResult.objects.get(id=self.topic_result.id)
+        self.assertEqual((topic_result.cursor_position, topic_result.cursor_answered), (4, 3))
+
+        self.answer(self.questions[3])
+        self.assertEqual(self.topic_result.get_next_number(), 0)
+
+    def test_out_of_order_answers(self):
+        self.assertEqual(self.topic_result.get_next_number(), 1)
+        self.answer(self.questions[2])
+        self.assertIsNone(self.topic_result.cursor_version)
+        self.assertEqual(self.topic_result.get_next_number(), 1)
+        self.answer(self.questions[0])
+        self.answer(self.questions[1])
+        self.assertEqual(self.topic_result.get_next_number(), 4)
+        self.assertEqual(self.topic_result.cursor_answered, 3)
+
+    def test_repair_on_content_change(self):
+        self.answer(self.questions[0])
+        self.assertEqual(self.topic_result.get_next_number(), 2)
+        self.answer(self.questions[1])
+
+        self.relations[0].active = False
+        self.relations[0].save()
+        self.assertFalse(self.topic_result.is_cursor_valid())
+        # Read path doesn't save repaired cursor
+        self.assertEqual(self.topic_result.peek_next_number(), 2)
+        self.assertFalse(TopicResult.objects.get(id=self.topic_result.id).is_cursor_valid())
+        self.client.force_login(self.topic_result.user)
+        response = self.client.get(reverse('api-progress', kwargs={'topic_id': self.topic_result.topic_id}))
+        self.assertEqual(response.json()['next_number'], 2)
+        self.assertFalse(TopicResult.objects.get(id=self.topic_result.id).is_cursor_valid())
+
+        self.assertEqual(self.topic_result.get_next_number(), 2)
+        self.assertEqual(self.topic_result.cursor_answered, 1)
+        self.assertTrue(TopicResult.objects.get(id=self.topic_result.id).is_cursor_valid())
+
+
+class AdaptiveTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = mommy.make(User, username='test', password='123')
+        self.topic = mommy.make(Topic, mode=Topic.MODE_ADAPTIVE, adaptive_length=3)
+        self.questions = []
+        for order, difficulty in enumerate([-2, -1, 0, 1, 2]):
+            question = mommy.make(
+                Question, text='question{}'.format(order), qtype=Question.QTYPE_RADIO, difficulty=difficulty)
+            mommy.make(Answer, question=question, text='correct', is_correct=True)
+            mommy.make(Answer, question=question, text='incorrect', is_correct=False)
+            mommy.make(TopicQuestionRelation, question=question, topic=self.topic, order=order, active=True)
+            self.questions.append(question)
+        self.topic_result = mommy.make(TopicResult, user=self.user, topic=self.topic, date_finished=None)
+
+    def answer(self, number, correct, topic_result=None):
+        question = self.questions[number - 1]
+        mommy.make(UserAnswer, topic_result=topic_result or self.topic_result, question=question,
+                   answers=list(question.answers.filter(is_correct=correct)))
+
+    def test_adaptive_attempt(self):
+        self.assertEqual(self.topic_result.total_count, 3)
+        # The most informative question at prior ability is of average difficulty
+        self.assertEqual(self.topic_result.get_next_number(), 3)
+        self.answer(3, True)
+        self.assertEqual(self.topic_result.get_next_number(), 4)
+        self.answer(4, False)
+        next_number = self.topic_result.get_next_number()
+        self.assertIn(next_number, (2, 5))
+        self.answer(next_number, True)
+        self.assertEqual(self.topic_result.get_next_number(allow_finish=True), 0)
+        topic_result = TopicResult.objects.get(id=self.topic_result.id)
+        self.assertIsNotNone(topic_result.date_finished)
+        self.assertGreater(topic_result.ability, 0)
+
+    def test_question_view(self):
+        self.client.force_login(self.user)
+        url = reverse('question-detail', args=[self.topic.id, 1])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        url = reverse('question-detail', args=[self.topic.id, 3])
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_question_api(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('api-question', args=[self.topic.id, 1])).status_code, 404)
+        response = self.client.get(reverse('api-question', args=[self.topic.id, 3]))
+        self.assertEqual(response.json()['text'], 'question2')
+        self.answer(3, True)
+        # Answered question stays available
+        self.assertEqual(self.client.get(reverse('api-question', args=[self.topic.id, 3])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('api-question', args=[self.topic.id, 1])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api-question', args=[self.topic.id, 4])).status_code, 200)
+
+    def test_fit_parameters(self):
+        random = np.random.RandomState(0)
+        difficulty = np.array([-1.5, -0.5, 0.5, 1.5])
+        persons = np.repeat(np.arange(500), len(difficulty))
+        items = np.tile(np.arange(len(difficulty)), 500)
+        ability = random.normal(size=500)
+        correct = random.random_sample(len(items)) < adaptive.get_probabilities(
+            ability[persons], difficulty[items], 1)
+        fitted, discrimination = adaptive.fit_parameters(persons, items, correct, adaptive.MODEL_1PL)
+        self.assertLess(np.abs(fitted - difficulty).max(), 0.5)
+        self.assertEqual(discrimination.tolist(), [1, 1, 1, 1])
+        fitted, discrimination = adaptive.fit_parameters(persons, items, correct, adaptive.MODEL_2PL)
+        self.assertEqual(fitted.argsort().tolist(), [0, 1, 2, 3])
+        self.assertTrue(np.all(discrimination > 0))
+
+    def test_fit_item_parameters_command(self):
+        for index in range(4):
+            user = mommy.make(User, username='user{}'.format(index))
+            topic_result = mommy.make(TopicResult, user=user, topic=self.topic)
+            self.answer(1, True, topic_result)
+            self.answer(5, False, topic_result)
+            self.answer(3, index % 2 == 0, topic_result)
+        out = StringIO()
+        call_command('fit_item_parameters', '--model', '1pl', '--min-responses', '4', stdout=out)
+        self.assertIn('Parameters of 3 questions were fitted', out.getvalue())
+        difficulty = dict(Question.objects.values_list('text', 'difficulty'))
+        self.assertLess(difficulty['question0'], difficulty['question2'])
+        self.assertLess(difficulty['question2'], difficulty['question4'])
+        # Questions without enough answers are kept
+        self.assertEqual(difficulty['question1'], -1)
+        # Item bank of topic is reloaded
+        bank = adaptive.get_item_bank(self.topic.id)
+        self.assertEqual(bank.difficulty[0], difficulty['question0'])
+
+
+class ScoringTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.topic = mommy.make(Topic, penalty=0.25)
+        self.question1 = mommy.make(Question, text='question1', qtype=Question.QTYPE_CHECKBOX)
+        self.answers1 = [
+            mommy.make(Answer, question=self.question1, text=text, is_correct=is_correct)
+            for text, is_correct in (('a', True), ('b', True), ('c', False))
+        ]
+        mommy.make(TopicQuestionRelation, question=self.question1, topic=self.topic, order=0, weight=2)
+        self.question2 = mommy.make(Question, text='question2', qtype=Question.QTYPE_RADIO)
+        self.answers2 = [
+            mommy.make(Answer, question=self.question2, text=text, is_correct=is_correct)
+            for text, is_correct in (('d', True), ('e', False))
+        ]
+        mommy.make(TopicQuestionRelation, question=self.question2, topic=self.topic, order=1)
+        question3 = mommy.make(Question, text='question3', qtype=Question.QTYPE_RADIO)
+        answer3 = mommy.make(Answer, question=question3, text='f', is_correct=True)
+        mommy.make(TopicQuestionRelation, question=question3, topic=self.topic, order=2, active=False)
+
+        self.results = []
+        for answers1, answers2 in ((self.answers1[:1], self.answers2[:1]), (self.answers1, self.answers2[1:])):
+            result = mommy.make(TopicResult, topic=self.topic, user=mommy.make(User))
+            mommy.make(UserAnswer, topic_result=result, question=self.question1, answers=answers1)
+            mommy.make(UserAnswer, topic_result=result, question=self.question2, answers=answers2)
+            # Answers to inactive questions aren't scored
+            mommy.make(UserAnswer, topic_result=result, question=question3, answers=[answer3])
+            self.results.append(result)
+
+    def count_answers(self):
+        return count_answers([(result.id, result.topic_id) for result in self.results], 'default')
+
+    def test_policies(self):
+        for scoring, scores in (
+                (Topic.SCORING_ALL_OR_NOTHING, (1, 0)),
+                (Topic.SCORING_PARTIAL_CREDIT, (2, 1)),
+                (Topic.SCORING_NEGATIVE_MARKING, (0.5, -0.75))):
+            self.topic.scoring = scoring
+            self.topic.save()
+            # Answers of all results are scored with single query
+            self.count_answers()
+            with self.assertNumQueries(1):
+                counts = self.count_answers()
+            self.assertEqual(counts, {
+                self.results[0].id: [1, 2, scores[0]],
+                self.results[1].id: [0, 2, scores[1]],
+            })
+
+    def test_finish(self):
+        self.topic.scoring = Topic.SCORING_PARTIAL_CREDIT
+        self.topic.save()
+        result = self.results[1]
+        self.assertEqual(result.get_next_number(allow_finish=True), 0)
+        self.assertEqual(TopicResult.objects.get(id=result.id).result, 1)
+
+        # Results are regraded after weights change
+        relation = TopicQuestionRelation.objects.get(question=self.question1)
+        relation.weight = 4
+        relation.save()
+        run_job(create_job(result_ids=[result.id]))
+        self.assertEqual(TopicResult.objects.get(id=result.id).result, 2)
+
+
+class RegradeTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.topic = mommy.make(Topic)
+        self.question1 = mommy.make(Question, text='question1', qtype=Question.QTYPE_RADIO)
+        self.answer1 = mommy.make(Answer, question=self.question1, text='answer1', is_correct=True)
+        self.answer1_1 = mommy.make(Answer, question=self.question1, text='answer1_1', is_correct=False)
+        mommy.make(TopicQuestionRelation, question=self.question1, topic=self.topic, order=0, active=True)
+        self.question2 = mommy.make(Question, text='question2', qtype=Question.QTYPE_RADIO)
+        self.answer2 = mommy.make(Answer, question=self.question2, text='answer2', is_correct=True)
+        mommy.make(TopicQuestionRelation, question=self.question2, topic=self.topic, order=1, active=True)
+
+        self.results = []
+        for answer in (self.answer1, self.answer1_1, self.answer1, self.answer1_1):
+            result = mommy.make(TopicResult, topic=self.topic, user=mommy.make(User))
+            mommy.make(UserAnswer, topic_result=result, question=self.question1, answers=[answer])
+            mommy.make(UserAnswer, topic_result=result, question=self.question2, answers=[self.answer2])
+            self.assertEqual(result.get_next_number(allow_finish=True), 0)
+            self.results.append(result)
+        # Unfinished results are not regraded
+        mommy.make(TopicResult, topic=self.topic, date_finished=None)
+
+    def fix_answer_key(self):
+        self.answer1.is_correct = False
+        self.answer1.save()
+        self.answer1_1.is_correct = True
+        self.answer1_1.save()
+
+    def get_results(self):
+        return list(TopicResult.objects.filter(
+            id__in=[result.id for result in self.results]).order_by('id').values_list('result', flat=True))
+
+    def test_snapshot_on_finish(self):
+        self.assertEqual(self.get_results(), [2, 1, 2, 1])
+        self.fix_answer_key()
+        self.assertEqual(self.get_results(), [2, 1, 2, 1])
+
+    def test_backfill_migration(self):
+        # Results finished before snapshots were added have no result
+        TopicResult.objects.filter(id__in=[result.id for result in self.results[:2]]).update(result=0)
+        migration = import_module('users.migrations.0010_backfill_results')
+        migration.backfill_results(apps, SimpleNamespace(connection=connection))
+        self.assertEqual(self.get_results(), [2, 1, 2, 1])
+        self.assertEqual(TopicResult.objects.get(date_finished=None).result, 0)
+
+    def test_regrade(self):
+        self.fix_answer_key()
+        job = run_job(create_job(question_ids=[self.question1.id]), batch_size=3)
+        self.assertEqual(job.status, RegradeJob.STATUS_DONE)
+        self.assertEqual((job.processed, job.changed), (4, 4))
+        self.assertEqual(self.get_results(), [1, 2, 1, 2])
+        self.assertEqual(
+            list(job.score_changes.order_by('topic_result_id').values_list('old_result', 'new_result')),
+            [(2, 1), (1, 2), (2, 1), (1, 2)])
+
+        # Nothing is changed by repeated regrade
+        job = run_job(create_job())
+        self.assertEqual((job.processed, job.changed), (4, 0))
+
+    def test_resume(self):
+        self.fix_answer_key()
+        job = create_job(result_ids=[result.id for result in self.results[1:]])
+        plan_job(job, workers=2)
+        tasks = list(job.tasks.order_by('first_id'))
+        self.assertEqual(len(tasks), 2)
+        # Interrupted after the first batch of the first task
+        self.assertEqual(process_batch(tasks[0].id, batch_size=1), 1)
+        self.assertEqual(RegradeTask.objects.get(id=tasks[0].id).cursor, self.results[1].id)
+
+        job = run_job(RegradeJob.objects.get(id=job.id), batch_size=1)
+        self.assertEqual((job.processed, job.changed), (3, 3))
+        self.assertEqual(self.get_results(), [2, 2, 1, 2])
+        self.assertFalse(job.tasks.filter(done=False).exists())
+
+    def test_admin_action(self):
+        self.fix_answer_key()
+        self.client.force_login(mommy.make(User, username='admin', is_staff=True, is_superuser=True))
+        response = self.client.post(reverse('admin:users_topicresult_changelist'), data={
+            'action': 'regrade',
+            '_selected_action': [self.results[0].id]
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.get_results(), [1, 1, 2, 1])
+        self.assertEqual(ScoreChange.objects.count(), 1)
+
+
+class ArchiveTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.topic = mommy.make(Topic)
+        self.question1 = mommy.make(Question, text='question1', qtype=Question.QTYPE_RADIO)
+        self.answer1 = mommy.make(Answer, question=self.question1, text='answer1', is_correct=True)
+        self.answer1_1 = mommy.make(Answer, question=self.question1, text='answer1_1', is_correct=False)
+        mommy.make(TopicQuestionRelation, question=self.question1, topic=self.topic, order=0, active=True)
+        self.question2 = mommy.make(Question, text='question2', qtype=Question.QTYPE_RADIO)
+        self.answer2 = mommy.make(Answer, question=self.question2, text='answer2', is_correct=True)
+        mommy.make(TopicQuestionRelation, question=self.question2, topic=self.topic, order=1, active=True)
+
+        self.user = mommy.make(User, username='test')
+        self.results = []
+        for user, answer in ((self.user, self.answer1_1), (mommy.make(User), self.answer1)):
+            result = mommy.make(TopicResult, topic=self.topic, user=user)
+            mommy.make(UserAnswer, topic_result=result, question=self.question1, answers=[answer])
+            mommy.make(UserAnswer, topic_result=result, question=self.question2, answers=[self.answer2])
+            result.get_next_number(allow_finish=True)
+            self.results.append(result)
+        TopicResult.objects.filter(id=self.results[0].id).update(
+            date_finished=timezone.now() - timezone.timedelta(days=100))
+        # Unfinished results are not archived
+        self.unfinished = mommy.make(TopicResult, topic=self.topic)
+
+    def test_archive(self):
+        summary = build_summary(self.topic.id)
+        call_command('archive_results', days=30, stdout=StringIO())
+        self.assertEqual(
+            set(TopicResult.objects.values_list('id', flat=True)), {self.results[1].id, self.unfinished.id})
+        self.assertFalse(UserAnswer.objects.filter(topic_result_id=self.results[0].id).exists())
+
+        archived = ArchivedTopicResult.objects.get()
+        self.assertEqual(archived.result_id, self.results[0].id)
+        self.assertEqual((archived.result, archived.correct_count, archived.incorrect_count), (1, 1, 1))
+        self.assertEqual(archived.get_answers(), {
+            self.question1.id: [self.answer1_1.id], self.question2.id: [self.answer2.id]})
+        self.assertEqual(build_summary(self.topic.id), summary)
+
+        self.assertEqual(archive(days=0, batch_size=1), 1)
+        self.assertEqual(ArchivedTopicResult.objects.count(), 2)
+
+    def test_archive_rerun(self):
+        # Archive of interrupted run was committed, but results weren't deleted
+        mommy.make(ArchivedTopicResult, result_id=self.results[0].id, topic=self.topic, user=self.user, result=1)
+        self.assertEqual(archive(days=30), 1)
+        self.assertEqual(ArchivedTopicResult.objects.get().result_id, self.results[0].id)
+        self.assertFalse(TopicResult.objects.filter(id=self.results[0].id).exists())
+
+    def test_archived_result_read_path(self):
+        archive(days=30)
+        self.client.force_login(self.user)
+        url = reverse('topic-detail', kwargs={'pk': self.topic.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.context['finished_result'].result_id, self.results[0].id)
+        self.assertContains(response, '50%')
+        # Archived topic isn't started again
+        self.assertRedirects(self.client.post(url), url)
+        self.assertFalse(TopicResult.objects.filter(user=self.user).exists())
+
+        self.client.force_login(mommy.make(User, username='admin', is_staff=True, is_superuser=True))
+        response = self.client.get(reverse('admin:users_archivedtopicresult_changelist'))
+        self.assertContains(response, 'test')
+
+
+@override_settings(ATTEMPT_SHARDS=['default', 'shard1', 'shard2'])
+class ShardingTestCase(TestCase):
+
+    multi_db = True
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        for shard in ('shard1', 'shard2'):
+            init_sequences(shard)
+        self.topic = mommy.make(Topic)
+        self.question1 = mommy.make(Question, text='question1', qtype=Question.QTYPE_RADIO)
+        self.answer1 = mommy.make(Answer, question=self.question1, text='answer1', is_correct=True)
+        self.answer1_1 = mommy.make(Answer, question=self.question1, text='answer1_1', is_correct=False)
+        mommy.make(TopicQuestionRelation, question=self.question1, topic=self.topic, order=0, active=True)
+        self.question2 = mommy.make(Question, text='question2', qtype=Question.QTYPE_RADIO)
+        self.answer2 = mommy.make(Answer, question=self.question2, text='answer2', is_correct=True)
+        mommy.make(TopicQuestionRelation, question=self.question2, topic=self.topic, order=1, active=True)
+        # One user on every shard
+        self.users = {}
+        while len(self.users) < 3:
+            user = mommy.make(User)
+            self.users.setdefault(get_user_shard(user.id), user)
+
+    def make_result(self, user, answer):
+        result = mommy.make(TopicResult, topic=self.topic, user=user)
+        mommy.make(UserAnswer, topic_result=result, question=self.question1, answers=[answer])
+        mommy.make(UserAnswer, topic_result=result, question=self.question2, answers=[self.answer2])
+        result.get_next_number(allow_finish=True)
+        return result
+
+    def test_user_shard(self):
+        user_ids = range(1, 1000)
+        placement = {user_id: get_user_shard(user_id) for user_id in user_ids}
+        self.assertEqual(set(placement.values()), {'default', 'shard1', 'shard2'})
+        # Only users of the new shard are moved when shard is added
+        for user_id in user_ids:
+            shard = get_user_shard(user_id, ['default', 'shard1', 'shard2', 'shard3'])
+            self.assertIn(shard, (placement[user_id], 'shard3'))
+
+    def test_attempt_on_user_shard(self):
+        user = self.users['shard2']
+        self.client.force_login(user)
+        self.client.post(reverse('topic-detail', kwargs={'pk': self.topic.pk}))
+        for number, answer in ((1, self.answer1), (2, self.answer2)):
+            self.client.post(reverse('question-detail', kwargs={'pk': self.topic.pk, 'number': number}),
+                             data={'answer': answer.id})
+        result = TopicResult.objects.using('shard2').get(user=user)
+        self.assertGreaterEqual(result.id, 2 * 10 ** 8)
+        self.assertEqual((result.result, result.answers.count()), (2, 2))
+        self.assertIsNotNone(result.date_finished)
+        for shard in ('default', 'shard1'):
+            self.assertFalse(TopicResult.objects.using(shard).exists())
+            self.assertFalse(UserAnswer.objects.using(shard).exists())
+
+        response = self.client.get(reverse('topic-detail', kwargs={'pk': self.topic.pk}))
+        self.assertEqual(response.context['topic_result'].id, result.id)
+
+    def test_summary_fan_out(self):
+        for answer, user in zip((self.answer1, self.answer1_1, self.answer1), self.users.values()):
+            self.make_result(user, answer)
+        summary = build_summary(self.topic.id)
+        self.assertEqual((summary['starts'], summary['completions']), (3, 3))
+        self.assertEqual(summary['score_histogram'][-1][:2], (2, 2))
+
+    def test_events_on_shard(self):
+        for user in self.users.values():
+            self.make_result(user, self.answer1)
+        for shard in self.users:
+            self.assertEqual(
+                list(AttemptEvent.objects.using(shard).order_by('id').values_list('kind', flat=True)),
+                [AttemptEvent.KIND_STARTED, AttemptEvent.KIND_ANSWERED, AttemptEvent.KIND_ANSWERED,
+                 AttemptEvent.KIND_FINISHED])
+        self.assertEqual(rollup(), 12)
+        stats = TopicDailyStats.objects.get(topic=self.topic)
+        self.assertEqual((stats.started, stats.answered, stats.finished), (3, 6, 3))
+        self.assertEqual(rollup(), 0)
+
+    def test_regrade_and_archive(self):
+        results = [self.make_result(user, self.answer1_1) for user in self.users.values()]
+        self.answer1.is_correct = False
+        self.answer1.save()
+        self.answer1_1.is_correct = True
+        self.answer1_1.save()
+        job = run_job(create_job(question_ids=[self.question1.id]))
+        self.assertEqual((job.processed, job.changed), (3, 3))
+        self.assertEqual(set(job.tasks.values_list('database', flat=True)), {'default', 'shard1', 'shard2'})
+        for result in results:
+            result.refresh_from_db()
+            self.assertEqual(result.result, 2)
+
+        self.assertEqual(archive(days=0), 3)
+        self.assertEqual(
+            set(ArchivedTopicResult.objects.values_list('result_id', 'correct_count')),
+            {(result.id, 2) for result in results})
+        for shard in self.users:
+            self.assertFalse(TopicResult.objects.using(shard).exists())
+
+    def test_regrade_retry(self):
+        result = self.make_result(self.users['shard1'], self.answer1_1)
+        self.answer1.is_correct = False
+        self.answer1.save()
+        self.answer1_1.is_correct = True
+        self.answer1_1.save()
+        job = create_job(result_ids=[result.id])
+        plan_job(job, workers=1)
+        task = job.tasks.get()
+        bulk_create = ScoreChange.objects.bulk_create
+
+        def fail(*args, **kwargs):
+            raise DatabaseError('Connection is lost')
+
+        ScoreChange.objects.bulk_create = fail
+        try:
+            with self.assertRaises(DatabaseError):
+                process_batch(task.id)
+        finally:
+            ScoreChange.objects.bulk_create = bulk_create
+        result.refresh_from_db()
+        self.assertEqual(result.result, 1)
+
+        self.assertEqual(process_batch(task.id), 1)
+        self.assertEqual(list(job.score_changes.values_list('old_result', 'new_result')), [(1, 2)])
+        result.refresh_from_db()
+        self.assertEqual(result.result, 2)
+
+    def test_rebalance(self):
+        with override_settings(ATTEMPT_SHARDS=['default']):
+            results = [self.make_result(user, self.answer1) for user in self.users.values()]
+        self.assertEqual(TopicResult.objects.using('default').count(), 3)
+        self.assertEqual(rebalance(dry_run=True), {('default', 'shard1'): 1, ('default', 'shard2'): 1})
+        self.assertEqual(TopicResult.objects.using('default').count(), 3)
+
+        out = StringIO()
+        call_command('rebalance_shards', stdout=out)
+        self.assertIn('2 results were moved', out.getvalue())
+        for result in results:
+            shard = get_user_shard(result.user_id)
+            moved = TopicResult.objects.using(shard).get(id=result.id)
+            self.assertEqual(moved.result, 2)
+            self.assertEqual(
+                set(UserAnswer.answers.through.objects.using(shard).filter(
+                    useranswer__topic_result=moved).values_list('answer_id', flat=True)),
+                {self.answer1.id, self.answer2.id})
+        self.assertEqual(rebalance(), {})
+
+    def test_delete_cascade(self):
+        results = [self.make_result(user, self.answer1) for user in self.users.values()]
+        through = UserAnswer.answers.through
+        self.answer1.delete()
+        for result in results:
+            self.assertEqual(set(through.objects.using(result._state.db).values_list('answer_id', flat=True)),
+                             {self.answer2.id})
+        self.question2.delete()
+        for result in results:
+            self.assertEqual(
+                list(UserAnswer.objects.using(result._state.db).values_list('question_id', flat=True)),
+                [self.question1.id])
+
+        self.client.force_login(mommy.make(User, username='admin', is_staff=True, is_superuser=True))
+        response = self.client.post(reverse('admin:users_user_changelist'), data={
+            'action': 'delete_selected',
+            'post': 'yes',
+            '_selected_action': [self.users['shard2'].id],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(TopicResult.objects.using('shard2').exists())
+        self.assertFalse(UserAnswer.objects.using('shard2').exists())
+        self.assertEqual(TopicResult.objects.using('shard1').count(), 1)
+
+        self.topic.delete()
+        for shard in self.users:
+            self.assertFalse(TopicResult.objects.using(shard).exists())
+            self.assertFalse(UserAnswer.objects.using(shard).exists())
+
+    def test_rebalance_conflict(self):
+        user1, user2 = self.users['shard1'], self.users['shard2']
+        other_topic = mommy.make(Topic)
+        with override_settings(ATTEMPT_SHARDS=['default']):
+            finished = self.make_result(user1, self.answer1)
+            started = mommy.make(TopicResult, topic=other_topic, user=user2)
+        # Users start the same topics on their new shards before rebalance
+        fresh = mommy.make(TopicResult, topic=self.topic, user=user1)
+        self.assertEqual(fresh._state.db, 'shard1')
+        completed = self.make_result(user2, self.answer1)
+        mommy.make(TopicResult, topic=other_topic, user=user2)
+        TopicResult.objects.using('shard2').filter(topic=other_topic).update(
+            date_finished=timezone.now())
+
+        self.assertEqual(rebalance(), {('default', 'shard1'): 1, ('default', 'shard2'): 0})
+        self.assertFalse(TopicResult.objects.using('default').exists())
+        self.assertFalse(UserAnswer.objects.using('default').exists())
+        # Finished attempt replaces empty one
+        self.assertEqual(list(TopicResult.objects.using('shard1').values_list('id', flat=True)), [finished.id])
+        self.assertEqual(UserAnswer.objects.using('shard1').filter(topic_result_id=finished.id).count(), 2)
+        # Finished attempt on target is kept
+        self.assertEqual(TopicResult.objects.using('shard2').count(), 2)
+        self.assertFalse(TopicResult.objects.using('shard2').filter(id=started.id).exists())
+        self.assertTrue(TopicResult.objects.using('shard2').filter(id=completed.id).exists())
+
+    def test_admin(self):
+        result = self.make_result(self.users['shard1'], self.answer1)
+        self.client.force_login(mommy.make(User, username='admin', is_staff=True, is_superuser=True))
+        url = reverse('admin:users_topicresult_changelist')
+        self.assertNotContains(self.client.get(url), self.topic.title)
+        response = self.client.get(url, {'shard': 'shard1'})
+        self.assertContains(response, self.topic.title)
+        self.assertContains(self.client.get(url, {'shard': 'shard1', 'q': self.topic.title}), self.topic.title)
+
+        response = self.client.get(reverse('admin:users_topicresult_change', args=(result.id,)))
+        self.assertContains(response, self.answer1.text)
+        response = self.client.get(reverse('admin:users_useranswer_changelist'), {'shard': 'shard1'})
+        self.assertContains(response, self.question1.text)
+
+
+class ImportUsersTestCase(TestCase):
+
+    CSV = (
+        'username,email,password,first_name,last_name,topics\n'
+        'alice,alice@example.com,secret123,Alice,Smith,{topic2}\n'
+        'bob,bob@example.com,,Bob,,\n'
+        'alice,alice2@example.com,secret123,,,\n'
+        'carol,not-an-email,secret123,,,\n'
+        'dave,EXISTING@example.com,secret123,,,\n'
+        'erin,erin@example.com,secret123,,,999\n'
+        'frank,frank@example.com,secret123,,,{topic2}; {topic1}\n'
+    )
+
+    def setUp(self):
+        super().setUp()
+        self.topic1 = mommy.make(Topic)
+        self.topic2 = mommy.make(Topic)
+        existing = mommy.make(User, username='existing', email='existing@example.com')
+        EmailAddress.objects.create(user=existing, email='existing@example.com', primary=True)
+        self.csv = self.CSV.format(topic1=self.topic1.id, topic2=self.topic2.id)
+
+    def assertImported(self):
+        alice = User.objects.get(username='alice')
+        self.assertTrue(alice.check_password('secret123'))
+        self.assertEqual((alice.email, alice.first_name, alice.last_name), ('alice@example.com', 'Alice', 'Smith'))
+        self.assertFalse(User.objects.get(username='bob').has_usable_password())
+        self.assertEqual(
+            set(EmailAddress.objects.filter(primary=True).values_list('user__username', 'email')),
+            {('existing', 'existing@example.com'), ('alice', 'alice@example.com'), ('bob', 'bob@example.com'),
+             ('frank', 'frank@example.com')})
+        self.assertFalse(User.objects.filter(username__in=['carol', 'dave', 'erin']).exists())
+        self.assertEqual(set(TopicResult.objects.values_list('user__username', 'topic_id')), {
+            ('alice', self.topic1.id), ('alice', self.topic2.id), ('bob', self.topic1.id),
+            ('frank', self.topic1.id), ('frank', self.topic2.id),
+        })
+
+    def test_command(self):
+        path = os.path.join(tempfile.mkdtemp(), 'users.csv')
+        with open(path, 'w') as csv_file:
+            csv_file.write(self.csv)
+        out = StringIO()
+        err = StringIO()
+        call_command(
+            'import_users', path, '--topic', str(self.topic1.id), '--batch-size', '3', '--workers', '2',
+            stdout=out, stderr=err)
+        self.assertIn('3 users and 5 results were created, 4 rows were skipped', out.getvalue())
+        errors = err.getvalue().splitlines()
+        self.assertEqual([error.split(':')[0] for error in errors], ['Line 4', 'Line 5', 'Line 6', 'Line 7'])
+        self.assertIn('Duplicate username in file', errors[0])
+        self.assertIn('already exists', errors[2])
+        self.assertIn('Topic 999 does not exist', errors[3])
+        self.assertImported()
+
+        with self.assertRaises(CommandError):
+            call_command('import_users', path, '--topic', '999', stdout=out, stderr=err)
+
+    def test_admin_upload(self):
+        self.client.force_login(mommy.make(User, username='admin', is_staff=True, is_superuser=True))
+        url = reverse('admin:users_user_import')
+        self.assertContains(self.client.get(reverse('admin:users_user_changelist')), url)
+        response = self.client.post(url, {
+            'file': SimpleUploadedFile('users.csv', self.csv.encode('utf-8')),
+            'topics': [self.topic1.id],
+        }, follow=True)
+        self.assertContains(response, '3 users and 5 results were created, 4 rows were skipped.')
+        self.assertContains(response, 'Duplicate username in file')
+        self.assertImported()
+
+    def test_concurrent_signup(self):
+        class ConcurrentImporter(UserImporter):
+            def save_batch(self, users, assigned):
+                if not User.objects.filter(username='bob').exists():
+                    mommy.make(User, username='bob', email='bob@example.com')
+                super().save_batch(users, assigned)
+
+        importer = ConcurrentImporter(topic_ids=[self.topic1.id])
+        importer.import_batch([
+            (2, {'username': 'alice', 'email': 'alice@example.com'}),
+            (3, {'username': 'bob', 'email': 'bob2@example.com'}),
+        ])
+        report = importer.get_report()
+        self.assertEqual((report.users, report.results), (1, 1))
+        self.assertEqual([(error.line, error.messages) for error in report.errors], [
+            (3, ['User with this username or email already exists.']),
+        ])
+        self.assertEqual(set(TopicResult.objects.values_list('user__username', flat=True)), {'alice'})
+
+        # Email of user created without email address
+        mommy.make(User, username='dave', email='Dave@example.com')
+        report = import_users([(2, {'username': 'dave2', 'email': 'dave@example.com'})])
+        self.assertEqual(report.users, 0)
+        self.assertEqual(report.errors, [(2, ['email: User with this email already exists.'])])
@@ -0,0 +1,20 @@
+"""
+ASGI config for testsapp project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Read only JSON API is served by event loop, other requests are handled by Django in thread pool.
+
+Run with any ASGI server, e.g.: uvicorn asgi:application --workers 4
+"""
+
+import os
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
+
+django.setup(set_prefix=False)
+
+from core.asgi import AsgiHandler  # noqa: E402 apps are importable after settings are loaded
+
+application = AsgiHandler()
@@ -0,0 +1,112 @@
+"""
+HTTP load generator for comparing WSGI and ASGI servers of the project
+
+Opens given number of concurrent keep-alive connections and sends GET requests through each of them
+for given duration, then prints throughput and latency percentiles.
+
+Example:
+    gunicorn wsgi:application --workers 4 --threads 8 --bind 127.0.0.1:8001
+    uvicorn asgi:application --workers 4 --port 8002
+    python benchmarks/http_load.py http://127.0.0.1:8001/topics/api/1/progress/ --cookie sessionid=... -c 1000
+    python benchmarks/http_load.py http://127.0.0.1:8002/topics/api/1/progress/ --cookie sessionid=... -c 1000
+"""
+import argparse
+import asyncio
+import resource
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+
+async def read_response(reader):
+    """Status code of response, response body is read and dropped"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed')
+    status = int(status_line.split()[1])
+    length = 0
+    chunked = False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value:
+            chunked = True
+    if chunked:
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    else:
+        await reader.readexactly(length)
+    return status
+
+
+async def connection(url, cookie, deadline, latencies, statuses):
+    parts = urlsplit(url)
+    path = parts.path + ('?' + parts.query if parts.query else '')
+    request = (
+        'GET {0} HTTP/1.1\r\nHost: {1}\r\nConnection: keep-alive\r\n{2}\r\n'.format(
+            path, parts.netloc, 'Cookie: {0}\r\n'.format(cookie) if cookie else '')
+    ).encode('latin-1')
+    writer = None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+            started = time.perf_counter()
+            writer.write(request)
+            status = await read_response(reader)
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += 1
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+            statuses['error'] += 1
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.1)
+    if writer is not None:
+        writer.close()
+
+
+def percentile(values, share):
+    return values[min(int(len(values) * share), len(values) - 1)] if values else float('nan')
+
+
+async def run(url, cookie, concurrency, duration):
+    latencies = []
+    statuses = Counter()
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*[
+        connection(url, cookie, deadline, latencies, statuses) for _ in range(concurrency)
+    ])
+    return sorted(latencies), statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('url')
+    parser.add_argument('--cookie', default='', help='Cookie header, e.g. sessionid=...')
+    parser.add_argument('-c', '--concurrency', type=int, default=1000)
+    parser.add_argument('-d', '--duration', type=float, default=30)
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < args.concurrency + 100:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(args.concurrency + 100, hard), hard))
+
+    latencies, statuses = asyncio.get_event_loop().run_until_complete(
+        run(args.url, args.cookie, args.concurrency, args.duration))
+    print('Requests: {0}, {1:.1f} per second'.format(len(latencies), len(latencies) / args.duration))
+    print('Statuses: {0}'.format(', '.join('{0}: {1}'.format(*item) for item in sorted(statuses.items(), key=str))))
+    for share in (0.5, 0.9, 0.99):
+        print('p{0:g}: {1:.1f} ms'.format(share * 100, percentile(latencies, share) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Render time of question page with large checkbox question under Django and Jinja2 template engines
+
+Topic, question with given number of answers and topic result are created in configured database
+inside transaction, which is rolled back at the end. Run from project root.
+
+Example:
+    python benchmarks/template_render.py --answers 200 --repeat 100
+"""
+import argparse
+import os
+import sys
+import timeit
+from uuid import uuid4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+import django  # noqa: E402
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.db import transaction  # noqa: E402
+from django.template import engines  # noqa: E402
+from django.template.backends.jinja2 import Jinja2  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+
+from questions.forms import AnswerQuestionForm  # noqa: E402
+from questions.mixins import get_form_renderer  # noqa: E402
+from questions.models import Answer, Question, Topic  # noqa: E402
+from users.models import TopicResult, User  # noqa: E402
+
+
+TEMPLATE_NAME = 'questions/question_detail.html'
+
+
+def get_engines():
+    jinja2 = Jinja2({
+        'NAME': 'jinja2',
+        'DIRS': [str(settings.APPS_DIR.path('jinja2'))],
+        'APP_DIRS': False,
+        'OPTIONS': {'environment': 'core.jinja.environment'},
+    })
+    return [('django', engines['django']), ('jinja2', jinja2)]
+
+
+def create_context(answers_count):
+    user = User.objects.create(username='benchmark-{0}'.format(uuid4().hex))
+    topic = Topic.objects.create(title='Benchmark')
+    question = Question.objects.create(text='Benchmark question', qtype=Question.QTYPE_CHECKBOX)
+    Answer.objects.bulk_create([
+        Answer(question=question, text='Answer {0}'.format(number), is_correct=not number % 3)
+        for number in range(answers_count)
+    ])
+    topic.add_questions([question.id])
+    topic_result = TopicResult.objects.create(topic=topic, user=user)
+    request = RequestFactory().get('/')
+    request.user = user
+    return request, {
+        'topic': topic,
+        'question': question,
+        'number': 1,
+        'topic_result': topic_result,
+        'idempotency_key': uuid4().hex,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--answers', type=int, default=200, help='answers count of checkbox question')
+    parser.add_argument('--repeat', type=int, default=100, help='renders count per engine')
+    args = parser.parse_args()
+    with transaction.atomic():
+        request, context = create_context(args.answers)
+        results = {}
+        for name, engine in get_engines():
+            template = engine.get_template(TEMPLATE_NAME)
+            # Widgets are rendered by the same engine like in questions views
+            form = AnswerQuestionForm(question=context['question'], topic_result=context['topic_result'])
+            form.renderer = get_form_renderer(name) or form.renderer
+            context['form'] = form
+            # Warm up: template compilation and answers query
+            size = len(template.render(context, request))
+            timings = timeit.repeat(lambda: template.render(context, request), number=1, repeat=args.repeat)
+            results[name] = min(timings)
+            print('{0:8} {1:8.2f} ms min {2:8.2f} ms median {3:8} bytes'.format(
+                name, min(timings) * 1000, sorted(timings)[len(timings) // 2] * 1000, size))
+        print('jinja2 speedup: {0:.2f}x'.format(results['django'] / results['jinja2']))
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
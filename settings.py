@@ -33,7 +33,10 @@ THIRD_PARTY_APPS = [
 ]
 LOCAL_APPS = [
     'users',
-    'questions'
+    'questions',
+    'stats',
+    'core',
+    'outbox',
 ]
 
 
@@ -41,10 +44,14 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.profiling.ProfilingMiddleware',
+    'core.slowqueries.SlowQueryMiddleware',
+    'core.throttling.ThrottleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -58,6 +65,14 @@ SECRET_KEY = '8v8vz_+agba$td9@+clo9!8kz((#gl0amlerq6cvfvp=6^w(!4'
 ALLOWED_HOSTS = env.list('DJANGO_ALLOWED_HOSTS', default=[])
 
 EMAIL_BACKEND = env('DJANGO_EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
+# With outbox.backends.OutboxEmailBackend messages are stored into outbox and delivered by send_outbox command
+# with this backend, failed deliveries are retried after OUTBOX_RETRY_DELAY seconds doubled on every attempt
+OUTBOX_EMAIL_BACKEND = env('DJANGO_OUTBOX_EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+OUTBOX_MAX_ATTEMPTS = env.int('DJANGO_OUTBOX_MAX_ATTEMPTS', default=8)
+OUTBOX_RETRY_DELAY = 60
+OUTBOX_MAX_RETRY_DELAY = 60 * 60
+# Messages are claimed by sender for this time, messages of crashed sender are sent again after it
+OUTBOX_LEASE = 10 * 60
 
 DEBUG = env.bool('DJANGO_DEBUG', False)
 
@@ -71,6 +86,17 @@ DATABASES = {
     'default': env.db("DJANGO_DATABASE_URL")
 }
 
+# Attempts data (topic results and answers) is placed on one of these databases by hash of user id,
+# URL of every shard except default is read from DJANGO_<ALIAS>_DATABASE_URL, new shards can only be appended.
+# Attempt ids of every shard start from its index multiplied by ATTEMPT_SHARD_ID_SPAN.
+ATTEMPT_SHARDS = env.list('DJANGO_ATTEMPT_SHARDS', default=['default'])
+for alias in ATTEMPT_SHARDS:
+    if alias not in DATABASES:
+        DATABASES[alias] = env.db('DJANGO_{0}_DATABASE_URL'.format(alias.upper()))
+ATTEMPT_SHARD_ID_SPAN = 10 ** 8
+
+DATABASE_ROUTERS = ['users.sharding.AttemptRouter']
+
 
 TEMPLATES = [
     {
@@ -89,6 +115,17 @@ TEMPLATES = [
     },
 ]
 
+# Engine of questions templates: 'django' or 'jinja2', Jinja2 templates are in apps/jinja2 and require Jinja2 package
+QUESTIONS_TEMPLATE_ENGINE = env('DJANGO_QUESTIONS_TEMPLATE_ENGINE', default='django')
+if QUESTIONS_TEMPLATE_ENGINE == 'jinja2':
+    TEMPLATES.append({
+        'BACKEND': 'django.template.backends.jinja2.Jinja2',
+        'DIRS': [str(APPS_DIR.path('jinja2'))],
+        'OPTIONS': {
+            'environment': 'core.jinja.environment',
+        },
+    })
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -149,6 +186,77 @@ STATICFILES_FINDERS = (
 MEDIA_ROOT = env('DJANGO_MEDIA_ROOT', default=str(APPS_DIR('media')))
 MEDIA_URL = '/media/'
 
+# Shared cache of all workers, e.g. memcache://127.0.0.1:11211 or filecache:///var/tmp/testsapp
+CACHES = {
+    'default': env.cache('DJANGO_CACHE_URL', default='locmemcache://'),
+}
+# Number of topics contents kept in in-process cache in front of shared cache
+CONTENT_CACHE_LOCAL_SIZE = env.int('DJANGO_CONTENT_CACHE_LOCAL_SIZE', default=256)
+
+# Number of the most active topics, which content is loaded into cache on worker warm up
+WARMUP_TOPICS_COUNT = env.int('DJANGO_WARMUP_TOPICS_COUNT', default=20)
+
+# Finished results older than this number of days are moved into archive by archive_results command
+ARCHIVE_RESULTS_AFTER_DAYS = env.int('DJANGO_ARCHIVE_RESULTS_AFTER_DAYS', default=365)
+
+# Regrade jobs started from admin are run at once if they have no more results than this limit
+REGRADE_INLINE_LIMIT = env.int('DJANGO_REGRADE_INLINE_LIMIT', default=1000)
+
+# Number of processes hashing passwords of users uploaded in admin, import_users command uses all CPUs by default
+USER_IMPORT_WORKERS = env.int('DJANGO_USER_IMPORT_WORKERS', default=1)
+
+# Share of requests profiled with cProfile, requests of staff users with X-Profile header are always profiled
+PROFILING_SAMPLE_RATE = env.float('DJANGO_PROFILING_SAMPLE_RATE', default=0.0)
+PROFILING_HEADER = 'HTTP_X_PROFILE'
+PROFILING_DIR = env('DJANGO_PROFILING_DIR', default=str(ROOT_DIR('profiles')))
+# Number of kept profiles, the oldest ones are removed
+PROFILING_MAX_FILES = env.int('DJANGO_PROFILING_MAX_FILES', default=200)
+PROFILING_TOP_FUNCTIONS = 15
+
+# Queries running longer than threshold in seconds are logged by core.slowqueries logger with EXPLAIN output,
+# EXPLAIN ANALYZE executes explained query once more
+SLOW_QUERY_THRESHOLD = env.float('DJANGO_SLOW_QUERY_THRESHOLD', default=0.5)
+SLOW_QUERY_EXPLAIN_ANALYZE = env.bool('DJANGO_SLOW_QUERY_EXPLAIN_ANALYZE', default=False)
+SLOW_QUERY_STACK_DEPTH = 8
+
+# Live activity stream of topic in admin: events are kept in shared cache for LIVE_EVENTS_TIMEOUT seconds,
+# stream polls cache every LIVE_POLL_INTERVAL seconds and is closed after LIVE_STREAM_DURATION seconds,
+# then browser reconnects from the last received event. Default cache must be shared (memcached or redis)
+# when several workers are run, locmem cache delivers events only to streams of the same process.
+# Every stream of WSGI worker holds a thread, process runs at most LIVE_MAX_STREAMS of them,
+# other clients reconnect later. Streams of ASGI application aren't limited, they don't hold threads.
+LIVE_EVENTS_TIMEOUT = env.int('DJANGO_LIVE_EVENTS_TIMEOUT', default=600)
+LIVE_POLL_INTERVAL = env.float('DJANGO_LIVE_POLL_INTERVAL', default=1.0)
+LIVE_STREAM_DURATION = env.int('DJANGO_LIVE_STREAM_DURATION', default=30)
+LIVE_MAX_STREAMS = env.int('DJANGO_LIVE_MAX_STREAMS', default=4)
+
+# HTML responses are minified, responses larger than COMPRESSION_MIN_SIZE bytes are compressed with brotli
+# (if Brotli package is installed) or gzip by Accept-Encoding. Every dynamic response is compressed, so levels
+# are below maximal ones, which take several times more CPU for a few percent of size.
+COMPRESSION_MINIFY_HTML = env.bool('DJANGO_COMPRESSION_MINIFY_HTML', default=True)
+COMPRESSION_MIN_SIZE = env.int('DJANGO_COMPRESSION_MIN_SIZE', default=1024)
+COMPRESSION_GZIP_LEVEL = env.int('DJANGO_COMPRESSION_GZIP_LEVEL', default=5)
+COMPRESSION_BROTLI_QUALITY = env.int('DJANGO_COMPRESSION_BROTLI_QUALITY', default=4)
+
+# Size of thread pool, which runs queries of ASGI application
+ASGI_THREADS = env.int('DJANGO_ASGI_THREADS', default=20)
+
+# POST requests and JSON API requests limits by url name: (requests count, period in seconds) per user
+# or IP address. Counters are reset at fixed windows, so up to twice the count can pass around the end of window.
+RATE_LIMITS = {
+    'topic-detail': (10, 60),
+    'question-detail': (60, 60),
+    'account_login': (10, 60),
+    'account_signup': (5, 60),
+    'api-topic-list': (120, 60),
+    'api-topic': (120, 60),
+    'api-question': (120, 60),
+    'api-progress': (300, 60),
+}
+# Number of trusted reverse proxies, which append client address to X-Forwarded-For,
+# anonymous clients are limited by address from this header instead of REMOTE_ADDR of the proxy
+THROTTLE_PROXY_HOPS = env.int('DJANGO_THROTTLE_PROXY_HOPS', default=0)
+
 
 LOGGING = {
     'version': 1,
@@ -162,6 +270,9 @@ LOGGING = {
         'verbose': {
             'format': '%(levelname)s %(asctime)s %(module)s '
                       '%(process)d %(thread)d %(message)s'
+        },
+        'json': {
+            '()': 'core.log.JsonFormatter',
         }
     },
     'handlers': {
@@ -174,6 +285,11 @@ LOGGING = {
             'level': 'DEBUG',
             'class': 'logging.StreamHandler',
             'formatter': 'verbose',
+        },
+        'json_console': {
+            'level': 'DEBUG',
+            'class': 'logging.StreamHandler',
+            'formatter': 'json',
         }
     },
     'loggers': {
@@ -186,6 +302,17 @@ LOGGING = {
             'level': 'ERROR',
             'handlers': ['console', ],
             'propagate': False
+        },
+        'core.slowqueries': {
+            'level': 'WARNING',
+            'handlers': ['json_console'],
+            'propagate': False
+        },
+        # Sizes and CPU time of every compressed response are logged with DEBUG level
+        'core.compression': {
+            'level': env('DJANGO_COMPRESSION_LOG_LEVEL', default='WARNING'),
+            'handlers': ['json_console'],
+            'propagate': False
         }
     }
 }
@@ -8,5 +8,12 @@ TEST_RUNNER = 'django_nose.NoseTestSuiteRunner'
 
 NOSE_ARGS = [
     '--with-coverage',
-    '--cover-package=users,questions'
+    '--cover-package=users,questions,stats,core,outbox'
 ]
+
+# Requests are throttled only by tests of throttling
+RATE_LIMITS = {}
+
+# Shard databases of sharding tests, attempts are placed only on default database by other tests
+DATABASES['shard1'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+DATABASES['shard2'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
@@ -9,6 +9,7 @@ from django.views.generic import TemplateView
 urlpatterns = [
     url(r'^$', TemplateView.as_view(template_name="index.html"), name='index'),
     url(r'^', include('allauth.urls')),
+    url(r'^admin/', include('core.urls')),
     url(r'^admin/', admin.site.urls),
     url(r'^', include('users.urls')),
     url(r'^topics/', include('questions.urls')),
@@ -14,3 +14,16 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
 
 application = get_wsgi_application()
+
+
+def post_fork(server, worker):
+    """
+    Gunicorn post-fork hook, warms up just forked worker.
+
+    Can be used as config module: gunicorn wsgi:application --config python:wsgi
+    """
+    from questions.warmup import warm_up
+
+    timings = warm_up()
+    server.log.info('Worker %s warmed up in %.3fs: %s', worker.pid, sum(t for _, t in timings.values()),
+                    ', '.join('{} {}'.format(count, name) for name, (count, _) in timings.items()))